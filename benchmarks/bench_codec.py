@@ -0,0 +1,63 @@
+"""
+Benchmark of the OpenMath payload encodings.
+
+Compares encoding and decoding times of the XML encoding (the
+``openmath`` package) and of ``scscp.binary``, on large integers,
+integer matrices and strings. Run as::
+
+    python -m benchmarks.bench_codec
+"""
+
+import sys
+import time
+
+from openmath import openmath as om, encoder, decoder
+from scscp import binary
+
+
+def _matrix(n):
+    row = lambda i: om.OMApplication(om.OMSymbol('matrixrow', 'linalg2'),
+                                     [om.OMInteger(i * n + j) for j in range(n)])
+    return om.OMApplication(om.OMSymbol('matrix', 'linalg2'), [row(i) for i in range(n)])
+
+
+CASES = [
+    ('integer 10^3 bits', om.OMInteger(3 ** 630)),
+    ('integer 10^5 bits', om.OMInteger(3 ** 63000)),
+    ('integer 10^6 bits', om.OMInteger(3 ** 630000)),
+    ('matrix 10x10', _matrix(10)),
+    ('matrix 100x100', _matrix(100)),
+    ('string 1 MB', om.OMString('x' * 10**6)),
+]
+
+CODECS = [
+    ('xml', encoder.encode_bytes, decoder.decode_bytes),
+    ('binary', binary.encode_bytes, binary.decode_bytes),
+]
+
+
+def best(fun, arg, repeat=3):
+    t = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fun(arg)
+        t = min(t, time.perf_counter() - start)
+    return t
+
+
+def main():
+    # The XML encoding of large integers goes through decimal strings
+    if hasattr(sys, 'set_int_max_str_digits'):
+        sys.set_int_max_str_digits(0)
+    print('%-20s %-8s %12s %12s %12s' % ('payload', 'codec', 'bytes', 'encode (s)', 'decode (s)'))
+    for name, obj in CASES:
+        obj = om.OMObject(obj)
+        for codec, enc, dec in CODECS:
+            data = enc(obj)
+            assert dec(data) == obj
+            print('%-20s %-8s %12d %12.6f %12.6f' % (name, codec, len(data),
+                                                    best(enc, obj), best(dec, data)))
+
+
+if __name__ == '__main__':
+    main()
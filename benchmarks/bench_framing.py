@@ -0,0 +1,110 @@
+"""
+Benchmark of the SCSCP receive path.
+
+Measures the time taken by ``SCSCPPeer.receive`` to read messages of
+growing size over a socket pair. The time per byte should stay
+roughly constant from 1 KB to 100 MB. Run as::
+
+    python -m benchmarks.bench_framing [--max-size BYTES] [--pexpect]
+
+With ``--pexpect``, the old pexpect-based receive loop is timed too,
+for comparison (pexpect must be installed).
+"""
+
+import argparse
+import socket
+import time
+from threading import Thread
+
+from scscp.client import SCSCPClientBase
+from scscp.server import SCSCPServerBase
+
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7, 10**8]
+
+
+def _pair():
+    a, b = socket.socketpair()
+    client = SCSCPClientBase(a, timeout=None)
+    server = SCSCPServerBase(b, name=b'Bench', version=b'none', timeout=None)
+    t = Thread(target=server.accept)
+    t.start()
+    client.connect()
+    t.join()
+    return client, server
+
+
+def _send_raw(sock, payload):
+    sock.sendall(b'<?scscp start ?>\n')
+    sock.sendall(payload)
+    sock.sendall(b'\n<?scscp end ?>\n')
+
+
+def _payload(size):
+    chunk = b'<OMI>1234567890</OMI>'
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+
+def bench_receive(size, repeat=3):
+    """ Best time of ``repeat`` receptions of a message of ``size`` bytes """
+    client, server = _pair()
+    payload = _payload(size)
+    best = float('inf')
+    for _ in range(repeat):
+        t = Thread(target=_send_raw, args=(server.socket, payload))
+        t.start()
+        start = time.perf_counter()
+        msg = client.receive()
+        best = min(best, time.perf_counter() - start)
+        t.join()
+        assert len(msg) == size + 2
+    client.quit()
+    server.socket.close()
+    return best
+
+
+def bench_pexpect(size, repeat=3):
+    """ Same as bench_receive, using the old pexpect-based loop """
+    from pexpect import fdpexpect
+    from scscp.processing_instruction import ProcessingInstruction as PI
+    a, b = socket.socketpair()
+    stream = fdpexpect.fdspawn(a, timeout=None)
+    payload = _payload(size)
+    best = float('inf')
+    for _ in range(repeat):
+        t = Thread(target=_send_raw, args=(b, payload))
+        t.start()
+        start = time.perf_counter()
+        stream.expect(PI.PI_regex)
+        stream.expect(PI.PI_regex)
+        best = min(best, time.perf_counter() - start)
+        t.join()
+        assert len(stream.before) == size + 2
+    a.close()
+    b.close()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--max-size', type=int, default=10**8)
+    parser.add_argument('--pexpect', action='store_true',
+                        help='also time the pexpect receive loop (sizes up to 10 MB)')
+    args = parser.parse_args()
+
+    print('%12s %12s %12s %10s' % ('size', 'seconds', 'ns/byte', 'MB/s'))
+    for size in SIZES:
+        if size > args.max_size:
+            break
+        t = bench_receive(size)
+        print('%12d %12.6f %12.3f %10.1f' % (size, t, t * 1e9 / size, size / t / 1e6))
+    if args.pexpect:
+        print('pexpect:')
+        for size in SIZES:
+            if size > min(args.max_size, 10**7):
+                break
+            t = bench_pexpect(size)
+            print('%12d %12.6f %12.3f %10.1f' % (size, t, t * 1e9 / size, size / t / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark of the per-message latency of the SCSCP send path.
+
+A client and an echo server exchange small messages over a socket
+pair, in lockstep. The round-trip time of the single-write framing of
+``SCSCPPeer.send`` is compared to the old one, which made one
+``socket.send`` per PI and for the payload. Run as::
+
+    python -m benchmarks.bench_latency [--count N] [--tcp]
+
+With ``--tcp``, a loopback TCP connection is used instead of a socket
+pair, with and without ``TCP_NODELAY``.
+"""
+
+import argparse
+import socket
+import time
+from threading import Thread
+
+from scscp.client import SCSCPClientBase
+from scscp.server import SCSCPServerBase
+
+MESSAGE = b'<OMOBJ><OMA><OMS cd="arith1" name="plus"/><OMI>1</OMI><OMI>2</OMI></OMA></OMOBJ>'
+
+
+class ThreeWritesClient(SCSCPClientBase):
+    """ The send path as it was, one send per part """
+
+    def send(self, msg):
+        self.socket.send(b'<?scscp start ?>\n')
+        self.socket.send(msg + b'\n')
+        self.socket.send(b'<?scscp end ?>\n')
+
+
+def _tcp_pair():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    a = socket.create_connection(listener.getsockname())
+    b, _ = listener.accept()
+    listener.close()
+    return a, b
+
+
+def _echo(server, count):
+    server.accept()
+    for _ in range(count):
+        server.send(server.receive())
+
+
+def bench(client_class, count, tcp=False, nodelay=True):
+    """ Mean round-trip time of ``count`` messages """
+    a, b = _tcp_pair() if tcp else socket.socketpair()
+    client = client_class(a, timeout=None, nodelay=nodelay)
+    server = SCSCPServerBase(b, name=b'Bench', version=b'none', timeout=None, nodelay=nodelay)
+    t = Thread(target=_echo, args=(server, count))
+    t.start()
+    client.connect()
+    start = time.perf_counter()
+    for _ in range(count):
+        client.send(MESSAGE)
+        client.receive()
+    elapsed = time.perf_counter() - start
+    t.join()
+    client.quit()
+    b.close()
+    return elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--tcp', action='store_true', help='use a loopback TCP connection')
+    args = parser.parse_args()
+
+    cases = [('single write', SCSCPClientBase, True),
+             ('three writes', ThreeWritesClient, True)]
+    if args.tcp:
+        cases += [('single write, Nagle', SCSCPClientBase, False),
+                  ('three writes, Nagle', ThreeWritesClient, False)]
+
+    print('%-24s %12s' % ('send path', 'us/call'))
+    for name, cls, nodelay in cases:
+        t = bench(cls, args.count, args.tcp, nodelay)
+        print('%-24s %12.1f' % (name, t * 1e6))
+
+
+if __name__ == '__main__':
+    main()
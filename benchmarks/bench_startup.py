@@ -0,0 +1,92 @@
+"""
+Benchmark of the startup time of short-lived SCSCP clients.
+
+Measures the time to import ``scscp`` in a fresh interpreter, and the
+time for ``SCSCPCLI`` to connect to the demo server and make one call,
+with and without the on-disk cache of the allowed heads
+(``scscp.cache.HeadsCache``). Run as::
+
+    python -m benchmarks.bench_startup [--count N]
+"""
+
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from threading import Thread
+
+from scscp.cache import HeadsCache
+from scscp.cli import SCSCPCLI
+from examples.demo_server import Server
+
+IMPORT = 'import time; t = time.perf_counter(); import %s; print(time.perf_counter() - t)'
+
+
+def import_time(module='scscp', count=5):
+    """ The best time to import ``module`` in a new interpreter """
+    return min(float(subprocess.check_output([sys.executable, '-c', IMPORT % module]))
+               for _ in range(count))
+
+
+def loaded_modules(module='scscp'):
+    """ The modules loaded by importing ``module`` in a new interpreter """
+    out = subprocess.check_output([sys.executable, '-c',
+                                   'import sys, %s; print("\\n".join(sys.modules))' % module])
+    return set(out.decode().split())
+
+
+def startup_time(port, heads_cache=None, count=20):
+    """ The best time to connect with ``SCSCPCLI``, make a call and quit """
+    best = float('inf')
+    for _ in range(count):
+        start = time.perf_counter()
+        client = SCSCPCLI('localhost', port, heads_cache=heads_cache)
+        client.heads.arith1.plus([1, 2])
+        client.quit()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class DemoServer(object):
+    """ A threaded demo server on a free port """
+
+    def __enter__(self):
+        self.server = Server(port=0)
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.server.server_address[1]
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def bench(count):
+    """ A list of ``(name, seconds)`` """
+    directory = tempfile.mkdtemp()
+    try:
+        res = [('import', import_time(count=max(count // 4, 1)))]
+        with DemoServer() as port:
+            res.append(('cli', startup_time(port, None, count)))
+            res.append(('cli_cached_heads', startup_time(port, HeadsCache(directory), count)))
+        return res
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--count', type=int, default=20)
+    args = parser.parse_args()
+
+    print('%-24s %12s' % ('startup', 'ms'))
+    for name, t in bench(args.count):
+        print('%-24s %12.2f' % (name, t * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+Benchmark suite of the SCSCP protocol, with machine-readable results.
+
+Measures, over socket pairs and against local servers:
+
+- the cost of the handshake (``connect``/``accept``);
+- the round-trip latency of small calls;
+- the throughput of pipelined calls;
+- the receive and decode times of messages from 1 KB to 100 MB;
+- the throughput of 1 to 1000 concurrent clients;
+- the startup time of short-lived clients (import, connection and
+  discovery of the heads).
+
+Run as::
+
+    python -m benchmarks.bench_suite [--quick] [--output results.json] [--compare baseline.json]
+
+Results are printed, and written as JSON to ``--output``. With
+``--compare``, results are checked against a previous run, and the
+exit status is 1 if any of them regressed by more than
+``--threshold``.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import socket
+import sys
+import time
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.aio import AsyncSCSCPClient, AsyncSCSCPSocketServer
+from scscp.client import SCSCPClient, SCSCPClientBase
+from scscp.server import SCSCPServer
+from scscp.scscp import SCSCPProcedureMessage
+from examples.demo_server import Server, DemoServerRequestHandler
+
+from .bench_framing import bench_receive
+from . import bench_latency, bench_startup
+
+# Whether a smaller or a larger value is better
+LOWER = 'lower'
+HIGHER = 'higher'
+
+
+def _plus(a, b):
+    return om.OMApplication(om.OMSymbol('plus', 'arith1'), [om.OMInteger(a), om.OMInteger(b)])
+
+
+class Results(object):
+    """ A list of named measurements """
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, name, value, unit, better=LOWER):
+        self.records.append({'name': name, 'value': value, 'unit': unit, 'better': better})
+        print('%-45s %14.6g %s' % (name, value, unit))
+        sys.stdout.flush()
+
+
+class DemoServer(object):
+    """ A threaded demo server on a free port """
+
+    def __enter__(self):
+        self.server = Server(port=0)
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.server.server_address[1]
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+### Handshake
+
+def _socketpair_handshake():
+    a, b = socket.socketpair()
+    client = SCSCPClientBase(a, timeout=None)
+    server = SCSCPServer(b, name=b'Bench', version=b'none', timeout=None)
+    start = time.perf_counter()
+    t = Thread(target=server.accept)
+    t.start()
+    client.connect()
+    t.join()
+    elapsed = time.perf_counter() - start
+    client.quit()
+    b.close()
+    return elapsed
+
+
+def bench_handshake(results, count):
+    results.add('handshake.socketpair', min(_socketpair_handshake() for _ in range(count)), 's')
+    with DemoServer() as port:
+        best = float('inf')
+        for _ in range(count):
+            start = time.perf_counter()
+            s = socket.create_connection(('localhost', port))
+            client = SCSCPClient(s)
+            client.connect()
+            best = min(best, time.perf_counter() - start)
+            client.quit()
+        results.add('handshake.tcp', best, 's')
+
+
+### Latency
+
+def bench_call_latency(results, count):
+    results.add('latency.socketpair', bench_latency.bench(SCSCPClientBase, count), 's')
+    with DemoServer() as port:
+        client = SCSCPClient(socket.create_connection(('localhost', port)))
+        client.connect()
+        call = _plus(1, 2)
+        start = time.perf_counter()
+        for _ in range(count):
+            client.call(call)
+            client.wait()
+        results.add('latency.demo_server', (time.perf_counter() - start) / count, 's')
+        client.quit()
+
+
+### Throughput
+
+def bench_pipelined(results, count):
+    async def go(port):
+        client = await AsyncSCSCPClient.open('localhost', port)
+        start = time.perf_counter()
+        futs = [client.submit(_plus(i, 1)) for i in range(count)]
+        await client.drain()
+        await asyncio.gather(*futs)
+        elapsed = time.perf_counter() - start
+        await client.close()
+        return elapsed
+
+    with DemoServer() as port:
+        elapsed = asyncio.run(go(port))
+    results.add('throughput.pipelined', count / elapsed, 'calls/s', HIGHER)
+
+
+### Message size
+
+def _decode_time(size, repeat=3):
+    """ Best time of ``repeat`` receptions and decodings of a string of ``size`` bytes """
+    a, b = socket.socketpair()
+    client = SCSCPClient(a, timeout=None)
+    server = SCSCPServer(b, name=b'Bench', version=b'none', timeout=None)
+    t = Thread(target=server.accept)
+    t.start()
+    client.connect()
+    t.join()
+    msg = SCSCPProcedureMessage.completed('id', om.OMString('x' * size)).om()
+    best = float('inf')
+    for _ in range(repeat):
+        t = Thread(target=server.send, args=(msg,))
+        t.start()
+        start = time.perf_counter()
+        client.wait()
+        best = min(best, time.perf_counter() - start)
+        t.join()
+    client.quit()
+    b.close()
+    return best
+
+
+def bench_sizes(results, max_size):
+    size = 1000
+    while size <= max_size:
+        results.add('receive.%d' % size, bench_receive(size), 's')
+        results.add('decode.%d' % size, _decode_time(size), 's')
+        size *= 10
+
+
+### Concurrency
+
+def bench_concurrency(results, max_clients, calls):
+    async def session(port, n):
+        client = await AsyncSCSCPClient.open('localhost', port)
+        for i in range(n):
+            await client.call(_plus(i, 1))
+        await client.close()
+
+    async def go(clients):
+        server = AsyncSCSCPSocketServer(port=0, RequestHandlerClass=DemoServerRequestHandler)
+        await server.start()
+        port = server.server_address[1]
+        start = time.perf_counter()
+        await asyncio.gather(*(session(port, calls) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        # let the server end the sessions before closing it
+        await asyncio.sleep(0.1)
+        await server.close()
+        return elapsed
+
+    clients = 1
+    while clients <= max_clients:
+        elapsed = asyncio.run(go(clients))
+        results.add('concurrency.%d' % clients, clients * calls / elapsed, 'calls/s', HIGHER)
+        clients *= 10
+
+
+### Startup
+
+def bench_startup_time(results, count):
+    for name, t in bench_startup.bench(count):
+        results.add('startup.' + name, t, 's')
+
+
+### Main
+
+def _raise_fd_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY
+                                                    else max(soft, 1 << 16), hard))
+
+
+def compare(records, baseline, threshold):
+    """ The measurements that regressed by more than ``threshold`` """
+    old = dict((r['name'], r) for r in baseline['results'])
+    regressions = []
+    for r in records:
+        b = old.get(r['name'])
+        if b is None or not b['value']:
+            continue
+        ratio = r['value'] / b['value']
+        if r['better'] == HIGHER:
+            ratio = 1 / ratio if ratio else float('inf')
+        if ratio > 1 + threshold:
+            regressions.append((r['name'], b['value'], r['value'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer repetitions, messages up to 1 MB, up to 100 clients')
+    parser.add_argument('--max-size', type=int, default=None)
+    parser.add_argument('--max-clients', type=int, default=None)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression (default 0.2)')
+    args = parser.parse_args()
+
+    count = 200 if args.quick else 2000
+    max_size = args.max_size or (10**6 if args.quick else 10**8)
+    max_clients = args.max_clients or (100 if args.quick else 1000)
+    _raise_fd_limit()
+
+    results = Results()
+    bench_handshake(results, count // 10)
+    bench_call_latency(results, count)
+    bench_pipelined(results, count * 5)
+    bench_sizes(results, max_size)
+    bench_concurrency(results, max_clients, 10)
+    bench_startup_time(results, count // 10)
+
+    output = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+        },
+        'results': results.records,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results.records, json.load(f), args.threshold)
+        for name, old, new, ratio in regressions:
+            print('REGRESSION %-34s %12.6g -> %12.6g (x%.2f)' % (name, old, new, ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,6 @@
 import logging
 
-from six.moves import socketserver
-
-from openmath import openmath as om, convert as conv
-
-from scscp import scscp
-from scscp.socketserver import SCSCPServerRequestHandler, SCSCPSocketServer, CD_SCSCP2
+from scscp.socketserver import SCSCPServerRequestHandler, SCSCPSocketServer
 
 # Supported functions
 CD_ARITH1 = {
@@ -19,37 +14,21 @@ CD_ARITH1 = {
 }
 
 class DemoServerRequestHandler(SCSCPServerRequestHandler):
-    def handle_call(self, call, head):
-        if call.data.elem.cd == 'arith1' and head in CD_ARITH1:
-            args = [conv.to_python(a) for a in call.data.arguments]
-            return conv.to_openmath(CD_ARITH1[head](*args))
-        
-        return super(SCSCPRequestHandler, self).handle_call(call, head)
-
-    def get_allowed_heads(self, data):
-        return scscp.symbol_set([om.OMSymbol(head, cd='scscp2') for head in CD_SCSCP2]
-                                    + [om.OMSymbol(head, cd='arith1') for head in CD_ARITH1],
-                                    cdnames=['scscp1'])
-    
-    def is_allowed_head(self, data):
-        head = data.arguments[0]
-        return conv.to_openmath((head.cd == 'arith1' and head.name in CD_ARITH1)
-                                    or (head.cd == 'scscp2' and head.name in CD_SCSCP2)
-                                    or head.cd == 'scscp1')
+    pass
 
-    def get_service_description(self, data):
-        return scscp.service_description(self.server.name.decode(),
-                                             self.server.version.decode(),
-                                             self.server.description)
+for head, fun in CD_ARITH1.items():
+    DemoServerRequestHandler.register('arith1', head, fun, convert=True, pure=True)
 
 class Server(SCSCPSocketServer):
     def __init__(self, host='localhost', port=26133,
                      logger=None, name=b'DemoServer', version=b'none',
-                     description='Demo SCSCP server'):
+                     description='Demo SCSCP server', workers=None, result_cache=None,
+                     metrics=None, **kwds):
 
         super(Server, self).__init__(host=host, port=port, logger=logger or logging.getLogger(__name__), 
             name=name, version=version, description=description, 
-            RequestHandlerClass=DemoServerRequestHandler)
+            RequestHandlerClass=DemoServerRequestHandler, workers=workers,
+            result_cache=result_cache, metrics=metrics, **kwds)
         
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,105 @@
+"""
+Admission control of SCSCP servers.
+
+``Admission`` bounds the number of connections of a server, the number
+of calls computed at once, and the number of calls waiting to be
+computed. Servers reject what exceeds these bounds at once, instead of
+letting clients wait: connections are closed with a ``quit`` message,
+and calls answered with ``procedure_terminated``.
+"""
+
+import threading
+
+
+class Admission(object):
+    """
+    Thread-safe counters of connections and calls, with their bounds.
+
+    ``max_connections`` bounds the open connections, ``max_calls`` the
+    calls being computed, and ``max_pending`` the calls received and
+    waiting for one of the ``max_calls`` slots, from all connections.
+    None means no bound.
+    """
+
+    def __init__(self, max_connections=None, max_calls=None, max_pending=None):
+        self.max_connections = max_connections
+        self.max_calls = max_calls
+        self.max_pending = max_pending
+        self.connections = 0
+        self.calls = 0
+        self.running = 0
+        self.rejected_connections = 0
+        self.rejected_calls = 0
+        # calls answered since the start
+        self.served = 0
+        self._cond = threading.Condition()
+
+    @property
+    def pending(self):
+        """ The calls received, and not being computed """
+        # calls may be computed without being received from a client
+        return max(self.calls - self.running, 0)
+
+    def open_connection(self):
+        """ Admit a new connection, return False if there are too many """
+        with self._cond:
+            if self.max_connections is not None and self.connections >= self.max_connections:
+                self.rejected_connections += 1
+                return False
+            self.connections += 1
+            return True
+
+    def close_connection(self):
+        with self._cond:
+            self.connections -= 1
+
+    def enter(self):
+        """ Admit a received call, return False if too many are pending """
+        with self._cond:
+            if self.max_pending is not None:
+                slots = self.max_calls if self.max_calls is not None else self.running
+                if self.calls >= slots + self.max_pending:
+                    self.rejected_calls += 1
+                    return False
+            self.calls += 1
+            return True
+
+    def leave(self):
+        """ A call admitted by ``enter`` was answered """
+        with self._cond:
+            self.calls -= 1
+            self.served += 1
+
+    def start(self, cancelled=None):
+        """
+        Wait until a call may be computed. Returns False, without
+        starting the call, if ``cancelled()`` becomes true meanwhile
+        (it is checked when the waiting calls are woken, see ``wake``).
+        """
+        with self._cond:
+            while self.max_calls is not None and self.running >= self.max_calls:
+                if cancelled is not None and cancelled():
+                    # pass on the slot this call may have been woken for
+                    self._cond.notify()
+                    return False
+                self._cond.wait()
+            self.running += 1
+            return True
+
+    def wake(self):
+        """ Wake the calls waiting in ``start``, e.g. after they were cancelled """
+        with self._cond:
+            self._cond.notify_all()
+
+    def stop(self):
+        """ A call started by ``start`` was computed """
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
+
+    def stats(self):
+        """ The current counters, as a dictionary """
+        with self._cond:
+            return {'connections': self.connections, 'running': self.running,
+                    'pending': self.pending, 'rejected_connections': self.rejected_connections,
+                    'rejected_calls': self.rejected_calls}
@@ -0,0 +1,593 @@
+"""
+Asyncio SCSCP peers.
+
+These classes mirror ``scscp.client``, but run on an asyncio event
+loop. Their main advantage is that many procedure calls may be in
+flight at the same time on a single connection.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from .scscp import SCSCPConnectionError, SCSCPQuit, SCSCPCancel, SCSCPTerminate, SCSCPProtocolError, SCSCPProcedureMessage
+from .processing_instruction import ProcessingInstruction as PI, OrderedProcessingInstruction as OPI
+from .framing import PIFramer, START, END, set_keepalive
+from .streaming import StreamingDecoder
+from .lazy import LazyProcedureMessage
+from .client import (TimeoutError, INITIALIZED, CONNECTED, CLOSED, CODECS,
+                     _CountingSink, _TimedSink, _timed)
+from .socketserver import SCSCPServerRequestHandler, SCSCPServerMixin, address_name, _remove_stale_socket
+from .admission import Admission
+
+
+class AsyncSCSCPPeer(object):
+    """
+    Base class for asyncio SCSCP client and server
+
+    As for ``scscp.client.SCSCPPeer``, messages are recorded if
+    ``metrics`` is set.
+    """
+
+    # Payload encodings, besides XML, that can be negotiated
+    encodings = ('binary',)
+
+    # Decode XML messages while they arrive
+    streaming = True
+
+    # Instrumentation, see scscp.metrics
+    metrics = None
+
+    def __init__(self, reader, writer, timeout=30, logger=None, me='Client', you='Server'):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.stream = PIFramer()
+        self.status = INITIALIZED
+        self.encoding = 'xml'
+        self.log = logger or logging.getLogger(__name__)
+        self.me, self.you = me, you
+        self.chunk_size = 1 << 18
+
+    def _encode(self, obj):
+        if self.metrics is None:
+            return CODECS[self.encoding][0](obj)
+        return _timed(self.metrics, 'encode', self.encoding, CODECS[self.encoding][0], obj)
+
+    def _decode(self, msg):
+        if self.metrics is None:
+            return CODECS[self.encoding][1](msg)
+        return _timed(self.metrics, 'decode', self.encoding, CODECS[self.encoding][1], msg, len(msg))
+
+    def _assert_connected(self):
+        if self.status != CONNECTED:
+            raise RuntimeError("Not connected.")
+
+    async def _read(self, timeout):
+        if timeout is None:
+            data = await self.reader.read(self.chunk_size)
+        else:
+            try:
+                data = await asyncio.wait_for(self.reader.read(self.chunk_size), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("%s took too long to respond." % self.you)
+        if not data:
+            raise ConnectionResetError("%s closed unexpectedly." % self.you)
+        self.stream.feed(data)
+
+    async def wait_data(self, timeout=None):
+        """
+        Wait at most ``timeout`` seconds (forever if None) for data.
+
+        Returns False if none was buffered or received in time.
+        """
+        if self.stream.has_data():
+            return True
+        try:
+            await self._read(timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    async def _get_next_PI(self, expect=None, timeout=-1, sink=None):
+        if timeout == -1:
+            timeout = self.timeout
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            frame = self.stream.next_PI()
+            if frame is None:
+                if sink is not None:
+                    data = self.stream.take_payload()
+                    if data:
+                        sink(data)
+                await self._read(None if deadline is None else max(deadline - loop.time(), 0))
+                continue
+            self.before, pi = frame
+            if sink is not None and self.before:
+                sink(self.before)
+
+            try:
+                pi = PI.parse(pi)
+            except SCSCPConnectionError:
+                self.quit()
+                raise
+            self.log.debug("Received PI: %s" % pi)
+
+            if expect is not None and pi.key not in expect:
+                if pi.key == 'quit':
+                    self.quit()
+                    reason = pi.attrs.get('reason')
+                    raise SCSCPQuit("%s closed session (reason: %s)." % (self.you, reason), reason)
+                if pi.key == 'terminate':
+                    call_id = pi.attrs.get('call_id', b'').decode('utf-8', 'replace')
+                    raise SCSCPTerminate("%s requested termination of call %s." % (self.you, call_id),
+                                         call_id)
+                if pi.key == '' and 'info' in pi.attrs:
+                    self.log.info("SCSCP info: %s" % pi.attrs.get('info').decode())
+                    continue
+                else:
+                    raise SCSCPConnectionError("%s sent unexpected message: %s" % (self.you, pi.key), pi)
+            else:
+                return pi
+
+    def _send_PI(self, key='', **kwds):
+        pi = PI(key, **kwds)
+        self.log.debug("Sending PI: %s" % pi)
+        self.writer.write(bytes(pi) + b'\n')
+
+    def _send_ordered_PI(self, key, attrs):
+        pi = OPI(key, attrs)
+        self.log.debug("Sending PI: %s" % pi)
+        self.writer.write(bytes(pi) + b'\n')
+
+    def send(self, msg):
+        """ Send SCSCP message (buffered, see ``drain``) """
+        self._assert_connected()
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(b'Sending message: %s' % msg)
+        self.writer.writelines([START, msg, END])
+        if self.metrics is not None:
+            self.metrics.record_sent(len(msg))
+
+    async def drain(self):
+        """ Wait until the write buffer is flushed """
+        await self.writer.drain()
+
+    async def receive(self, timeout=-1, sink=None):
+        """
+        Receive SCSCP message, returned as a bytearray
+
+        If ``sink`` is given, the message is instead passed to it
+        piecewise, as it arrives, and None is returned.
+        """
+        self._assert_connected()
+        if (self.metrics is not None and sink is not None
+                and not isinstance(sink, _CountingSink)):
+            sink = _CountingSink(sink)
+        pi = await self._get_next_PI(['start'], timeout=timeout)
+        pi = await self._get_next_PI(['end', 'cancel'], timeout=timeout, sink=sink)
+        if pi.key == 'cancel':
+            raise SCSCPCancel('%s canceled transmission' % self.you)
+
+        msg = self.before
+        if self.metrics is not None:
+            self.metrics.record_received(len(msg) if sink is None else sink.count)
+        if sink is not None:
+            return None
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(b'Received message: %s' % msg)
+        return msg
+
+    async def receive_om(self, timeout=-1):
+        """ Receive SCSCP message, and decode it """
+        if self.streaming and self.encoding == 'xml':
+            decoder = StreamingDecoder()
+            if self.metrics is None:
+                await self.receive(timeout, sink=decoder.feed)
+                return decoder.close()
+            sink = _TimedSink(decoder.feed)
+            await self.receive(timeout, sink=sink)
+            return sink.finish(self.metrics, 'xml', decoder.close)
+        return self._decode(await self.receive(timeout))
+
+    def quit(self, reason=None):
+        """ Send SCSCP quit message """
+        if self.status == CLOSED:
+            return
+        kwds = {} if reason is None else { 'reason': reason if isinstance(reason, bytes) else reason.encode() }
+        try:
+            self._send_PI('quit', **kwds)
+            self.writer.close()
+        except ConnectionError:
+            pass
+        finally:
+            self.status = CLOSED
+
+    def info(self, info):
+        """ Send SCSCP info message """
+        self._assert_connected()
+        self._send_PI(info=info)
+
+
+class AsyncSCSCPClient(AsyncSCSCPPeer):
+    """
+    An asyncio SCSCP client.
+
+    After ``connect()``, a single reader task receives all the
+    messages from the server, and dispatches them to the pending calls
+    by call id. Any number of calls may be outstanding at once::
+
+        client = await AsyncSCSCPClient.open('localhost')
+        results = await asyncio.gather(*(client.call(x) for x in data))
+    """
+
+    def __init__(self, reader, writer, timeout=30, logger=None, encoding=None):
+        super(AsyncSCSCPClient, self).__init__(reader, writer, timeout, logger, me="Client", you="Server")
+        self._requested_encoding = encoding
+        self._pending = {}
+        self._reader_task = None
+
+    @classmethod
+    async def open(cls, host=None, port=26133, timeout=30, logger=None, encoding=None, path=None):
+        """
+        Open a connection to a server, on ``host:port`` or on the Unix
+        domain socket ``path``, and do the handshake
+        """
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        client = cls(reader, writer, timeout, logger, encoding)
+        await client.connect(timeout)
+        return client
+
+    async def connect(self, timeout=None):
+        """ SCSCP handshake """
+        if self.status != INITIALIZED:
+            raise RuntimeError("Session already opened.")
+
+        pi = await self._get_next_PI([''], timeout=timeout)
+        if ('scscp_versions' not in pi.attrs
+                or b'1.3' not in pi.attrs['scscp_versions'].split()):
+            self.quit()
+            raise SCSCPConnectionError("Unsupported SCSCP versions %s." % pi.attrs.get('scscp_versions'), pi)
+
+        self.service_info = pi.attrs
+
+        encoding = self._requested_encoding
+        if (encoding in self.encodings
+                and encoding.encode() in pi.attrs.get('encodings', b'').split()):
+            self._send_PI(version=b'1.3', encoding=encoding.encode())
+        else:
+            encoding = None
+            self._send_PI(version=b'1.3')
+
+        pi = await self._get_next_PI([''], timeout=timeout)
+        if pi.attrs.get('version') != b'1.3':
+            self.quit()
+            raise SCSCPConnectionError("Server sent unexpected response.", pi)
+        if encoding is not None and pi.attrs.get('encoding') == encoding.encode():
+            self.encoding = encoding
+
+        self.status = CONNECTED
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def _next_response(self):
+        """ Receive the next procedure message """
+        return SCSCPProcedureMessage.from_om(await self.receive_om(timeout=None))
+
+    async def _read_loop(self):
+        """ Receive all messages, and resolve the matching futures """
+        try:
+            while True:
+                try:
+                    resp = await self._next_response()
+                except SCSCPCancel as e:
+                    self.log.info(e)
+                    continue
+                fut = self._pending.pop(resp.id, None)
+                if fut is None:
+                    self.log.warning("Discarding response to unknown call %s." % resp.id)
+                elif not fut.done():
+                    fut.set_result(resp)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self.status != CLOSED:
+                self.log.info(e)
+            self.status = CLOSED
+            pending, self._pending = self._pending, {}
+            for fut in pending.values():
+                if not fut.done():
+                    fut.set_exception(e)
+
+    def _submit(self, data, cookie, id, opts):
+        self._assert_connected()
+        if cookie:
+            opts['return_cookie'] = True
+        elif cookie is None:
+            opts['return_nothing'] = True
+        else:
+            opts['return_object'] = True
+        call = SCSCPProcedureMessage.call(data, id=id, **opts)
+        fut = asyncio.get_event_loop().create_future()
+        self._pending[call.id] = fut
+        self.send(self._encode(call.om()))
+        return call, fut
+
+    def submit(self, data, cookie=False, id=None, **opts):
+        """
+        Send a procedure call, return a future for the response.
+
+        The future resolves to the ``SCSCPProcedureMessage`` sent back
+        by the server.
+        """
+        return self._submit(data, cookie, id, opts)[1]
+
+    async def call(self, data, cookie=False, timeout=-1, **opts):
+        """ Send a procedure call and wait for the response """
+        call, fut = self._submit(data, cookie, None, opts)
+        await self.drain()
+        if timeout == -1:
+            timeout = self.timeout
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(call.id, None)
+            raise TimeoutError("%s took too long to respond." % self.you)
+
+    def terminate(self, id):
+        """ Send SCSCP terminate message """
+        self._assert_connected()
+        self._send_PI('terminate', call_id=id if isinstance(id, bytes) else id.encode())
+
+    async def close(self, reason=None):
+        """ Quit the session and stop the reader task """
+        self.quit(reason)
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+        pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(SCSCPQuit("Session closed.", reason))
+        try:
+            await self.writer.wait_closed()
+        except (AttributeError, ConnectionError):
+            pass
+
+
+class AsyncSCSCPServer(AsyncSCSCPPeer):
+    """
+    The server side of an asyncio SCSCP session.
+
+    ``completed`` and ``terminated`` may be called from any thread, so
+    that request handlers can run in an executor.
+    """
+
+    def __init__(self, reader, writer, name, version, id=None, timeout=30, logger=None):
+        super(AsyncSCSCPServer, self).__init__(reader, writer, timeout, logger, me="Server", you="Client")
+        self._name = name
+        self._version = version
+        self._id = id or str(uuid.uuid1()).encode()
+        self._loop = asyncio.get_event_loop()
+
+    async def accept(self, timeout=None):
+        """ SCSCP handshake """
+        if self.status != INITIALIZED:
+            raise RuntimeError("Session already opened.")
+        attrs = [('service_name', self._name), ('service_version', self._version),
+                 ('service_id', self._id), ('scscp_versions', b'1.3')]
+        if self.encodings:
+            attrs.append(('encodings', b' '.join(e.encode() for e in self.encodings)))
+        self._send_ordered_PI('', attrs)
+
+        pi = await self._get_next_PI([''], timeout=timeout)
+        if pi.attrs.get('version') != b'1.3':
+            self.quit()
+            raise SCSCPConnectionError("Client sent unexpected response.", pi)
+
+        encoding = pi.attrs.get('encoding', b'').decode()
+        if encoding in self.encodings:
+            self.encoding = encoding
+            self._send_PI(version=b'1.3', encoding=encoding.encode())
+        else:
+            self._send_PI(version=b'1.3')
+
+        self.status = CONNECTED
+
+    async def wait(self, timeout=-1, lazy=False):
+        """ Receive a procedure message, lazily decoded if ``lazy`` """
+        if lazy:
+            return LazyProcedureMessage.from_bytes(await self.receive(timeout), self.encoding)
+        return SCSCPProcedureMessage.from_om(await self.receive_om(timeout))
+
+    def _send_if_connected(self, msg):
+        # the session may have ended while the response was computed
+        if self.status == CONNECTED:
+            self.send(msg)
+
+    def _send_threadsafe(self, msg):
+        self._loop.call_soon_threadsafe(self._send_if_connected, self._encode(msg.om()))
+
+    def completed(self, id, data, **info):
+        comp = SCSCPProcedureMessage.completed(id, data, **info)
+        self._send_threadsafe(comp)
+        return comp
+
+    def terminated(self, id, error, msg=None, **info):
+        term = SCSCPProcedureMessage.terminated(id, error, msg, **info)
+        self._send_threadsafe(term)
+        return term
+
+    def respond(self, msg):
+        """ Send an already constructed procedure message """
+        self._send_threadsafe(msg)
+        return msg
+
+    def respond_prepared(self, prepared, id):
+        """ Send a ``scscp.server.PreparedResponse`` with the given id """
+        self._loop.call_soon_threadsafe(self._send_if_connected, prepared.encode(self.encoding, id))
+        return prepared.message(id)
+
+
+class AsyncSCSCPSocketServer(SCSCPServerMixin):
+    """
+    An SCSCP Server based on asyncio.
+
+    It accepts the same request handler classes as
+    ``SCSCPSocketServer``, but it does not dedicate a thread to each
+    connection: idle sessions only cost a coroutine. Procedure calls
+    are run by ``RequestHandlerClass._handle_call`` in ``executor``
+    (the default executor of the loop if ``None``), so that CPU-bound
+    handlers do not block the event loop. The calls of a session are
+    run in order, and may be terminated by the client while they run.
+    The other parameters are as for ``SCSCPSocketServer``, including
+    ``path`` for a Unix domain socket, and the session limits
+    ``idle_timeout`` and ``session_lifetime``.
+    """
+
+    def __init__(self, host=None, port=None,
+                 logger=None, name=b'SCSCPSocketServer', version=b'none',
+                 description='SCSCP socket server', RequestHandlerClass=SCSCPServerRequestHandler,
+                 executor=None, backlog=1024, workers=None,
+                 session_store_size=1 << 26, persistent_store=None, result_cache=None,
+                 metrics=None, max_connections=None, max_calls=None, max_pending=None,
+                 path=None, idle_timeout=None, session_lifetime=None, keepalive=True):
+
+        # if host is not given, try the HOST environment variable
+        if host is None:
+            host = os.getenv('HOST', 'localhost')
+
+        # if port is not given, try the PORT environment variable
+        if port is None:
+            port = os.getenv('PORT', '26133')
+        port = int(port)
+
+        self.host, self.port, self.path = host, port, path
+        self.RequestHandlerClass = RequestHandlerClass
+        self.executor = executor
+        self.backlog = backlog
+        self._server = None
+        self._setup(logger, name, version, description, workers,
+                    session_store_size, persistent_store, result_cache, metrics,
+                    Admission(max_connections, max_calls, max_pending),
+                    idle_timeout, session_lifetime, keepalive)
+
+    async def start(self):
+        """ Start listening """
+        if self.path is not None:
+            self._server = await asyncio.start_unix_server(self._handle_connection, self.path,
+                                                           backlog=self.backlog)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                      backlog=self.backlog)
+
+    @property
+    def server_address(self):
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        """ Start listening if needed, and serve until cancelled """
+        if self._server is None:
+            await self.start()
+        try:
+            await asyncio.Future()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """ Stop listening """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            if self.path is not None:
+                _remove_stale_socket(self.path)
+        self._close()
+
+    async def _handle_connection(self, reader, writer):
+        """ Handles a single new connection """
+        client_address = writer.get_extra_info('peername')
+        if client_address is None:
+            client_address = ('', 0)
+        if not self.admission.open_connection():
+            self._reject_connection(writer.write)
+            writer.close()
+            return
+        try:
+            await self._handle_session(reader, writer, client_address)
+        finally:
+            self.admission.close_connection()
+
+    async def _handle_session(self, reader, writer, client_address):
+        self.log.info("New connection from %s" % address_name(client_address))
+        log = self.log.getChild(address_name(client_address, port=False))
+        scscp = AsyncSCSCPServer(reader, writer, self.name, self.version, self.service_id,
+                                 logger=log)
+        scscp.metrics = self.metrics
+        set_keepalive(writer.get_extra_info('socket'), self.keepalive)
+        handler = self.RequestHandlerClass.detached(self, scscp, client_address, log)
+        loop = asyncio.get_event_loop()
+        calls = asyncio.Queue()
+
+        async def run_calls():
+            while True:
+                call = await calls.get()
+                await loop.run_in_executor(self.executor, handler._run_call, call)
+                await scscp.drain()
+
+        runner = asyncio.ensure_future(run_calls())
+        try:
+            await scscp.accept(timeout=-1)
+            while True:
+                try:
+                    reason, timeout = handler._expiry()
+                    if reason is not None:
+                        handler._quit(reason)
+                        break
+                    if not await scscp.wait_data(timeout):
+                        continue
+                    call = await scscp.wait()
+                    admitted = handler._received(call)
+                except TimeoutError:
+                    # the message started, but did not arrive in time
+                    handler._quit(b'Message took too long to arrive.')
+                    break
+                except SCSCPTerminate as e:
+                    log.info(e)
+                    handler.terminate(e.call_id)
+                    continue
+                except SCSCPQuit as e:
+                    log.info(e)
+                    break
+                except ConnectionResetError:
+                    log.info('Client closed unexpectedly.')
+                    break
+                except SCSCPCancel as e:
+                    log.info(e)
+                    continue
+                except SCSCPProtocolError as e:
+                    log.info('SCSCP protocol error: %s.' % str(e))
+                    log.info('Closing connection.')
+                    scscp.quit()
+                    break
+                if admitted:
+                    calls.put_nowait(call)
+                else:
+                    handler._reject(call)
+        except (SCSCPConnectionError, SCSCPProtocolError, ConnectionError, TimeoutError) as e:
+            log.info('Closing connection: %s' % e)
+            scscp.quit()
+        finally:
+            # nobody is waiting for the results anymore
+            handler._terminate_all()
+            runner.cancel()
+            try:
+                await runner
+            except (asyncio.CancelledError, ConnectionError):
+                pass
+            writer.close()
@@ -0,0 +1,310 @@
+"""
+A compact binary encoding of OpenMath objects.
+
+The encoding is modelled on the OpenMath binary encoding (one token
+byte per node, followed by its content), but it is specific to this
+package: integers are stored as two's complement binary, not decimal
+digits, so that huge integers are encoded and decoded in linear time.
+It is only used by SCSCP peers that both advertise it during the
+handshake.
+
+Encoded objects never contain the byte ``<``, so that they can be
+framed between SCSCP processing instructions: ``<`` and the escape
+byte ``\\x1b`` are escaped as ``\\x1b\\x02`` and ``\\x1b\\x01``.
+"""
+
+import struct
+from openmath import openmath as om
+
+# Tokens
+INT_SMALL = 0x01
+INT_BIG = 0x02
+FLOAT = 0x03
+BYTES = 0x04
+VARIABLE = 0x05
+STRING = 0x06
+SYMBOL = 0x08
+FOREIGN = 0x0C
+APPLICATION, APPLICATION_END = 0x10, 0x11
+ATTRIBUTION, ATTRIBUTION_END = 0x12, 0x13
+ATTRIBUTION_PAIRS, ATTRIBUTION_PAIRS_END = 0x14, 0x15
+ERROR, ERROR_END = 0x16, 0x17
+OBJECT, OBJECT_END = 0x18, 0x19
+BINDING, BINDING_END = 0x1A, 0x1B
+BIND_VARIABLES, BIND_VARIABLES_END = 0x1C, 0x1D
+REFERENCE = 0x1E
+
+# Flags
+FLAG_LONG = 0x80
+FLAG_ID = 0x40
+FLAG_CDBASE = 0x20
+_TOKEN_MASK = 0x1F
+
+_ESC = b'\x1b'
+_ESC_ESC = b'\x1b\x01'
+_ESC_LT = b'\x1b\x02'
+
+# Not valid tokens, may surround an encoded object
+_WHITESPACE = b' \t\n\r'
+
+_double = struct.Struct('>d')
+_int32 = struct.Struct('>i')
+_uint32 = struct.Struct('>I')
+
+
+class BinaryDecodeError(ValueError):
+    pass
+
+
+def _str(s):
+    b = s.encode('utf-8')
+    if len(b) < 255:
+        return bytes((len(b),)) + b
+    return b'\xff' + _uint32.pack(len(b)) + b
+
+
+def encode_parts(obj, out):
+    """ Append the encoding of ``obj`` to the list ``out`` """
+    flags = 0
+    attrs = []
+    cdbase = getattr(obj, 'cdbase', None) if isinstance(obj, om.CDBaseAttribute) else None
+    if cdbase is not None:
+        flags |= FLAG_CDBASE
+        attrs.append(_str(cdbase))
+    ident = obj.id if isinstance(obj, om.CommonAttributes) else None
+    if ident is not None:
+        flags |= FLAG_ID
+        attrs.append(_str(ident))
+
+    if isinstance(obj, om.OMInteger):
+        i = obj.integer
+        if -(1 << 31) <= i < (1 << 31):
+            if -128 <= i < 128:
+                out.append(bytes((INT_SMALL | flags, i & 0xFF)))
+            else:
+                out.append(bytes((INT_SMALL | FLAG_LONG | flags,)) + _int32.pack(i))
+            out.extend(attrs)
+        else:
+            data = i.to_bytes((i.bit_length() + 8) // 8, 'big', signed=True)
+            out.append(bytes((INT_BIG | flags,)) + _uint32.pack(len(data)))
+            out.extend(attrs)
+            out.append(data)
+    elif isinstance(obj, om.OMSymbol):
+        out.append(bytes((SYMBOL | flags,)))
+        out.extend(attrs)
+        out.append(_str(obj.cd))
+        out.append(_str(obj.name))
+    elif isinstance(obj, om.OMApplication):
+        out.append(bytes((APPLICATION | flags,)))
+        out.extend(attrs)
+        encode_parts(obj.elem, out)
+        for a in obj.arguments:
+            encode_parts(a, out)
+        out.append(bytes((APPLICATION_END,)))
+    elif isinstance(obj, om.OMString):
+        data = b'' if obj.string is None else str(obj.string).encode('utf-8')
+        out.append(bytes((STRING | flags,)) + _uint32.pack(len(data)))
+        out.extend(attrs)
+        out.append(data)
+    elif isinstance(obj, om.OMFloat):
+        out.append(bytes((FLOAT | flags,)) + _double.pack(obj.double))
+        out.extend(attrs)
+    elif isinstance(obj, om.OMBytes):
+        out.append(bytes((BYTES | flags,)) + _uint32.pack(len(obj.bytes)))
+        out.extend(attrs)
+        out.append(bytes(obj.bytes))
+    elif isinstance(obj, om.OMVariable):
+        out.append(bytes((VARIABLE | flags,)))
+        out.extend(attrs)
+        out.append(_str(obj.name))
+    elif isinstance(obj, om.OMReference):
+        out.append(bytes((REFERENCE | flags,)))
+        out.extend(attrs)
+        out.append(_str(obj.href))
+    elif isinstance(obj, om.OMForeign):
+        data = str(obj.obj).encode('utf-8')
+        out.append(bytes((FOREIGN | flags,)) + _uint32.pack(len(data)))
+        out.extend(attrs)
+        out.append(_str(obj.encoding or ''))
+        out.append(data)
+    elif isinstance(obj, om.OMObject):
+        out.append(bytes((OBJECT | flags,)))
+        out.extend(attrs)
+        out.append(_str(obj.version))
+        encode_parts(obj.omel, out)
+        out.append(bytes((OBJECT_END,)))
+    elif isinstance(obj, (om.OMAttribution, om.OMAttVar)):
+        out.append(bytes((ATTRIBUTION | flags,)))
+        out.extend(attrs)
+        encode_parts(obj.pairs, out)
+        encode_parts(obj.obj, out)
+        out.append(bytes((ATTRIBUTION_END,)))
+    elif isinstance(obj, om.OMAttributionPairs):
+        out.append(bytes((ATTRIBUTION_PAIRS | flags,)))
+        out.extend(attrs)
+        for k, v in obj.pairs:
+            encode_parts(k, out)
+            encode_parts(v, out)
+        out.append(bytes((ATTRIBUTION_PAIRS_END,)))
+    elif isinstance(obj, om.OMBinding):
+        out.append(bytes((BINDING | flags,)))
+        out.extend(attrs)
+        encode_parts(obj.binder, out)
+        encode_parts(obj.vars, out)
+        encode_parts(obj.obj, out)
+        out.append(bytes((BINDING_END,)))
+    elif isinstance(obj, om.OMBindVariables):
+        out.append(bytes((BIND_VARIABLES | flags,)))
+        out.extend(attrs)
+        for v in obj.vars:
+            encode_parts(v, out)
+        out.append(bytes((BIND_VARIABLES_END,)))
+    elif isinstance(obj, om.OMError):
+        out.append(bytes((ERROR | flags,)))
+        out.extend(attrs)
+        encode_parts(obj.name, out)
+        for p in obj.params:
+            encode_parts(p, out)
+        out.append(bytes((ERROR_END,)))
+    else:
+        raise TypeError("Expected obj to be of type OMAny, found %s." % obj.__class__.__name__)
+    return out
+
+
+def escape(data):
+    """ Escape the bytes ``<`` and ``\\x1b`` of an encoded object """
+    if b'<' in data or _ESC in data:
+        data = data.replace(_ESC, _ESC_ESC).replace(b'<', _ESC_LT)
+    return data
+
+
+def encode_bytes(obj):
+    """ Encodes an OpenMath object into bytes """
+    return escape(b''.join(encode_parts(obj, [])))
+
+
+class _Decoder(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def byte(self):
+        try:
+            b = self.data[self.pos]
+        except IndexError:
+            raise BinaryDecodeError("Truncated binary OpenMath object.")
+        self.pos += 1
+        return b
+
+    def take(self, n):
+        end = self.pos + n
+        if end > len(self.data):
+            raise BinaryDecodeError("Truncated binary OpenMath object.")
+        b = self.data[self.pos:end]
+        self.pos = end
+        return b
+
+    def str(self):
+        n = self.byte()
+        if n == 255:
+            n = _uint32.unpack(self.take(4))[0]
+        return bytes(self.take(n)).decode('utf-8')
+
+    def peek(self):
+        return self.data[self.pos] if self.pos < len(self.data) else None
+
+    def until(self, end, in_bind=False):
+        items = []
+        while self.peek() != end:
+            items.append(self.object(in_bind))
+        self.pos += 1
+        return items
+
+    def object(self, in_bind=False):
+        token = self.byte()
+        kind = token & _TOKEN_MASK
+        long = token & FLAG_LONG
+
+        # fixed-size content comes before the attributes
+        if kind == INT_SMALL:
+            if long:
+                value = _int32.unpack(self.take(4))[0]
+            else:
+                value = self.byte()
+                value = value - 256 if value > 127 else value
+        elif kind == FLOAT:
+            value = _double.unpack(self.take(8))[0]
+        elif kind in (INT_BIG, STRING, BYTES, FOREIGN):
+            size = _uint32.unpack(self.take(4))[0]
+
+        cdbase = self.str() if token & FLAG_CDBASE else None
+        kwds = {'id': self.str()} if token & FLAG_ID else {}
+
+        if kind == INT_SMALL:
+            return om.OMInteger(value, **kwds)
+        elif kind == INT_BIG:
+            return om.OMInteger(int.from_bytes(self.take(size), 'big', signed=True), **kwds)
+        elif kind == FLOAT:
+            return om.OMFloat(value, **kwds)
+        elif kind == STRING:
+            return om.OMString(bytes(self.take(size)).decode('utf-8'), **kwds)
+        elif kind == BYTES:
+            return om.OMBytes(bytes(self.take(size)), **kwds)
+        elif kind == SYMBOL:
+            cd = self.str()
+            return om.OMSymbol(self.str(), cd, cdbase=cdbase, **kwds)
+        elif kind == VARIABLE:
+            return om.OMVariable(self.str(), **kwds)
+        elif kind == REFERENCE:
+            return om.OMReference(self.str(), **kwds)
+        elif kind == FOREIGN:
+            encoding = self.str() or None
+            return om.OMForeign(bytes(self.take(size)).decode('utf-8'), encoding,
+                                cdbase=cdbase, **kwds)
+        elif kind == APPLICATION:
+            elem = self.object()
+            return om.OMApplication(elem, self.until(APPLICATION_END), cdbase=cdbase, **kwds)
+        elif kind == OBJECT:
+            version = self.str()
+            omel = self.object()
+            if self.byte() != OBJECT_END:
+                raise BinaryDecodeError("Bad end of OpenMath object.")
+            return om.OMObject(omel, version, cdbase=cdbase, **kwds)
+        elif kind == ATTRIBUTION:
+            pairs = self.object()
+            obj = self.object(in_bind)
+            if self.byte() != ATTRIBUTION_END:
+                raise BinaryDecodeError("Bad end of attribution.")
+            if in_bind:
+                return om.OMAttVar(pairs, obj, **kwds)
+            return om.OMAttribution(pairs, obj, cdbase=cdbase, **kwds)
+        elif kind == ATTRIBUTION_PAIRS:
+            items = self.until(ATTRIBUTION_PAIRS_END)
+            return om.OMAttributionPairs(list(zip(items[::2], items[1::2])), cdbase=cdbase, **kwds)
+        elif kind == BINDING:
+            binder = self.object()
+            bvars = self.object()
+            obj = self.object()
+            if self.byte() != BINDING_END:
+                raise BinaryDecodeError("Bad end of binding.")
+            return om.OMBinding(binder, bvars, obj, cdbase=cdbase, **kwds)
+        elif kind == BIND_VARIABLES:
+            return om.OMBindVariables(self.until(BIND_VARIABLES_END, True), **kwds)
+        elif kind == ERROR:
+            name = self.object()
+            return om.OMError(name, self.until(ERROR_END), cdbase=cdbase, **kwds)
+        else:
+            raise BinaryDecodeError("Unknown token %d." % token)
+
+
+def decode_bytes(data):
+    """ Decodes bytes into an OpenMath object, ignoring surrounding whitespace """
+    if _ESC in data:
+        data = data.replace(_ESC_LT, b'<').replace(_ESC_ESC, _ESC)
+    decoder = _Decoder(memoryview(data))
+    while decoder.peek() is not None and decoder.peek() in _WHITESPACE:
+        decoder.pos += 1
+    obj = decoder.object()
+    if data[decoder.pos:].strip(_WHITESPACE):
+        raise BinaryDecodeError("Trailing data after binary OpenMath object.")
+    return obj
@@ -0,0 +1,193 @@
+"""
+A cache of the results of pure procedure calls, shared by all the
+connections of a server, or kept by a client (see ``scscp.cli``).
+
+Calls are keyed on the binary encoding of their data (the application
+of the head to its arguments), so that the call id and the options of
+the call do not matter.
+
+``HeadsCache`` keeps the heads allowed by servers on disk, so that
+clients connecting again to the same service skip their discovery.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import binary, store
+
+
+class ResultCache(object):
+    """
+    A thread-safe LRU cache of OpenMath results.
+
+    The cache holds at most ``max_entries`` results, and at most
+    ``max_size`` bytes (estimated) of keys and results. Results larger
+    than ``max_size`` are not cached. If ``ttl`` is given, results
+    expire ``ttl`` seconds after they were cached.
+    """
+
+    def __init__(self, max_size=1 << 26, max_entries=10000, ttl=None):
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # the service whose results are cached, see check_version
+        self.version = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    @staticmethod
+    def key(data):
+        """ The cache key of the data of a procedure call """
+        return binary.encode_bytes(data)
+
+    def get(self, key):
+        """ The cached result, or None """
+        with self._lock:
+            try:
+                res, size, expires = self._results[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires is not None and expires <= time.monotonic():
+                del self._results[key]
+                self.size -= size
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return res
+
+    def put(self, key, res):
+        """ Cache a result, evicting the least recently used ones """
+        size = len(key) + store.sizeof(res)
+        if size > self.max_size:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            old = self._results.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._results[key] = (res, size, expires)
+            self.size += size
+            while self.size > self.max_size or len(self._results) > self.max_entries:
+                _, (_, s, _) = self._results.popitem(last=False)
+                self.size -= s
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.size = 0
+
+    def check_version(self, version):
+        """
+        Clear the cache if its results were computed by another
+        ``version`` of the service (any hashable value)
+        """
+        with self._lock:
+            if version != self.version:
+                self._results.clear()
+                self.size = 0
+                self.version = version
+
+    def stats(self):
+        """ Hit/miss statistics, as a dictionary """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._results), 'size': self.size}
+
+
+def _default_directory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'scscp', 'heads')
+
+
+class HeadsCache(object):
+    """
+    An on-disk cache of the heads allowed by servers (the answers to
+    ``get_allowed_heads``), shared by the processes of a user.
+
+    Entries are keyed by the ``service_name``, ``service_version`` and
+    ``service_id`` given by the server during the handshake, so that a
+    restarted or upgraded server is queried again. Servers that give no
+    ``service_id`` are not cached. Entries are kept in ``directory``
+    (by default ``$XDG_CACHE_HOME/scscp/heads``); if ``ttl`` is given,
+    they expire ``ttl`` seconds after they were written.
+    """
+
+    def __init__(self, directory=None, ttl=None):
+        self.directory = directory or _default_directory()
+        self.ttl = ttl
+
+    @staticmethod
+    def key(service_info):
+        """ The key of a service, or None if it cannot be cached """
+        fields = [service_info.get(k) for k in ('service_name', 'service_version', 'service_id')]
+        if not fields[2]:
+            return None
+        fields = [f.encode() if isinstance(f, str) else (f or b'') for f in fields]
+        return hashlib.sha1(b'\0'.join(fields)).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, service_info):
+        """
+        The heads allowed by a service, as a list of ``(cd, name)``
+        pairs, where ``name`` is None for a whole content dictionary; or
+        None if they are not cached.
+        """
+        key = self.key(service_info)
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            if self.ttl is not None and os.path.getmtime(path) + self.ttl < time.time():
+                return None
+            with open(path) as f:
+                return [(cd, name) for cd, name in json.load(f)['heads']]
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def put(self, service_info, heads):
+        """ Cache the heads allowed by a service, see ``get`` """
+        key = self.key(service_info)
+        if key is None:
+            return
+        path = self._path(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump({'heads': [list(h) for h in heads]}, f)
+            os.replace(tmp, path)
+        except (IOError, OSError):
+            # the cache is an optimization: keep going without it
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def clear(self):
+        """ Delete all the entries """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.json'):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
@@ -1,6 +1,6 @@
-import socket
 from openmath import convert, openmath as om
-from .client import SCSCPClient
+from .client import SCSCPClient, SharedSCSCPClient, open_socket
+from .cache import ResultCache, HeadsCache
 from . import scscp
 
 def _conv_if_py(obj):
@@ -10,7 +10,21 @@ def _conv_if_py(obj):
         return convert.to_openmath(obj)
 
 class SCSCPCLI(SCSCPClient):
-    """ A synchronous CLI client for SCSCP """
+    """
+    A synchronous CLI client for SCSCP
+
+    Calls to the ``pure_heads`` of the server, given as ``(cd, name)``
+    pairs, are memoized if ``cache`` is given: either a
+    ``scscp.cache.ResultCache``, or its size in bytes. The cache is
+    cleared if the ``service_id`` or ``service_version`` of the server
+    change, so that it may be shared with later connections.
+
+    The heads allowed by the server are discovered when connecting,
+    unless ``populate`` is false. If ``heads_cache`` is given, either a
+    ``scscp.cache.HeadsCache`` or True for the default one, they are
+    kept on disk, and later connections to the same service skip the
+    discovery.
+    """
 
     class Head(object):
         """ A callable remote procedure """
@@ -20,18 +34,61 @@ class SCSCPCLI(SCSCPClient):
             self._cli = cli
             self._om = om.OMSymbol(name, cd=cd)
         def __call__(self, data, cookie=False, timeout=-1, **opts):
-            res = self._cli._call_wait(om.OMApplication(self._om, map(_conv_if_py, data)),
-                                           cookie, timeout=timeout, **opts)
+            data = om.OMApplication(self._om, [_conv_if_py(x) for x in data])
+            key = self._cli._cache_key(self, data, cookie)
+            if key is not None:
+                res = self._cli.cache.get(key)
+                if res is not None:
+                    return self._to_python(res)
+            res = self._cli._call_wait(data, cookie, timeout=timeout, **opts)
             if res.type == 'procedure_completed':
-                try:
-                    return convert.to_python(res.data)
-                except ValueError:
-                    return res.data
+                if cookie and isinstance(res.data, om.OMReference):
+                    return SCSCPCLI.RemoteObject(res.data, self._cli)
+                if key is not None:
+                    self._cli.cache.put(key, res.data)
+                return self._to_python(res.data)
             elif res.type == 'procedure_terminated':
                 raise scscp.SCSCPProtocolError('Server returned error: %s.' % res.data.name.name,
                                                    res.data)
             else:
-                raise scscp.SCSCPProtocolError('Unexpected response.', resp.om())
+                raise scscp.SCSCPProtocolError('Unexpected response.', res.om())
+        @staticmethod
+        def _to_python(data):
+            try:
+                return convert.to_python(data)
+            except ValueError:
+                return data
+
+    class RemoteObject(object):
+        """
+        An object stored on the server, returned by calls with ``cookie=True``
+
+        Passing it as argument to another call sends the reference, not
+        the object. The object is unbound on the server by ``unbind()``,
+        or when this proxy is garbage collected (if ``auto_unbind``).
+        """
+        def __init__(self, ref, cli, auto_unbind=True):
+            self._om = ref
+            self._cli = cli
+            self._auto_unbind = auto_unbind
+        @property
+        def url(self):
+            return self._om.href
+        def __openmath__(self, *args):
+            return self._om
+        def retrieve(self, timeout=-1):
+            """ Download the object """
+            return self._cli.heads.scscp2.retrieve([self._om], timeout=timeout)
+        def unbind(self, timeout=-1):
+            """ Delete the object on the server """
+            self._auto_unbind = False
+            return self._cli.heads.scscp2.unbind([self._om], timeout=timeout)
+        def __del__(self):
+            # Sending now could interleave with a running call: defer
+            if self._auto_unbind:
+                self._cli._garbage.append(self._om)
+        def __repr__(self):
+            return '<RemoteObject %s>' % self._om.href
     
     class CD(object):
         """ A content dictionary, implemented as a namespace """
@@ -67,16 +124,46 @@ class SCSCPCLI(SCSCPClient):
             return cd in self.__dict__
             
     
-    def __init__(self, host, port=26133, populate=True):
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.connect((host, port))
-        super(SCSCPCLI, self).__init__(s)
+    def __init__(self, host=None, port=26133, populate=True, encoding=None, path=None, sock=None,
+                 cache=None, pure_heads=(), heads_cache=None):
+        """
+        Connect to the server ``host:port``, or on the Unix domain
+        socket ``path``, or through the connected socket ``sock``
+        (e.g., from ``scscp.inprocess.InProcessServer.connect()``).
+        """
+        if host is None and path is None and sock is None:
+            raise ValueError('host, path or sock is required')
+        if sock is None:
+            sock = open_socket(host, port, path)
+        super(SCSCPCLI, self).__init__(sock, encoding=encoding)
+        if isinstance(cache, int):
+            cache = ResultCache(cache)
+        self.cache = cache
+        self.pure_heads = set(pure_heads)
+        if heads_cache is True:
+            heads_cache = HeadsCache()
+        self.heads_cache = heads_cache
         self.heads = self.Heads(self)
+        self._garbage = []
         self.connect()
         if populate:
             self.populate_heads()
 
+    def connect(self, timeout=None):
+        super(SCSCPCLI, self).connect(timeout)
+        if self.cache is not None:
+            self.cache.check_version((self.service_info.get('service_id'),
+                                      self.service_info.get('service_version')))
+
+    def _cache_key(self, head, data, cookie):
+        """ The key of a call in the cache, or None if it is not cached """
+        if self.cache is None or cookie is not False or (head.cd, head._name) not in self.pure_heads:
+            return None
+        return self.cache.key(data)
+
     def _call_wait(self, data, cookie=False, timeout=-1, **opts):
+        if self._garbage:
+            self._collect_garbage(timeout)
         call = self.call(data, cookie, **opts)
         resp = self.wait(timeout)
         
@@ -86,7 +173,31 @@ class SCSCPCLI(SCSCPClient):
 
         return resp
 
+    def _collect_garbage(self, timeout=-1):
+        """ Unbind the remote objects whose proxies were garbage collected """
+        garbage, self._garbage = self._garbage, []
+        calls = set(self.call(scscp.unbind(ref.href)).id for ref in garbage)
+        while calls:
+            resp = self.wait(timeout)
+            if resp.id not in calls:
+                raise scscp.SCSCPProtocolError("Wrong call id (got %s)." % resp.id, resp.om())
+            calls.remove(resp.id)
+
     def populate_heads(self):
+        heads = None
+        if self.heads_cache is not None:
+            heads = self.heads_cache.get(self.service_info)
+        if heads is None:
+            heads = self._get_allowed_heads()
+            if self.heads_cache is not None:
+                self.heads_cache.put(self.service_info, heads)
+        for cd, name in heads:
+            cd = self.heads._get_cd(cd)
+            if name is not None:
+                cd._get_head(name)
+
+    def _get_allowed_heads(self):
+        """ Query the allowed heads, as a list of ``(cd, name)`` pairs, see ``HeadsCache.get`` """
         heads = self._call_wait(scscp.get_allowed_heads())
         if heads.type == 'procedure_terminated':
             raise scscp.SCSCPProtocolError("Failed to get heads (%s)." % heads.data.name.name,
@@ -94,19 +205,44 @@ class SCSCPCLI(SCSCPClient):
         elif heads.type != 'procedure_completed':
             raise scscp.SCSCPProtocolError("Server gave unexpected response.", heads.om())
     
+        res = []
         try:
             for symbol in heads.data.arguments:
                 if isinstance(symbol, om.OMSymbol):
-                    self.heads._get_cd(symbol.cd)._get_head(symbol.name)
+                    res.append((symbol.cd, symbol.name))
                 elif symbol.elem.name == 'CDName':
-                    self.heads._get_cd(symbol.arguments[0].string)
+                    res.append((symbol.arguments[0].string, None))
                 else:
                     continue
         except (AttributeError, IndexError):
             raise scscp.SCSCPProtocolError("Server gave unexpected response.", heads.data)
+        return res
 
     def is_allowed_head(self, name, cd):
         return self.heads.scscp2.is_allowed_head([om.OMSymbol(name, cd)])
     
     def get_description(self):
         return [a.string for a in self.heads.scscp2.get_service_description([]).arguments]
+
+    def get_signature(self, name, cd):
+        return self.heads.scscp2.get_signature([om.OMSymbol(name, cd)])
+
+
+class SharedSCSCPCLI(SCSCPCLI, SharedSCSCPClient):
+    """
+    A ``SCSCPCLI`` that several threads may use at once: their calls
+    are sent on the same connection, and their responses dispatched by
+    a reader thread (see ``scscp.client.SharedSCSCPClient``).
+    """
+
+    def _call_wait(self, data, cookie=False, timeout=-1, **opts):
+        if self._garbage:
+            self._collect_garbage(timeout)
+        return self.call(data, cookie, timeout, **opts)
+
+    def _collect_garbage(self, timeout=-1):
+        with self._pending_lock:
+            garbage, self._garbage = self._garbage, []
+        calls = [self._submit(scscp.unbind(ref.href), False, None, {}) for ref in garbage]
+        for call, fut in calls:
+            self._result(call.id, fut, timeout)
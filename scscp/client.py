@@ -1,13 +1,38 @@
 import logging
-from pexpect import fdpexpect, TIMEOUT, EOF
-from openmath import encoder, decoder
-from .scscp import SCSCPConnectionError, SCSCPQuit, SCSCPCancel, SCSCPProcedureMessage
+import socket
+import time
+import threading
+from concurrent import futures
+from openmath import encoder
+from .scscp import SCSCPConnectionError, SCSCPQuit, SCSCPCancel, SCSCPTerminate, SCSCPProcedureMessage
 from .processing_instruction import ProcessingInstruction as PI, OrderedProcessingInstruction as OPI
+from .framing import SocketStream, TIMEOUT, EOF, START, END, CANCEL, send_frame, set_nodelay
+from . import binary
+from .streaming import StreamingDecoder
+from .lazy import LazyProcedureMessage, decode_xml
 
 class TimeoutError(RuntimeError):
     """ Client/Server timeout """
     pass
     
+def open_socket(host=None, port=26133, path=None):
+    """
+    A socket connected to an SCSCP server: on the Unix domain socket
+    ``path`` if given, by TCP to ``host:port`` otherwise.
+    """
+    if path is not None:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = path
+    else:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (host, port)
+    try:
+        s.connect(address)
+    except:
+        s.close()
+        raise
+    return s
+
 INITIALIZED=0
 CONNECTED=1
 CLOSED=2
@@ -22,30 +47,92 @@ def _assert_status(status, msg=None):
     return wrap
 _assert_connected = _assert_status(CONNECTED, "Not connected.")
 
+# Encodings of OpenMath payloads: name -> (encode, decode)
+CODECS = {
+    'xml'    : (encoder.encode_bytes, decode_xml),
+    'binary' : (binary.encode_bytes, binary.decode_bytes),
+}
+
+
+class _CountingSink(object):
+    """ Counts the bytes passed to a sink """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.count = 0
+
+    def __call__(self, data):
+        self.count += len(data)
+        self.sink(data)
+
+
+class _TimedSink(_CountingSink):
+    """ Counts the bytes passed to a decoding sink, and the time it takes """
+
+    def __init__(self, sink):
+        super(_TimedSink, self).__init__(sink)
+        self.seconds = 0.0
+
+    def __call__(self, data):
+        start = time.perf_counter()
+        super(_TimedSink, self).__call__(data)
+        self.seconds += time.perf_counter() - start
+
+    def finish(self, metrics, encoding, close):
+        """ Run ``close``, and record the decoding time """
+        start = time.perf_counter()
+        res = close()
+        metrics.record_codec('decode', encoding, self.seconds + time.perf_counter() - start,
+                             self.count)
+        return res
+
+
+def _timed(metrics, operation, encoding, fun, arg, nbytes=None):
+    """ Run an encoder or decoder, and record the time it takes """
+    start = time.perf_counter()
+    res = fun(arg)
+    metrics.record_codec(operation, encoding, time.perf_counter() - start,
+                         len(res) if nbytes is None else nbytes)
+    return res
+
 
 class SCSCPPeer(object):
     """
     Base class for SCSCP client and server
+
+    ``TCP_NODELAY`` is set on TCP sockets, unless ``nodelay`` is False.
+    If ``metrics`` is set to a ``scscp.metrics.Metrics``, the messages
+    sent and received, and their encoding and decoding, are recorded.
     """
+
+    # Payload encodings, besides XML, that can be negotiated
+    encodings = ()
+
+    # Instrumentation, see scscp.metrics
+    metrics = None
     
-    def __init__(self, socket, timeout=30, logger=None, me='Client', you='Server'):
+    def __init__(self, socket, timeout=30, logger=None, me='Client', you='Server', nodelay=True):
         self.socket = socket
-        self.stream = fdpexpect.fdspawn(socket, timeout=timeout)
+        set_nodelay(socket, nodelay)
+        self.stream = SocketStream(socket, timeout=timeout)
         self.status = INITIALIZED
+        self.encoding = 'xml'
         self.log = logger or logging.getLogger(__name__)
         self.me, self.you = me, you
+        # messages may be sent by several threads
+        self._send_lock = threading.Lock()
 
-    def _get_next_PI(self, expect=None, timeout=-1):
+    def _get_next_PI(self, expect=None, timeout=-1, sink=None):
         while True:
             try:
-                self.stream.expect(PI.PI_regex, timeout=timeout)
+                pi = self.stream.expect_PI(timeout=timeout, sink=sink)
             except TIMEOUT:
                 raise TimeoutError("%s took too long to respond." % self.you)
             except EOF:
                 raise ConnectionResetError("%s closed unexpectedly." % self.you)
 
             try:
-                pi = PI.parse(self.stream.after)
+                pi = PI.parse(pi)
             except SCSCPConnectionError:
                 self.quit()
                 raise
@@ -53,9 +140,18 @@ class SCSCPPeer(object):
 
             if expect is not None and pi.key not in expect:
                 if pi.key == 'quit':
-                    self.quit()
+                    if self.status == CONNECTED:
+                        self.quit()
+                    else:
+                        # e.g., rejected by an overloaded server
+                        self.socket.close()
+                        self.status = CLOSED
                     reason = pi.attrs.get('reason')
                     raise SCSCPQuit("%s closed session (reason: %s)." % (self.you, reason), reason)
+                if pi.key == 'terminate':
+                    call_id = pi.attrs.get('call_id', b'').decode('utf-8', 'replace')
+                    raise SCSCPTerminate("%s requested termination of call %s." % (self.you, call_id),
+                                         call_id)
                 if pi.key == '' and 'info' in pi.attrs:
                     self.log.info("SCSCP info: %s" % pi.attrs.get('info').decode())
                     continue
@@ -68,42 +164,63 @@ class SCSCPPeer(object):
     def _send_PI(self, key='', **kwds):
         pi = PI(key, **kwds)
         self.log.debug("Sending PI: %s" % pi)
-        return self.socket.send(bytes(pi) + b'\n')
+        with self._send_lock:
+            self.socket.sendall(bytes(pi) + b'\n')
 
     def _send_ordered_PI(self, key, attrs):
         pi = OPI(key, attrs)
         self.log.debug("Sending PI: %s" % pi)
-        return self.socket.send(bytes(pi) + b'\n')
+        with self._send_lock:
+            self.socket.sendall(bytes(pi) + b'\n')
 
     @_assert_connected
     def send(self, msg):
         """ Send SCSCP message """
-        self._send_PI('start')
-        try:
+        if self.log.isEnabledFor(logging.DEBUG):
             self.log.debug(b'Sending message: %s' % msg)
-            self.socket.send(msg + b'\n')
-        except:
-            self._send_PI('cancel')
-            raise
-        else:
-            self._send_PI('end')
+        with self._send_lock:
+            try:
+                send_frame(self.socket, START, msg, END)
+            except:
+                try:
+                    self.socket.sendall(CANCEL)
+                except OSError:
+                    pass
+                raise
+        if self.metrics is not None:
+            self.metrics.record_sent(len(msg))
 
     @_assert_connected
-    def receive(self, timeout=-1):
-        """ Receive SCSCP message """
+    def receive(self, timeout=-1, sink=None):
+        """
+        Receive SCSCP message, returned as a bytearray
+
+        If ``sink`` is given, the message is instead passed to it
+        piecewise, as it arrives, and None is returned.
+        """
+        if (self.metrics is not None and sink is not None
+                and not isinstance(sink, _CountingSink)):
+            sink = _CountingSink(sink)
         pi = self._get_next_PI(['start'], timeout=timeout)
-        pi = self._get_next_PI(['end', 'cancel'], timeout=timeout)
+        pi = self._get_next_PI(['end', 'cancel'], timeout=timeout, sink=sink)
         if pi.key == 'cancel':
             raise SCSCPCancel('%s canceled transmission' % self.you)
 
         msg = self.stream.before
-        self.log.debug(b'Received message: %s' % msg)
+        if self.metrics is not None:
+            self.metrics.record_received(len(msg) if sink is None else sink.count)
+        if sink is not None:
+            return None
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(b'Received message: %s' % msg)
         return msg
 
     @_assert_connected
     def quit(self, reason=None):
         """ Send SCSCP quit message """
-        kwds = {} if reason is None else { 'reason': None }
+        if isinstance(reason, str):
+            reason = reason.encode('utf-8')
+        kwds = {} if reason is None else { 'reason': reason }
         try:
             self._send_PI('quit', **kwds)
             self.socket.close()
@@ -122,22 +239,47 @@ class SCSCPPeerOM(SCSCPPeer):
     """
     Base class for SCSCP client and server understanding OpenMath
     """
+
+    encodings = ('binary',)
+
+    # Decode XML messages while they arrive
+    streaming = True
     
     def receive(self, timeout=-1):
+        if self.streaming and self.encoding == 'xml':
+            # on cancel, the partial tree is simply dropped
+            decoder = StreamingDecoder()
+            if self.metrics is None:
+                super(SCSCPPeerOM, self).receive(timeout, sink=decoder.feed)
+                return decoder.close()
+            sink = _TimedSink(decoder.feed)
+            super(SCSCPPeerOM, self).receive(timeout, sink=sink)
+            return sink.finish(self.metrics, 'xml', decoder.close)
         msg = super(SCSCPPeerOM, self).receive(timeout)
-        return decoder.decode_bytes(msg)
-        
+        if self.metrics is None:
+            return CODECS[self.encoding][1](msg)
+        return _timed(self.metrics, 'decode', self.encoding, CODECS[self.encoding][1], msg, len(msg))
+
     def send(self, om):
-        return super(SCSCPPeerOM, self).send(encoder.encode_bytes(om))
+        if self.metrics is None:
+            return super(SCSCPPeerOM, self).send(CODECS[self.encoding][0](om))
+        msg = _timed(self.metrics, 'encode', self.encoding, CODECS[self.encoding][0], om)
+        return super(SCSCPPeerOM, self).send(msg)
 
     
 class SCSCPClientBase(SCSCPPeer):
     """
     A simple SCSCP synchronous client, with no understanding of OpenMath.
+
+    If ``encoding`` is given (e.g., ``'binary'``), it is requested
+    during the handshake, provided the server advertises it. The
+    negotiated encoding is stored in ``self.encoding``.
     """
     
-    def __init__(self, socket, timeout=30, logger=None):
-        super(SCSCPClientBase, self).__init__(socket, timeout, logger, me="Client", you="Server")
+    def __init__(self, socket, timeout=30, logger=None, encoding=None, nodelay=True):
+        super(SCSCPClientBase, self).__init__(socket, timeout, logger, me="Client", you="Server",
+                                              nodelay=nodelay)
+        self._requested_encoding = encoding
 
     @_assert_status(INITIALIZED, "Session already opened.")
     def connect(self, timeout=None):
@@ -151,26 +293,42 @@ class SCSCPClientBase(SCSCPPeer):
         
         self.service_info = pi.attrs
 
-        self._send_PI(version=b'1.3')
+        encoding = self._requested_encoding
+        if (encoding in self.encodings
+                and encoding.encode() in pi.attrs.get('encodings', b'').split()):
+            self._send_PI(version=b'1.3', encoding=encoding.encode())
+        else:
+            encoding = None
+            self._send_PI(version=b'1.3')
 
         pi = self._get_next_PI([''], timeout=timeout)
         if pi.attrs.get('version') != b'1.3':
             self.quit()
             raise SCSCPConnectionError("Server sent unexpected response.", pi)
+        if encoding is not None and pi.attrs.get('encoding') == encoding.encode():
+            self.encoding = encoding
 
         self.status = CONNECTED
 
     @_assert_connected
     def terminate(self, id):
         """ Send SCSCP terminate message """
-        self._send_PI('terminate', call_id=id)
+        self._send_PI('terminate', call_id=id if isinstance(id, bytes) else id.encode())
 
 
 class SCSCPClient(SCSCPClientBase, SCSCPPeerOM):
     """
     A simple SCSCP synchronous client.
     """
-    def wait(self, timeout=-1):
+    def wait(self, timeout=-1, lazy=False):
+        """
+        Receive a procedure message
+
+        If ``lazy``, a ``scscp.lazy.LazyProcedureMessage`` is returned,
+        whose data is only decoded when accessed.
+        """
+        if lazy:
+            return LazyProcedureMessage.from_bytes(SCSCPPeer.receive(self, timeout), self.encoding)
         return SCSCPProcedureMessage.from_om(self.receive(timeout))
 
     def call(self, data, cookie=False, **opts):
@@ -183,3 +341,133 @@ class SCSCPClient(SCSCPClientBase, SCSCPPeerOM):
         call = SCSCPProcedureMessage.call(data, id=None, **opts)
         self.send(call.om())
         return call
+
+
+class SharedSCSCPClient(SCSCPClient):
+    """
+    A synchronous SCSCP client that several threads may use at once.
+
+    After ``connect()``, a reader thread receives all the messages from
+    the server, and hands them to the waiting calls by call id, so that
+    any number of threads can have calls in flight on the connection::
+
+        client = SharedSCSCPClient(open_socket('localhost'))
+        client.connect()
+        resp = client.call(data)    # from any thread
+
+    Unlike ``SCSCPClient.call``, ``call`` waits for the response and
+    returns it; ``submit`` returns a ``concurrent.futures.Future`` of
+    the response instead. ``wait`` is not available, since the
+    messages are received by the reader thread.
+    """
+
+    def __init__(self, socket, timeout=30, logger=None, encoding=None, nodelay=True):
+        super(SharedSCSCPClient, self).__init__(socket, timeout, logger, encoding, nodelay)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # why the session ended, raised by the pending calls
+        self._error = None
+        self._reader = None
+
+    def connect(self, timeout=None):
+        super(SharedSCSCPClient, self).connect(timeout)
+        self._reader = threading.Thread(target=self._read_loop, name='scscp-client-reader')
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _read_loop(self):
+        """ Receive all messages, and resolve the matching futures """
+        try:
+            while True:
+                try:
+                    resp = SCSCPClient.wait(self, timeout=None)
+                except SCSCPCancel as e:
+                    self.log.info(e)
+                    continue
+                with self._pending_lock:
+                    fut = self._pending.pop(resp.id, None)
+                if fut is None:
+                    self.log.warning("Discarding response to unknown call %s." % resp.id)
+                elif not fut.done():
+                    fut.set_result(resp)
+        except Exception as e:
+            with self._pending_lock:
+                closing = self._error is not None
+                if not closing:
+                    self._error = e
+                pending, self._pending = self._pending, {}
+            if not closing:
+                self.log.info(e)
+                if self.status == CONNECTED:
+                    self.status = CLOSED
+                    self.socket.close()
+            for fut in pending.values():
+                if not fut.done():
+                    fut.set_exception(self._error)
+
+    def wait(self, timeout=-1, lazy=False):
+        raise RuntimeError("Messages are received by the reader thread, use call or submit.")
+
+    def _submit(self, data, cookie, id, opts):
+        if cookie:
+            opts['return_cookie'] = True
+        elif cookie is None:
+            opts['return_nothing'] = True
+        else:
+            opts['return_object'] = True
+        call = SCSCPProcedureMessage.call(data, id=id, **opts)
+        fut = futures.Future()
+        with self._pending_lock:
+            if self.status != CONNECTED or self._error is not None:
+                raise RuntimeError("Not connected.")
+            self._pending[call.id] = fut
+        try:
+            self.send(call.om())
+        except:
+            with self._pending_lock:
+                self._pending.pop(call.id, None)
+            raise
+        return call, fut
+
+    def submit(self, data, cookie=False, id=None, **opts):
+        """
+        Send a procedure call, return a future for the response.
+
+        The future resolves to the ``SCSCPProcedureMessage`` sent back
+        by the server, or fails with the reason the session ended.
+        """
+        return self._submit(data, cookie, id, opts)[1]
+
+    def call(self, data, cookie=False, timeout=-1, **opts):
+        """ Send a procedure call and wait for the response """
+        call, fut = self._submit(data, cookie, None, opts)
+        return self._result(call.id, fut, timeout)
+
+    def _result(self, id, fut, timeout=-1):
+        if timeout == -1:
+            timeout = self.stream.timeout
+        try:
+            return fut.result(timeout)
+        except futures.TimeoutError:
+            with self._pending_lock:
+                self._pending.pop(id, None)
+            raise TimeoutError("%s took too long to respond." % self.you)
+
+    def quit(self, reason=None):
+        """ Send SCSCP quit message, and stop the reader thread """
+        # the reader quits when the server does
+        in_reader = self._reader is threading.current_thread()
+        if not in_reader:
+            with self._pending_lock:
+                if self._error is None:
+                    self._error = SCSCPQuit("Session closed.", reason)
+            try:
+                # wake up the reader
+                self.socket.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+        try:
+            super(SharedSCSCPClient, self).quit(reason)
+        finally:
+            if not in_reader and self._reader is not None:
+                self._reader.join()
@@ -0,0 +1,265 @@
+"""
+Incremental framing of SCSCP byte streams.
+
+An SCSCP stream is a sequence of processing instructions (PIs) of the
+form ``<?scscp ... ?>``, possibly separated by payload data. The
+classes in this module split such a stream into PIs and payloads,
+looking at each byte only once, so that receiving a message is linear
+in its size.
+
+It also provides ``send_frame()``, which writes a whole SCSCP message
+with a single system call.
+"""
+
+import re
+import select
+import socket
+import time
+
+# A PI cannot be longer than this (cf. ProcessingInstruction.PI_regex)
+MAX_PI_LENGTH = 4096
+PI_START = b'<?scscp'
+PI_END = b'?>'
+_WHITESPACE = b' \t\n\r\f\v'
+_NON_WHITESPACE = re.compile(b'\\S')
+
+# Pre-encoded PIs framing a message
+START = b'<?scscp start ?>\n'
+END = b'\n<?scscp end ?>\n'
+CANCEL = b'\n<?scscp cancel ?>\n'
+
+# Payloads smaller than this are copied out of the buffer, larger
+# ones are handed out without copying.
+_STEAL_THRESHOLD = 1 << 16
+
+
+class TIMEOUT(Exception):
+    """ No PI was received in time """
+    pass
+
+
+class EOF(Exception):
+    """ The other end closed the stream """
+    pass
+
+
+class PIFramer(object):
+    """
+    A sans-IO splitter of an SCSCP byte stream into processing instructions.
+
+    Data is appended with ``feed()``, complete PIs are extracted with
+    ``next_PI()``. Bytes are buffered in a single ``bytearray``, and
+    scanning for PIs resumes where the previous scan stopped.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._start = 0         # first unconsumed byte
+        self._scan = 0          # where to resume scanning for PI_START
+
+    def __len__(self):
+        """ Number of buffered, unconsumed bytes """
+        return len(self._buf) - self._start
+
+    def has_data(self):
+        """ Whether anything but whitespace is buffered and unconsumed """
+        return _NON_WHITESPACE.search(self._buf, self._start) is not None
+
+    def feed(self, data):
+        """ Append data received from the stream """
+        if self._start and self._start == len(self._buf):
+            # everything was consumed: reset the buffer for free
+            del self._buf[:]
+            self._scan -= self._start
+            self._start = 0
+        elif self._start > _STEAL_THRESHOLD and self._start > len(self._buf) // 2:
+            del self._buf[:self._start]
+            self._scan -= self._start
+            self._start = 0
+        self._buf += data
+
+    def _find_PI(self):
+        """ Locate the next complete PI, returns its bounds or None """
+        buf = self._buf
+        while True:
+            i = buf.find(PI_START, self._scan)
+            if i < 0:
+                # Keep the tail, it may be the beginning of a PI
+                self._scan = max(self._scan, len(buf) - len(PI_START) + 1)
+                return None
+            self._scan = i
+            k = i + len(PI_START)
+            if k >= len(buf):
+                return None
+            if buf[k] not in _WHITESPACE:
+                self._scan = i + 1
+                continue
+            j = buf.find(PI_END, k + 1, i + MAX_PI_LENGTH)
+            if j >= 0:
+                return i, j + len(PI_END)
+            if len(buf) < i + MAX_PI_LENGTH:
+                return None
+            # Too long to be a PI, skip
+            self._scan = i + 1
+
+    def next_PI(self):
+        """
+        Extract the next complete PI from the buffer.
+
+        Returns ``None`` if no complete PI is buffered yet, otherwise
+        returns a pair ``(before, pi)``, where ``pi`` are the bytes of
+        the PI, and ``before`` is a ``bytearray`` holding the payload
+        between the previous PI and this one.
+        """
+        bounds = self._find_PI()
+        if bounds is None:
+            return None
+        i, j = bounds
+        buf = self._buf
+        pi = bytes(buf[i:j])
+        if i - self._start >= _STEAL_THRESHOLD:
+            # Hand out the buffer itself, keep a copy of what follows
+            self._buf = buf[j:]
+            del buf[i:]
+            del buf[:self._start]
+            before = buf
+            self._start = self._scan = 0
+        else:
+            before = buf[self._start:i]
+            self._start = self._scan = j
+        return before, pi
+
+    def take_payload(self):
+        """
+        Extract the buffered bytes that cannot be part of a PI.
+
+        This allows consuming a payload before the PI that ends it
+        has arrived. Call after ``next_PI()`` returned ``None``.
+        """
+        data = self._buf[self._start:self._scan]
+        self._start = self._scan
+        return data
+
+
+class SocketStream(PIFramer):
+    """
+    A PIFramer reading from a blocking socket.
+
+    The ``timeout`` conventions are the same as pexpect: ``-1`` means
+    the default timeout, ``None`` means wait forever.
+    """
+
+    def __init__(self, socket, timeout=30, chunk_size=1 << 18):
+        super(SocketStream, self).__init__()
+        self.socket = socket
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.before = None
+
+    def read(self, timeout=None):
+        """ Read one chunk from the socket into the buffer """
+        if timeout is not None and not wait_readable(self.socket, timeout):
+            raise TIMEOUT
+        data = self.socket.recv(self.chunk_size)
+        if not data:
+            raise EOF
+        self.feed(data)
+        return len(data)
+
+    def wait_data(self, timeout=None):
+        """
+        Wait at most ``timeout`` seconds (forever if None) for data.
+
+        Returns False if none was buffered or received in time.
+        """
+        return self.has_data() or wait_readable(self.socket, timeout)
+
+    def expect_PI(self, timeout=-1, sink=None):
+        """
+        Wait for the next PI and return its bytes.
+
+        The payload preceding the PI is stored in ``self.before``, or,
+        if ``sink`` is given, passed to it piecewise as it arrives.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frame = self.next_PI()
+            if frame is not None:
+                self.before, pi = frame
+                if sink is not None:
+                    if self.before:
+                        sink(self.before)
+                    self.before = None
+                return pi
+            if sink is not None:
+                data = self.take_payload()
+                if data:
+                    sink(data)
+            self.read(None if deadline is None else deadline - time.monotonic())
+
+
+def wait_readable(sock, timeout):
+    """
+    Wait at most ``timeout`` seconds (forever if None) for ``sock`` to
+    be readable.
+
+    Socket-like objects without a file descriptor (see
+    ``scscp.inprocess``) provide their own ``wait_readable`` method.
+    """
+    if timeout is not None:
+        timeout = max(timeout, 0)
+    wait = getattr(sock, 'wait_readable', None)
+    if wait is not None:
+        return wait(timeout)
+    r, _, _ = select.select([sock], [], [], timeout)
+    return bool(r)
+
+
+def send_frame(sock, *parts):
+    """
+    Send all of ``parts`` on a blocking socket, in one vectored write.
+
+    Unlike ``socket.send``, partial writes are resumed until all data
+    is sent.
+    """
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(parts))
+        return
+    parts = [memoryview(p).cast('B') for p in parts if len(p)]
+    while parts:
+        sent = sock.sendmsg(parts)
+        while sent:
+            if sent >= len(parts[0]):
+                sent -= len(parts.pop(0))
+            else:
+                parts[0] = parts[0][sent:]
+                sent = 0
+
+
+def set_keepalive(sock, keepalive=True):
+    """
+    Enable TCP keepalive on TCP sockets, do nothing on other sockets.
+
+    ``keepalive`` is True for the timings of the system, or a triple
+    ``(idle, interval, count)``: probes are sent after ``idle`` seconds
+    without traffic, every ``interval`` seconds, and the connection is
+    dropped after ``count`` unanswered probes (where supported).
+    """
+    if not keepalive or getattr(sock, 'family', None) not in (socket.AF_INET, socket.AF_INET6):
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if keepalive is not True:
+        # TCP_KEEPALIVE is TCP_KEEPIDLE on macOS
+        idle = getattr(socket, 'TCP_KEEPIDLE', getattr(socket, 'TCP_KEEPALIVE', None))
+        for option, value in zip((idle, getattr(socket, 'TCP_KEEPINTVL', None),
+                                  getattr(socket, 'TCP_KEEPCNT', None)), keepalive):
+            if option is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, option, int(value))
+
+
+def set_nodelay(sock, nodelay=True):
+    """ Set ``TCP_NODELAY`` on TCP sockets, do nothing on other sockets """
+    if getattr(sock, 'family', None) in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(nodelay))
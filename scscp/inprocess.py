@@ -0,0 +1,133 @@
+"""
+An in-process transport between SCSCP clients and request handlers.
+
+``InProcessServer`` runs request handlers in threads of the current
+process, on connections made of two ``MemorySocket`` objects instead
+of operating system sockets: sending a message appends it to the
+buffer of the other end, without any system call. It is meant for
+embedding a server in an application, and for testing::
+
+    server = InProcessServer(RequestHandlerClass=MyHandler)
+    client = SCSCPCLI(sock=server.connect())
+"""
+
+import itertools
+import socket
+import threading
+
+from .socketserver import SCSCPServerMixin, SCSCPServerRequestHandler
+
+
+class MemorySocket(object):
+    """
+    One end of an in-memory byte stream, with the methods of a
+    blocking socket used by the SCSCP peers.
+    """
+
+    family = None
+
+    def __init__(self, cond):
+        self._cond = cond
+        self._buf = bytearray()
+        self._eof = False       # nothing more will be received
+        self._closed = False
+        self.peer = None
+
+    @classmethod
+    def pair(cls):
+        """ Two connected ends """
+        cond = threading.Condition()
+        a, b = cls(cond), cls(cond)
+        a.peer, b.peer = b, a
+        return a, b
+
+    def sendall(self, data):
+        with self._cond:
+            if self._closed:
+                raise OSError("Socket closed.")
+            if self.peer._closed or self.peer._eof:
+                raise BrokenPipeError("Connection closed by peer.")
+            self.peer._buf += data
+            self._cond.notify_all()
+
+    def recv(self, size):
+        with self._cond:
+            self._cond.wait_for(lambda: self._buf or self._eof or self._closed)
+            if self._closed:
+                raise OSError("Socket closed.")
+            data = bytes(self._buf[:size])
+            del self._buf[:size]
+            return data
+
+    def wait_readable(self, timeout):
+        """ Wait at most ``timeout`` seconds for data or the end of the stream """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._buf or self._eof or self._closed, timeout)
+
+    def shutdown(self, how):
+        with self._cond:
+            if how in (socket.SHUT_RD, socket.SHUT_RDWR):
+                self._eof = True
+            if how in (socket.SHUT_WR, socket.SHUT_RDWR):
+                self.peer._eof = True
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = self._eof = True
+            self.peer._eof = True
+            self._cond.notify_all()
+
+
+class InProcessServer(SCSCPServerMixin):
+    """
+    An SCSCP server whose clients connect from the same process.
+
+    ``connect()`` returns the client end of a new connection, served by
+    an instance of ``RequestHandlerClass`` in a thread of its own. The
+    other parameters are as for ``scscp.socketserver.SCSCPSocketServer``.
+    """
+
+    def __init__(self, logger=None, name=b'InProcessServer', version=b'none',
+                 description='In-process SCSCP server', RequestHandlerClass=SCSCPServerRequestHandler,
+                 workers=None, session_store_size=1 << 26, persistent_store=None,
+                 result_cache=None, metrics=None, admission=None,
+                 idle_timeout=None, session_lifetime=None):
+        self.RequestHandlerClass = RequestHandlerClass
+        self._ids = itertools.count(1)
+        self._threads = set()
+        self._setup(logger, name, version, description, workers,
+                    session_store_size, persistent_store, result_cache, metrics, admission,
+                    idle_timeout, session_lifetime, keepalive=False)
+
+    def connect(self):
+        """ Open a connection, and return its client end """
+        client, request = MemorySocket.pair()
+        client_address = ('in-process', next(self._ids))
+        if not self.admission.open_connection():
+            self._reject_connection(request.sendall)
+            request.close()
+            return client
+        thread = threading.Thread(target=self._serve, args=(request, client_address),
+                                  name='scscp-in-process-%d' % client_address[1])
+        thread.daemon = True
+        self._threads.add(thread)
+        thread.start()
+        return client
+
+    def _serve(self, request, client_address):
+        try:
+            self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.log.exception("Error on connection %s:%d." % client_address)
+        finally:
+            request.close()
+            self.admission.close_connection()
+            self._threads.discard(threading.current_thread())
+
+    def close(self, timeout=None):
+        """ Close the connections, see ``drain``, and release the resources """
+        self.drain(timeout)
+        for thread in list(self._threads):
+            thread.join()
+        self._close()
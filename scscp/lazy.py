@@ -0,0 +1,273 @@
+"""
+Header-only decoding of SCSCP procedure messages.
+
+``LazyProcedureMessage`` reads the type, the call id and the options of
+an encoded procedure message, and the head of a procedure call,
+without decoding its data. The data is kept as an undecoded slice of
+the message, and decoded on first access, so that dispatchers, caches
+and proxies can route messages without building their argument trees.
+"""
+
+import re
+from openmath import openmath as om, encoder
+
+from . import binary
+from .scscp import SCSCPProtocolError, SCSCPProcedureMessage
+
+_XML_HEAD = re.compile(br'\s*(?:<\?xml[^>]*\?>\s*)?(<OMOBJ\b[^>]*>)\s*<OMATTR>\s*<OMATP>')
+_XML_PAIRS_END = b'</OMATP>'
+_XML_SYMBOL = re.compile(br'\s*<OMA\b[^>]*>\s*<OMS\s([^>]*?)/>')
+_XML_TAIL = re.compile(br'</OMA>\s*</OMATTR>\s*</OMOBJ>\s*$')
+_XML_ATTR = re.compile(br'''(\w+)\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+
+_BINARY_TAIL = bytes((binary.APPLICATION_END, binary.ATTRIBUTION_END, binary.OBJECT_END))
+
+_UNDECODED = object()
+
+
+def decode_xml(msg):
+    """
+    Same as ``openmath.decoder.decode_bytes``, which is imported on
+    first use: it loads ``pkg_resources``, which takes longer than the
+    rest of the package.
+    """
+    from openmath import decoder
+    return decoder.decode_bytes(msg)
+
+
+def _escape(s):
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+_ENCODERS = {
+    'xml'    : encoder.encode_bytes,
+    'binary' : binary.encode_bytes,
+}
+
+# How a string is encoded inside an object
+_STRING_ENCODERS = {
+    'xml'    : lambda s: b'<OMSTR>' + _escape(s).encode('ascii', 'xmlcharrefreplace') + b'</OMSTR>',
+    'binary' : lambda s: binary.encode_bytes(om.OMString(s)),
+}
+
+_PLACEHOLDER = 'scscp-placeholder-d1c4f2'
+
+
+def encode_string(encoding, s):
+    """ The encoding of ``OMString(s)`` inside an encoded object """
+    return _STRING_ENCODERS[encoding](s)
+
+
+def split_encoding(encoding, obj, placeholder=_PLACEHOLDER):
+    """
+    Encode ``obj``, which contains ``OMString(placeholder)`` once, and
+    return the pair of bytes around the placeholder, or None if the
+    placeholder is not found as expected.
+    """
+    parts = _ENCODERS[encoding](obj).split(encode_string(encoding, placeholder))
+    return tuple(parts) if len(parts) == 2 else None
+
+
+class _Fallback(Exception):
+    """ The message is not laid out as expected """
+    pass
+
+
+def _xml_symbol(attrs):
+    attrs = dict((k.decode(), (v1 or v2).decode()) for k, v1, v2 in _XML_ATTR.findall(attrs))
+    if 'name' not in attrs or 'cd' not in attrs:
+        raise _Fallback
+    return om.OMSymbol(attrs['name'], attrs['cd'])
+
+
+class LazyProcedureMessage(object):
+    """
+    An SCSCP procedure message, decoded lazily from its encoding.
+
+    It has the same ``type``, ``id``, ``params`` and ``data``
+    attributes as ``SCSCPProcedureMessage``, ``data`` being decoded on
+    first access. ``head`` is the head symbol of a procedure call (or
+    None), ``raw`` the original encoding of the message and
+    ``payload`` the undecoded encoding of its data.
+    """
+
+    __slots__ = ('type', 'id', 'params', 'encoding', 'raw', 'payload', '_root', '_head', '_data')
+
+    def __init__(self, type, id, params, encoding, raw, payload=None, root=None, head=None,
+                 data=_UNDECODED):
+        self.type = type
+        self.id = id
+        self.params = params
+        self.encoding = encoding
+        self.raw = raw
+        self.payload = payload
+        self._root = root
+        self._head = head
+        self._data = data
+
+    @classmethod
+    def from_bytes(cls, msg, encoding='xml'):
+        """ Read the header of an encoded procedure message """
+        try:
+            if encoding == 'xml':
+                return cls._from_xml(msg)
+            elif encoding == 'binary':
+                return cls._from_binary(msg)
+            raise ValueError("Unknown encoding %s." % encoding)
+        except (_Fallback, binary.BinaryDecodeError, IndexError):
+            obj = (binary.decode_bytes if encoding == 'binary' else decode_xml)(msg)
+            full = SCSCPProcedureMessage.from_om(obj)
+            return cls(full.type, full.id, full.params, encoding, msg, data=full.data)
+
+    @staticmethod
+    def _split_pairs(pairs, obj):
+        """ Separate the call id from the other attribution pairs """
+        params = []
+        id = None
+        for k, v in pairs:
+            if id is None and k.name == 'call_id' and k.cd == 'scscp1':
+                if not isinstance(v, om.OMString):
+                    raise SCSCPProtocolError('Bad SCSCP procedure message.', obj)
+                id = v.string
+            else:
+                params.append((k, v))
+        if id is None:
+            raise SCSCPProtocolError('SCSCP procedure message does not contain id.', obj)
+        return id, params
+
+    @classmethod
+    def _from_xml(cls, msg):
+        msg = bytes(msg)
+        match = _XML_HEAD.match(msg)
+        if match is None:
+            raise _Fallback
+        root = match.group(1)
+        end = msg.find(_XML_PAIRS_END, match.end())
+        if end < 0 or b'<OMATP' in msg[match.end():end]:
+            raise _Fallback
+        header = decode_xml(root + b'<OMATTR><OMATP>' + msg[match.end():end]
+                            + b'</OMATP><OMI>0</OMI></OMATTR></OMOBJ>')
+        id, params = cls._split_pairs(header.omel.pairs.pairs, header)
+
+        match = _XML_SYMBOL.match(msg, end + len(_XML_PAIRS_END))
+        if match is None:
+            raise _Fallback
+        type = _xml_symbol(match.group(1))
+        if type.cd != 'scscp1':
+            raise SCSCPProtocolError('Bad SCSCP procedure message.', header)
+
+        tail = _XML_TAIL.search(msg, max(match.end(), len(msg) - 256))
+        if tail is None:
+            raise _Fallback
+        payload = memoryview(msg)[match.end():tail.start()]
+
+        head = _XML_SYMBOL.match(msg, match.end(), tail.start())
+        head = _xml_symbol(head.group(1)) if head is not None else None
+        return cls(type.name, id, params, 'xml', msg, payload, root, head)
+
+    @classmethod
+    def _from_binary(cls, msg):
+        raw = msg
+        if binary._ESC in msg:
+            msg = msg.replace(binary._ESC_LT, b'<').replace(binary._ESC_ESC, binary._ESC)
+        msg = bytes(msg).strip(binary._WHITESPACE)
+        if not msg.endswith(_BINARY_TAIL):
+            raise _Fallback
+        d = binary._Decoder(memoryview(msg))
+        if d.byte() != binary.OBJECT:
+            raise _Fallback
+        d.str()
+        if d.byte() != binary.ATTRIBUTION:
+            raise _Fallback
+        pairs = d.object()
+        if not isinstance(pairs, om.OMAttributionPairs):
+            raise _Fallback
+        id, params = cls._split_pairs(pairs.pairs, pairs)
+        if d.byte() != binary.APPLICATION:
+            raise _Fallback
+        type = d.object()
+        if not isinstance(type, om.OMSymbol) or type.cd != 'scscp1':
+            raise SCSCPProtocolError('Bad SCSCP procedure message.', type)
+        payload = d.data[d.pos:len(msg) - len(_BINARY_TAIL)]
+
+        head = None
+        d = binary._Decoder(payload)
+        token = d.byte()
+        if token & binary._TOKEN_MASK == binary.APPLICATION:
+            if token & binary.FLAG_CDBASE:
+                d.str()
+            if token & binary.FLAG_ID:
+                d.str()
+            if d.peek() is not None and d.peek() & binary._TOKEN_MASK == binary.SYMBOL:
+                head = d.object()
+        return cls(type.name, id, params, 'binary', raw, payload, head=head)
+
+    @property
+    def data(self):
+        if self._data is _UNDECODED:
+            if self.encoding == 'binary':
+                d = binary._Decoder(self.payload)
+                data = d.object()
+                if d.pos != len(self.payload):
+                    raise binary.BinaryDecodeError("Trailing data after binary OpenMath object.")
+            else:
+                data = decode_xml(self._root + bytes(self.payload) + b'</OMOBJ>').omel
+            self._data = data
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._head = None
+        self.payload = None
+
+    @property
+    def decoded(self):
+        """ Whether the data has been decoded """
+        return self._data is not _UNDECODED
+
+    @property
+    def head(self):
+        """ The head symbol of a procedure call, or None """
+        if self._head is None and self.decoded and isinstance(self._data, om.OMApplication):
+            return self._data.elem
+        return self._head
+
+    def encode(self, encoding, id=None):
+        """
+        The encoding of this message, with call id ``id`` if given.
+
+        The data is not decoded if it is already in ``encoding``: the
+        original bytes are returned if the id is unchanged, otherwise
+        the payload is spliced into a new header.
+        """
+        id = self.id if id is None else id
+        if self.payload is not None and encoding == self.encoding:
+            if id == self.id:
+                return self.raw
+            header = SCSCPProcedureMessage(self.type, om.OMString(_PLACEHOLDER), id, self.params)
+            parts = split_encoding(encoding, header.om())
+            if parts is not None:
+                payload = bytes(self.payload)
+                if encoding == 'binary':
+                    payload = binary.escape(payload)
+                return parts[0] + payload + parts[1]
+        return _ENCODERS[encoding](SCSCPProcedureMessage(self.type, self.data, id, self.params).om())
+
+    def option(self, name, default=None):
+        """ The value of the ``option_<name>`` parameter, if any """
+        return SCSCPProcedureMessage.option(self, name, default)
+
+    def message(self):
+        """ The equivalent (fully decoded) ``SCSCPProcedureMessage`` """
+        return SCSCPProcedureMessage(self.type, self.data, self.id, self.params)
+
+    def om(self):
+        return self.message().om()
+
+    def __repr__(self):
+        return "LazyProcedureMessage %s#%s" % (self.type, self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyProcedureMessage):
+            other = other.message()
+        return self.message() == other
@@ -0,0 +1,185 @@
+"""
+Instrumentation of SCSCP peers and servers.
+
+A ``Metrics`` object counts procedure calls and errors per head, with
+latency histograms, and the bytes and time spent sending, receiving,
+encoding and decoding messages. Peers and servers only record metrics
+if their ``metrics`` attribute is set, so that instrumentation costs
+nothing when disabled.
+
+Metrics are exported as a dictionary (``snapshot()``), or in the
+Prometheus text exposition format (``prometheus()``).
+"""
+
+import threading
+from bisect import bisect_left
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, float('inf'))
+
+
+class Histogram(object):
+    """ A histogram of durations, with Prometheus-style buckets """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ The pairs ``(upper bound, number of values below it)`` """
+        total = 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            yield bound, total
+
+    def snapshot(self):
+        return {'buckets': list(self.cumulative()), 'sum': self.sum, 'count': self.count}
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')
+                                 .replace('\n', '\\n'))
+                    for k, v in sorted(labels.items()))
+
+
+def _bound(b):
+    return '+Inf' if b == float('inf') else repr(b)
+
+
+class Metrics(object):
+    """
+    Thread-safe counters of an SCSCP peer or server.
+
+    Calls are recorded by ``(cd, head)``, codec operations by
+    ``(operation, encoding)``, where the operation is ``encode`` or
+    ``decode``.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.errors = {}
+        self.latency = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.codec_seconds = {}
+        self.codec_bytes = {}
+        self.codec_count = {}
+        self._gauges = []
+
+    def record_call(self, cd, head, seconds, error=False):
+        """ Account for a procedure call handled in ``seconds`` """
+        key = (cd, head)
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + 1
+            hist = self.latency.get(key)
+            if hist is None:
+                hist = self.latency[key] = Histogram(self._buckets)
+            hist.observe(seconds)
+
+    def record_sent(self, nbytes):
+        with self._lock:
+            self.bytes_sent += nbytes
+            self.messages_sent += 1
+
+    def record_received(self, nbytes):
+        with self._lock:
+            self.bytes_received += nbytes
+            self.messages_received += 1
+
+    def record_codec(self, operation, encoding, seconds, nbytes):
+        """ Account for encoding or decoding ``nbytes`` in ``seconds`` """
+        key = (operation, encoding)
+        with self._lock:
+            self.codec_seconds[key] = self.codec_seconds.get(key, 0.0) + seconds
+            self.codec_bytes[key] = self.codec_bytes.get(key, 0) + nbytes
+            self.codec_count[key] = self.codec_count.get(key, 0) + 1
+
+    def add_gauges(self, prefix, collect):
+        """
+        Export the values of ``collect()``, a dictionary of numbers, as
+        gauges named ``<prefix>_<key>``
+        """
+        self._gauges.append((prefix, collect))
+
+    def gauges(self):
+        return dict(('%s_%s' % (prefix, k), v)
+                    for prefix, collect in self._gauges for k, v in collect().items())
+
+    def snapshot(self):
+        """ The current values, as a dictionary """
+        gauges = self.gauges()
+        with self._lock:
+            return {
+                'gauges': gauges,
+                'calls': [{'cd': cd, 'head': head, 'count': n,
+                           'errors': self.errors.get((cd, head), 0),
+                           'latency': self.latency[cd, head].snapshot()}
+                          for (cd, head), n in sorted(self.calls.items())],
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'messages_sent': self.messages_sent,
+                'messages_received': self.messages_received,
+                'codec': [{'operation': op, 'encoding': enc, 'count': n,
+                           'seconds': self.codec_seconds[op, enc],
+                           'bytes': self.codec_bytes[op, enc]}
+                          for (op, enc), n in sorted(self.codec_count.items())],
+            }
+
+    def prometheus(self, prefix='scscp'):
+        """ The current values, in the Prometheus text format """
+        lines = []
+
+        def metric(name, type, help, samples):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, type))
+            for suffix, labels, value in samples:
+                lines.append('%s_%s%s%s %s' % (prefix, name, suffix,
+                                               '{%s}' % labels if labels else '', value))
+
+        for name, value in sorted(self.gauges().items()):
+            metric(name, 'gauge', 'Current value of %s.' % name, [('', '', value)])
+        with self._lock:
+            metric('calls_total', 'counter', 'Procedure calls handled.',
+                   [('', _labels(cd=cd, head=head), n)
+                    for (cd, head), n in sorted(self.calls.items())])
+            metric('call_errors_total', 'counter', 'Procedure calls terminated with an error.',
+                   [('', _labels(cd=cd, head=head), self.errors.get((cd, head), 0))
+                    for (cd, head) in sorted(self.calls)])
+            samples = []
+            for (cd, head), hist in sorted(self.latency.items()):
+                for bound, n in hist.cumulative():
+                    samples.append(('_bucket', _labels(cd=cd, head=head, le=_bound(bound)), n))
+                samples.append(('_sum', _labels(cd=cd, head=head), repr(hist.sum)))
+                samples.append(('_count', _labels(cd=cd, head=head), hist.count))
+            metric('call_duration_seconds', 'histogram', 'Time to handle procedure calls.', samples)
+            metric('sent_bytes_total', 'counter', 'Bytes of messages sent.',
+                   [('', '', self.bytes_sent)])
+            metric('received_bytes_total', 'counter', 'Bytes of messages received.',
+                   [('', '', self.bytes_received)])
+            metric('sent_messages_total', 'counter', 'Messages sent.',
+                   [('', '', self.messages_sent)])
+            metric('received_messages_total', 'counter', 'Messages received.',
+                   [('', '', self.messages_received)])
+            metric('codec_seconds_total', 'counter', 'Time spent encoding and decoding messages.',
+                   [('', _labels(operation=op, encoding=enc), repr(s))
+                    for (op, enc), s in sorted(self.codec_seconds.items())])
+            metric('codec_bytes_total', 'counter', 'Bytes encoded and decoded.',
+                   [('', _labels(operation=op, encoding=enc), n)
+                    for (op, enc), n in sorted(self.codec_bytes.items())])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,422 @@
+"""
+A pool of SCSCP client sessions.
+
+``SCSCPPool`` keeps sessions to one or more servers connected, with
+the handshake and the discovery of the heads done, and lends them to
+threads for a few calls::
+
+    pool = SCSCPPool([('host1', 26133), ('host2', 26133)], min_idle=4)
+    with pool.session() as client:
+        client.heads.arith1.plus([1, 2])
+
+Sessions are checked before they are lent, and by a maintenance
+thread: closed sessions, sessions failing their health check, and
+sessions idle or open for too long are discarded, and new ones opened
+to keep ``min_idle`` of them ready.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .cli import SCSCPCLI
+from .client import TimeoutError, CONNECTED
+from .scscp import SCSCPError, SCSCPConnectionError, SCSCPQuit
+
+# Errors after which a session cannot be used anymore
+_BROKEN = (OSError, TimeoutError, SCSCPConnectionError, SCSCPQuit)
+
+
+def _quit(client):
+    try:
+        client.quit()
+    except Exception:
+        pass
+
+
+def is_alive(client):
+    """ The default health check: a cheap ``is_allowed_head`` call """
+    return client.is_allowed_head('is_allowed_head', 'scscp2')
+
+
+class PoolServer(object):
+    """
+    A server of a pool: an address, either a ``(host, port)`` pair or
+    the path of a Unix domain socket, with statistics.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.open = 0
+        self.created = 0
+        self.errors = 0
+        # no connection is attempted before
+        self.down_until = 0
+
+    def __repr__(self):
+        if isinstance(self.address, tuple):
+            return '%s:%d' % self.address
+        return self.address
+
+    def connect(self, client_class, **kwds):
+        """ A new connected client """
+        if isinstance(self.address, tuple):
+            return client_class(*self.address, **kwds)
+        return client_class(path=self.address, **kwds)
+
+    def stats(self):
+        """ Statistics of the server, as a dictionary """
+        return {
+            'address' : repr(self),
+            'healthy' : self.down_until <= time.monotonic(),
+            'open'    : self.open,
+            'created' : self.created,
+            'errors'  : self.errors,
+        }
+
+
+class _Session(object):
+    """ A client of the pool, with its server and its times """
+
+    def __init__(self, client, server):
+        self.client = client
+        self.server = server
+        self.created = self.used = time.monotonic()
+
+
+class SCSCPPool(object):
+    """
+    A thread-safe pool of ``SCSCPCLI`` sessions.
+
+    ``servers`` are ``(host, port)`` pairs, paths of Unix domain
+    sockets, or ``PoolServer`` objects. New sessions are opened to the
+    server with the fewest sessions; a server that cannot be connected
+    to is not tried again for ``retry_interval`` seconds. The other
+    keyword arguments are passed to ``client_class``, e.g.
+    ``encoding`` or ``heads_cache``.
+
+    At most ``max_size`` sessions are open at once, and ``min_idle``
+    are kept ready to be lent. Sessions open for ``max_lifetime``
+    seconds are closed, and so are sessions idle for ``max_idle``
+    seconds, beyond the ``min_idle`` ones. Sessions idle for
+    ``check_interval`` seconds are checked by ``health_check`` (a
+    function of the client, returning whether it is usable) before
+    they are lent, and by the maintenance thread which runs every
+    ``check_interval`` seconds, unless it is None.
+    """
+
+    def __init__(self, servers, min_idle=2, max_size=10, max_idle=300, max_lifetime=None,
+                 check_interval=30, health_check=is_alive, timeout=30, retry_interval=5,
+                 client_class=SCSCPCLI, logger=None, **kwds):
+        self.servers = [s if isinstance(s, PoolServer) else PoolServer(s) for s in servers]
+        if not self.servers:
+            raise ValueError("No server.")
+        self.min_idle = min_idle
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self.health_check = health_check
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.client_class = client_class
+        self.client_options = kwds
+        self.log = logger or logging.getLogger(__name__)
+
+        # statistics
+        self.checkouts = 0
+        self.waits = 0
+        self.created = 0
+        self.closed = 0
+        self.failed_checks = 0
+
+        # idle sessions, the most recently used last
+        self._idle = deque()
+        self._in_use = {}
+        # sessions open or being opened
+        self._open = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._turn = itertools.count()
+
+        self.fill()
+        self._stop = threading.Event()
+        self._maintainer = None
+        if check_interval is not None:
+            self._maintainer = threading.Thread(target=self._maintain_loop, name='scscp-pool')
+            self._maintainer.daemon = True
+            self._maintainer.start()
+
+    ### Lending
+
+    def checkout(self, timeout=-1):
+        """
+        Borrow a connected client, waiting at most ``timeout`` seconds
+        (the default timeout if -1, forever if None) for one if
+        ``max_size`` sessions are in use. It must be given back by
+        ``checkin``, see also ``session``.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            session, connect = self._take(deadline)
+            if connect:
+                session = self._open_session()
+                with self._cond:
+                    self._in_use[id(session.client)] = session
+                    self.checkouts += 1
+                return session.client
+            if not self._stale(session, time.monotonic()) or self._check(session):
+                with self._cond:
+                    self.checkouts += 1
+                return session.client
+            with self._cond:
+                del self._in_use[id(session.client)]
+            self._discard(session)
+
+    def _take(self, deadline):
+        """
+        Take an idle session, marked in use, or reserve a new one:
+        returns ``(session, False)`` or ``(None, True)``
+        """
+        broken = []
+        try:
+            with self._cond:
+                waited = False
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Pool closed.")
+                    now = time.monotonic()
+                    while self._idle:
+                        session = self._idle.pop()
+                        if self._usable(session, now):
+                            self._in_use[id(session.client)] = session
+                            return session, False
+                        self._forget(session)
+                        broken.append(session)
+                    if self._open < self.max_size:
+                        self._open += 1
+                        return None, True
+                    remaining = None if deadline is None else deadline - now
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("No session available in the pool.")
+                    if not waited:
+                        self.waits += 1
+                        waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+        finally:
+            for session in broken:
+                _quit(session.client)
+
+    def checkin(self, client, discard=False):
+        """ Give back a client, discarding it if ``discard`` or if it is not usable """
+        with self._cond:
+            session = self._in_use.pop(id(client))
+            now = time.monotonic()
+            if not discard and not self._closed and self._usable(session, now):
+                session.used = now
+                self._idle.append(session)
+                self._cond.notify()
+                return
+        self._discard(session)
+
+    @contextmanager
+    def session(self, timeout=-1):
+        """
+        Borrow a client for the duration of a ``with`` block. It is
+        discarded if the block raises a connection error or a timeout.
+        """
+        client = self.checkout(timeout)
+        discard = True
+        try:
+            yield client
+            discard = False
+        except _BROKEN:
+            raise
+        except Exception:
+            discard = False
+            raise
+        finally:
+            self.checkin(client, discard)
+
+    ### Sessions
+
+    def _usable(self, session, now):
+        """ Whether a session is connected, not expired, and not closing """
+        client = session.client
+        if client.status != CONNECTED:
+            return False
+        if self.max_lifetime is not None and now - session.created > self.max_lifetime:
+            return False
+        # nothing is expected from the server, but a quit message
+        return not client.stream.wait_data(0)
+
+    def _stale(self, session, now):
+        """ Whether a session is due for a health check """
+        return self.check_interval is not None and now - session.used > self.check_interval
+
+    def _check(self, session):
+        """ Run the health check of a session """
+        try:
+            if self.health_check is None or self.health_check(session.client):
+                session.used = time.monotonic()
+                return True
+            self.log.warning("Session to %s failed health check." % session.server)
+        except Exception as e:
+            self.log.warning("Session to %s failed health check: %s" % (session.server, e))
+        with self._cond:
+            self.failed_checks += 1
+        return False
+
+    def _choose(self):
+        """ The servers to connect to, in order of preference """
+        now = time.monotonic()
+        up = [s for s in self.servers if s.down_until <= now]
+        # rotate, so that ties are broken in turn
+        i = next(self._turn) % len(self.servers)
+        rotated = self.servers[i:] + self.servers[:i]
+        return (sorted((s for s in rotated if s in up), key=lambda s: s.open)
+                + [s for s in rotated if s not in up])
+
+    def _open_session(self):
+        """ Open a session, counted in ``_open`` already """
+        error = None
+        for server in self._choose():
+            try:
+                client = server.connect(self.client_class, **self.client_options)
+            except (OSError, SCSCPError, TimeoutError) as e:
+                self.log.warning("Cannot connect to %s: %s" % (server, e))
+                error = e
+                with self._cond:
+                    server.errors += 1
+                    server.down_until = time.monotonic() + self.retry_interval
+                continue
+            with self._cond:
+                server.open += 1
+                server.created += 1
+                server.down_until = 0
+                self.created += 1
+            return _Session(client, server)
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+        raise error
+
+    def _forget(self, session):
+        """ Free the place of a session, with the lock held """
+        self._open -= 1
+        session.server.open -= 1
+        self.closed += 1
+        self._cond.notify()
+
+    def _discard(self, session):
+        """ Close a session, and free its place """
+        with self._cond:
+            self._forget(session)
+        _quit(session.client)
+
+    ### Maintenance
+
+    def fill(self):
+        """ Open sessions until ``min_idle`` are idle, or ``max_size`` open """
+        while True:
+            with self._cond:
+                if (self._closed or len(self._idle) >= self.min_idle
+                        or self._open >= self.max_size):
+                    return
+                self._open += 1
+            try:
+                session = self._open_session()
+            except (OSError, SCSCPError, TimeoutError):
+                return
+            with self._cond:
+                if not self._closed:
+                    self._idle.append(session)
+                    self._cond.notify()
+                    continue
+            self._discard(session)
+
+    def maintain(self):
+        """
+        Discard the idle sessions that are broken, expired, idle for
+        too long, or fail their health check, then ``fill`` the pool
+        """
+        now = time.monotonic()
+        discard, check = [], []
+        with self._cond:
+            idle = len(self._idle)
+            # the least recently used first
+            for session in list(self._idle):
+                if not self._usable(session, now):
+                    discard.append(session)
+                elif now - session.used > self.max_idle and idle > self.min_idle:
+                    discard.append(session)
+                elif self._stale(session, now):
+                    check.append(session)
+                else:
+                    continue
+                self._idle.remove(session)
+                idle -= 1
+        for session in discard:
+            self._discard(session)
+        for session in check:
+            if self._check(session):
+                with self._cond:
+                    if not self._closed:
+                        self._idle.appendleft(session)
+                        continue
+            self._discard(session)
+        self.fill()
+
+    def _maintain_loop(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.maintain()
+            except Exception:
+                self.log.exception("Error in pool maintenance.")
+
+    def stats(self):
+        """ Statistics of the pool, as a dictionary """
+        with self._cond:
+            return {
+                'open'          : self._open,
+                'idle'          : len(self._idle),
+                'in_use'        : len(self._in_use),
+                'waiting'       : self._waiting,
+                'checkouts'     : self.checkouts,
+                'waits'         : self.waits,
+                'created'       : self.created,
+                'closed'        : self.closed,
+                'failed_checks' : self.failed_checks,
+                'servers'       : [s.stats() for s in self.servers],
+            }
+
+    def close(self):
+        """
+        Close the idle sessions, and stop the maintenance. The sessions
+        in use are closed when they are given back.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        self._stop.set()
+        if self._maintainer is not None and self._maintainer is not threading.current_thread():
+            self._maintainer.join()
+        for session in idle:
+            self._discard(session)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
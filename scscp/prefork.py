@@ -0,0 +1,202 @@
+"""
+A pre-forking SCSCP server.
+
+``PreforkServer`` runs an ``SCSCPSocketServer`` in several worker
+processes sharing the same port, so that request handlers running
+Python code use several cores. The master process supervises the
+workers: it restarts those that exit, either because they crashed, or
+because they were recycled after a number of calls; and it shuts them
+all down gracefully::
+
+    server = PreforkServer(MyServer, processes=4, max_calls_per_process=10000, port=26133)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    server.serve_forever()
+    server.server_close()
+"""
+
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+
+from .socketserver import SCSCPSocketServer
+
+# A worker exiting sooner than this after its start is restarted late
+MIN_LIFETIME = 1.0
+
+
+class PreforkServer(object):
+    """
+    A master process forking ``processes`` instances of ``server_class``.
+
+    ``server_class`` is built once, with the keyword arguments ``kwds``,
+    before the workers are forked. By default, the workers inherit its
+    listening socket. If ``reuse_port`` is True, each worker listens on
+    a socket of its own with ``SO_REUSEPORT``, and the kernel spreads
+    the connections among them (Linux, BSD).
+
+    A worker is recycled once it has answered ``max_calls_per_process``
+    calls: it stops accepting connections, closes those it has with a
+    ``quit`` message once they are idle, and exits. When shutting down,
+    the workers let the calls in flight complete, for at most ``grace``
+    seconds.
+
+    Admission bounds, caches and metrics are per worker process. The
+    objects stored with ``store_persistent`` are shared: they are kept
+    in the same directory by all workers.
+    """
+
+    def __init__(self, server_class=SCSCPSocketServer, processes=None,
+                 max_calls_per_process=None, reuse_port=False, grace=30,
+                 logger=None, **kwds):
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise ValueError("SO_REUSEPORT is not supported on this platform.")
+        self.processes = processes or os.cpu_count() or 1
+        self.max_calls_per_process = max_calls_per_process
+        self.reuse_port = reuse_port
+        self.grace = grace
+        self.log = logger or logging.getLogger(__name__)
+        self._context = multiprocessing.get_context('fork')
+
+        self._own_store = kwds.get('persistent_store') is None
+        if self._own_store:
+            kwds['persistent_store'] = tempfile.mkdtemp(prefix='scscp-')
+        kwds['logger'] = kwds.get('logger') or self.log
+
+        # the server of the workers, bound before they are forked
+        self.server = server_class(bind_and_activate=False, **kwds)
+        try:
+            if reuse_port:
+                self.server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.server.server_bind()
+            # with SO_REUSEPORT, this socket only reserves the port
+            if not reuse_port:
+                self.server.server_activate()
+        except:
+            self.server.server_close()
+            raise
+
+        # worker processes, by slot, and their start times
+        self._workers = [None] * self.processes
+        self._started = [0.0] * self.processes
+        self._stop = threading.Event()
+        self.restarts = 0
+
+    @property
+    def server_address(self):
+        return self.server.server_address
+
+    def pids(self):
+        """ The process ids of the running workers """
+        return [p.pid for p in self._workers if p is not None and p.is_alive()]
+
+    def _start_worker(self, slot):
+        process = self._context.Process(target=self._run_worker, name='scscp-worker-%d' % slot)
+        # not a daemon, so that it may have worker processes itself
+        process.start()
+        self._workers[slot] = process
+        self._started[slot] = time.monotonic()
+        self.log.info("Started worker %d (pid %d)." % (slot, process.pid))
+
+    def _listen(self):
+        """ A listening socket for this worker, with SO_REUSEPORT """
+        server = self.server
+        sock = socket.socket(server.address_family, server.socket_type)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(server.server_address)
+            sock.listen(server.request_queue_size)
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def _run_worker(self):
+        """ The main function of the worker processes """
+        stop = threading.Event()
+        # interrupts are handled by the master
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        server = self.server
+        if self.reuse_port:
+            reserved, server.socket = server.socket, self._listen()
+            reserved.close()
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        limit = self.max_calls_per_process
+        while not stop.wait(0.1):
+            if limit is not None and server.admission.served >= limit:
+                self.log.info("Recycling worker after %d calls." % server.admission.served)
+                break
+        server.shutdown()
+        thread.join()
+        server.drain(self.grace)
+        server.server_close()
+
+    def serve_forever(self, poll_interval=0.5):
+        """
+        Start the workers, and restart those that exit, until
+        ``shutdown()`` is called. The workers are then terminated.
+        """
+        for slot in range(self.processes):
+            self._start_worker(slot)
+        try:
+            while not self._stop.is_set():
+                sentinels = dict((p.sentinel, slot) for slot, p in enumerate(self._workers))
+                ready = multiprocessing.connection.wait(list(sentinels), poll_interval)
+                for sentinel in ready:
+                    self._restart(sentinels[sentinel])
+        finally:
+            self._stop_workers()
+
+    def _restart(self, slot):
+        process = self._workers[slot]
+        process.join()
+        if process.exitcode == 0:
+            self.log.info("Worker %d (pid %d) exited." % (slot, process.pid))
+        else:
+            self.log.warning("Worker %d (pid %d) died with code %s."
+                             % (slot, process.pid, process.exitcode))
+        # do not restart workers crashing at start in a loop
+        if time.monotonic() - self._started[slot] < MIN_LIFETIME:
+            self._stop.wait(MIN_LIFETIME)
+        if not self._stop.is_set():
+            self.restarts += 1
+            self._start_worker(slot)
+
+    def _stop_workers(self):
+        workers = [p for p in self._workers if p is not None]
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.grace + 5
+        for process in workers:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                self.log.warning("Killing worker (pid %d)." % process.pid)
+                process.kill()
+                process.join()
+
+    def shutdown(self):
+        """
+        Ask ``serve_forever`` to terminate the workers and return.
+
+        Unlike ``socketserver.BaseServer.shutdown``, it does not wait,
+        so that it may be called from a signal handler.
+        """
+        self._stop.set()
+
+    def server_close(self):
+        self.server.server_close()
+        if self._own_store:
+            shutil.rmtree(self.server.persistent_store.directory, ignore_errors=True)
+
@@ -0,0 +1,351 @@
+"""
+A load-balancing SCSCP proxy.
+
+``SCSCPProxy`` accepts SCSCP clients, and forwards their procedure
+calls to a pool of identical backend servers, over connections opened
+once at start. Calls are read with ``scscp.lazy``: they are forwarded
+byte for byte, only their call id being rewritten so that calls from
+different clients do not collide on a backend connection; the
+``terminate`` messages of clients are forwarded under the rewritten
+call id, and the calls still in flight when a client disconnects are
+terminated on their backend.
+
+Stored objects are not supported: the backends store them on the
+connection they share between all the clients of the proxy, so that
+they would not be found by later calls balanced to other backends,
+and would outlive the clients. Calls with ``option_return_cookie``,
+and calls to ``store_session``, ``store_persistent``, ``retrieve``
+and ``unbind``, are answered by ``procedure_terminated`` with
+``error_system_specific``. Run as::
+
+    python -m scscp.proxy --port 26133 --backend host1:26134 --backend host2:26134
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+
+from .scscp import (SCSCPError, SCSCPQuit, SCSCPCancel, SCSCPTerminate, SCSCPProtocolError,
+                    SCSCPProcedureMessage)
+from . import scscp
+from .aio import AsyncSCSCPClient, AsyncSCSCPServer
+from .client import TimeoutError, CONNECTED
+from .lazy import LazyProcedureMessage
+
+
+# Heads of the object store, see scscp.store
+_STORE_HEADS = frozenset(('store_session', 'store_persistent', 'retrieve', 'unbind'))
+
+
+class BackendClient(AsyncSCSCPClient):
+    """ A connection to a backend, receiving lazily decoded responses """
+
+    async def _next_response(self):
+        return LazyProcedureMessage.from_bytes(await self.receive(timeout=None), self.encoding)
+
+    def forward(self, call, id):
+        """
+        Send a ``LazyProcedureMessage`` under call id ``id``, return a
+        future for the response.
+        """
+        self._assert_connected()
+        fut = asyncio.get_event_loop().create_future()
+        self._pending[id] = fut
+        self.send(call.encode(self.encoding, id))
+        return fut
+
+
+class Backend(object):
+    """
+    A backend server of a proxy, with its statistics.
+
+    ``encoding`` is requested during the handshake; if the backend
+    and a client use different encodings, their messages are decoded
+    and reencoded by the proxy.
+    """
+
+    def __init__(self, host, port=26133, encoding='binary', timeout=30):
+        self.host = host
+        self.port = int(port)
+        self.encoding = encoding
+        self.timeout = timeout
+        self.client = None
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def __repr__(self):
+        return "Backend %s:%d" % (self.host, self.port)
+
+    @property
+    def healthy(self):
+        return self.client is not None and self.client.status == CONNECTED
+
+    async def connect(self, logger=None):
+        """ Open the connection, and do the handshake """
+        self.client = await BackendClient.open(self.host, self.port, self.timeout,
+                                               logger, self.encoding)
+
+    async def close(self):
+        if self.client is not None:
+            client, self.client = self.client, None
+            await client.close()
+
+    def record(self, latency, error=False):
+        """ Account for a forwarded call """
+        self.calls += 1
+        self.errors += bool(error)
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def stats(self):
+        """ Statistics of the backend, as a dictionary """
+        return {
+            'address'      : '%s:%d' % (self.host, self.port),
+            'healthy'      : self.healthy,
+            'outstanding'  : self.outstanding,
+            'calls'        : self.calls,
+            'errors'       : self.errors,
+            'mean_latency' : self.total_latency / self.calls if self.calls else None,
+            'max_latency'  : self.max_latency,
+        }
+
+
+class SCSCPProxy(object):
+    """
+    An asyncio SCSCP proxy, balancing calls between ``backends``.
+
+    ``backends`` are ``Backend`` objects, or ``(host, port)`` pairs.
+    Each call goes to the healthy backend with the fewest outstanding
+    calls. Every ``health_interval`` seconds, backends are sent a
+    ``get_service_description`` call, and disconnected ones are
+    reconnected.
+    """
+
+    def __init__(self, backends, host=None, port=None, logger=None,
+                 name=b'SCSCPProxy', version=b'none', timeout=30,
+                 health_interval=5, backlog=1024):
+
+        # if host is not given, try the HOST environment variable
+        if host is None:
+            host = os.getenv('HOST', 'localhost')
+
+        # if port is not given, try the PORT environment variable
+        if port is None:
+            port = os.getenv('PORT', '26133')
+        port = int(port)
+
+        self.host, self.port = host, port
+        self.backends = [b if isinstance(b, Backend) else Backend(*b, timeout=timeout)
+                         for b in backends]
+        self.log = logger or logging.getLogger(__name__)
+        self.name = name
+        self.version = version
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.backlog = backlog
+        self._ids = itertools.count()
+        self._turn = itertools.count()
+        self._server = None
+        self._health_task = None
+
+    async def start(self):
+        """ Connect to the backends, and start listening """
+        await asyncio.gather(*(self._connect(b) for b in self.backends))
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  backlog=self.backlog)
+        self._health_task = asyncio.ensure_future(self._health_loop())
+
+    @property
+    def server_address(self):
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        """ Start if needed, and serve until cancelled """
+        if self._server is None:
+            await self.start()
+        try:
+            await asyncio.Future()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """ Stop listening, and disconnect from the backends """
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await asyncio.gather(*(b.close() for b in self.backends))
+
+    def stats(self):
+        """ Statistics of the backends """
+        return [b.stats() for b in self.backends]
+
+    def choose(self):
+        """ The healthy backend with the fewest outstanding calls, or None """
+        healthy = [b for b in self.backends if b.healthy]
+        if not healthy:
+            return None
+        # rotate, so that ties are broken in turn
+        i = next(self._turn) % len(healthy)
+        return min(healthy[i:] + healthy[:i], key=lambda b: b.outstanding)
+
+    ### Backends
+
+    async def _connect(self, backend):
+        try:
+            await backend.connect(self.log.getChild('backend'))
+            self.log.info("Connected to %s." % backend)
+        except (OSError, SCSCPError, TimeoutError) as e:
+            self.log.warning("Cannot connect to %s: %s" % (backend, e))
+
+    async def _check(self, backend):
+        if not backend.healthy:
+            await backend.close()
+            return await self._connect(backend)
+        try:
+            resp = await backend.client.call(scscp.get_service_description(), timeout=self.timeout)
+            if resp.type != 'procedure_completed':
+                raise SCSCPProtocolError("Unexpected response %s." % resp.type)
+        except Exception as e:
+            self.log.warning("%s failed health check: %s" % (backend, e))
+            await backend.close()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._check(b) for b in self.backends))
+
+    ### Clients
+
+    async def _handle_connection(self, reader, writer):
+        """ Handles a single new client connection """
+        client_address = writer.get_extra_info('peername') or ('', 0)
+        self.log.info("New connection from %s:%d" % client_address[:2])
+        log = self.log.getChild(client_address[0])
+        session = AsyncSCSCPServer(reader, writer, self.name, self.version, logger=log)
+        tasks = set()
+        # call id of the client -> (backend client, call id on the backend)
+        inflight = {}
+
+        try:
+            await session.accept()
+            while True:
+                try:
+                    call = await session.wait(timeout=None, lazy=True)
+                except SCSCPQuit as e:
+                    log.info(e)
+                    break
+                except ConnectionResetError:
+                    log.info('Client closed unexpectedly.')
+                    break
+                except SCSCPCancel as e:
+                    log.info(e)
+                    continue
+                except SCSCPTerminate as e:
+                    log.info(e)
+                    self._terminate(inflight, e.call_id)
+                    continue
+                if call.type != 'procedure_call':
+                    raise SCSCPProtocolError('Bad message from client: %s.' % call.type)
+                task = asyncio.ensure_future(self._forward(session, call, inflight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (SCSCPError, ConnectionError, TimeoutError) as e:
+            log.info('Closing connection: %s' % e)
+            session.quit()
+        finally:
+            # the backends need not compute the calls of a client that left
+            for call_id in list(inflight):
+                self._terminate(inflight, call_id)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    def _terminate(self, inflight, call_id):
+        """ Forward the termination of a call to its backend """
+        client, id = inflight.get(call_id, (None, None))
+        if client is None or client.status != CONNECTED:
+            self.log.info("Ignoring termination of unknown call %s." % call_id)
+            return
+        client.terminate(id)
+
+    @staticmethod
+    def _unsupported(call):
+        """ Why a call cannot be forwarded, or None """
+        head = call.head
+        if call.option('return_cookie') is not None:
+            return 'The proxy does not support option_return_cookie.'
+        if head is not None and head.cd == 'scscp2' and head.name in _STORE_HEADS:
+            return 'The proxy does not support %s.' % head.name
+        return None
+
+    async def _forward(self, session, call, inflight):
+        """ Forward a call to a backend, and its response to the client """
+        error = self._unsupported(call)
+        backend = self.choose() if error is None else None
+        if backend is None:
+            resp = SCSCPProcedureMessage.terminated(call.id, 'system_specific',
+                                                    error or 'No backend available.')
+            session.send(session._encode(resp.om()))
+            return await session.drain()
+
+        id = '%x' % next(self._ids)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        backend.outstanding += 1
+        inflight[call.id] = (backend.client, id)
+        try:
+            resp = await backend.client.forward(call, id)
+            backend.record(loop.time() - start)
+            msg = resp.encode(session.encoding, call.id)
+        except asyncio.CancelledError:
+            if backend.client is not None:
+                backend.client._pending.pop(id, None)
+            raise
+        except Exception as e:
+            backend.record(loop.time() - start, error=True)
+            self.log.warning("%s failed: %s" % (backend, e))
+            resp = SCSCPProcedureMessage.terminated(call.id, 'system_specific',
+                                                    'Backend failed: %s.' % e)
+            msg = session._encode(resp.om())
+        finally:
+            backend.outstanding -= 1
+            if inflight.get(call.id, (None, None))[1] == id:
+                del inflight[call.id]
+
+        try:
+            session.send(msg)
+            await session.drain()
+        except (ConnectionError, RuntimeError) as e:
+            self.log.info('Cannot send response to client: %s' % e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--backend', action='append', required=True, metavar='HOST:PORT')
+    parser.add_argument('--health-interval', type=float, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    backends = [tuple(b.rsplit(':', 1)) for b in args.backend]
+    proxy = SCSCPProxy(backends, args.host, args.port, health_interval=args.health_interval)
+    try:
+        asyncio.run(proxy.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,10 @@ class SCSCPConnectionError(SCSCPError):
         self.pi = pi
 class SCSCPCancel(SCSCPError):
     pass
+class SCSCPTerminate(SCSCPError):
+    def __init__(self, msg, call_id=None):
+        super(SCSCPTerminate, self).__init__(msg)
+        self.call_id = call_id
 class SCSCPQuit(SCSCPError):
     def __init__(self, msg, reason=''):
         super(SCSCPQuit, self).__init__(msg)
@@ -19,6 +23,8 @@ class SCSCPProtocolError(SCSCPError):
         self.om = om
 class SCSCPUnknownHead(SCSCPError):
     pass
+class SCSCPUnknownReference(SCSCPError):
+    pass
 
 ### SCSCP1 content dictionary
 
@@ -78,6 +84,13 @@ class SCSCPProcedureMessage(object):
             error = om.OMError(om.OMSymbol('error_' + error, cd='scscp1'), [om.OMString(msg)])
         return cls._w_info('procedure_terminated', id, error, **info)
 
+    def option(self, name, default=None):
+        """ The value of the ``option_<name>`` parameter, if any """
+        for k, v in self.params:
+            if k.name == 'option_' + name and k.cd == 'scscp1':
+                return v
+        return default
+
     def __repr__(self):
         return "SCSCPProcedureMessage %s#%s" % (self.type, self.id)
 
@@ -146,7 +159,7 @@ def get_allowed_heads():
 def is_allowed_head(name, cd):
     return  _apply('is_allowed_head', [om.OMSymbol(name, cd)])
 
-def store(data, peristent=False):
+def store(data, persistent=False):
     return _apply('store_' + ('persistent' if persistent else 'session'), [data])
 
 def retrieve(url):
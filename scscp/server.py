@@ -1,6 +1,37 @@
 import uuid
-from .client import SCSCPPeer, SCSCPPeerOM, _assert_status, INITIALIZED, CONNECTED
+from .client import SCSCPPeer, SCSCPPeerOM, _assert_status, INITIALIZED, CONNECTED, CODECS
 from .scscp import SCSCPConnectionError, SCSCPProcedureMessage
+from .lazy import LazyProcedureMessage, encode_string, split_encoding
+
+
+class PreparedResponse(object):
+    """
+    A procedure message encoded once, and sent with any call id.
+
+    The message is encoded with a placeholder id, then split around
+    it, so that encoding a response only costs the encoding of its id.
+    """
+
+    _PLACEHOLDER = 'scscp-prepared-response-call-id'
+
+    def __init__(self, msg):
+        self.msg = msg
+        self._parts = {}
+
+    def message(self, id):
+        """ The (unencoded) procedure message, with the given id """
+        return SCSCPProcedureMessage(self.msg.type, self.msg.data, id, self.msg.params)
+
+    def encode(self, encoding, id):
+        """ The encoded procedure message, with the given id """
+        if encoding not in self._parts:
+            self._parts[encoding] = split_encoding(encoding, self.message(self._PLACEHOLDER).om(),
+                                                   self._PLACEHOLDER)
+        parts = self._parts[encoding]
+        if parts is None:
+            # unexpected encoder output, not prepared
+            return CODECS[encoding][0](self.message(id).om())
+        return parts[0] + encode_string(encoding, id) + parts[1]
 
 
 class SCSCPServerBase(SCSCPPeer):
@@ -8,9 +39,9 @@ class SCSCPServerBase(SCSCPPeer):
     A simple SCSCP synchronous server, with no understanding of OpenMath.
     """
 
-    def __init__(self, socket, name, version, id=None, timeout=30, logger=None):
+    def __init__(self, socket, name, version, id=None, timeout=30, logger=None, nodelay=True):
         super(SCSCPServerBase, self).__init__(
-            socket, timeout, logger, me="Server", you="Client")
+            socket, timeout, logger, me="Server", you="Client", nodelay=nodelay)
         self._name = name
         self._version = version
         self._id = id or str(uuid.uuid1()).encode()
@@ -18,15 +49,23 @@ class SCSCPServerBase(SCSCPPeer):
     @_assert_status(INITIALIZED, "Session already opened.")
     def accept(self, timeout=None):
         """ SCSCP handshake """
-        self._send_ordered_PI('', [('service_name', self._name), ('service_version', self._version),
-                                   ('service_id', self._id), ('scscp_versions', b'1.3')])
+        attrs = [('service_name', self._name), ('service_version', self._version),
+                 ('service_id', self._id), ('scscp_versions', b'1.3')]
+        if self.encodings:
+            attrs.append(('encodings', b' '.join(e.encode() for e in self.encodings)))
+        self._send_ordered_PI('', attrs)
 
         pi = self._get_next_PI([''], timeout=timeout)
         if pi.attrs.get('version') != b'1.3':
             self.quit()
             raise SCSCPConnectionError("Client sent unexpected response.", pi)
 
-        self._send_PI(version=b'1.3')
+        encoding = pi.attrs.get('encoding', b'').decode()
+        if encoding in self.encodings:
+            self.encoding = encoding
+            self._send_PI(version=b'1.3', encoding=encoding.encode())
+        else:
+            self._send_PI(version=b'1.3')
 
         self.status = CONNECTED
 
@@ -36,7 +75,15 @@ class SCSCPServer(SCSCPServerBase, SCSCPPeerOM):
     A simple SCSCP synchronous server.
     """
 
-    def wait(self, timeout=-1):
+    def wait(self, timeout=-1, lazy=False):
+        """
+        Receive a procedure message
+
+        If ``lazy``, a ``scscp.lazy.LazyProcedureMessage`` is returned,
+        whose data is only decoded when accessed.
+        """
+        if lazy:
+            return LazyProcedureMessage.from_bytes(SCSCPPeer.receive(self, timeout), self.encoding)
         return SCSCPProcedureMessage.from_om(self.receive(timeout))
 
     def completed(self, id, data, **info):
@@ -48,3 +95,13 @@ class SCSCPServer(SCSCPServerBase, SCSCPPeerOM):
         term = SCSCPProcedureMessage.terminated(id, error, msg, **info)
         self.send(term.om())
         return term
+
+    def respond(self, msg):
+        """ Send an already constructed procedure message """
+        self.send(msg.om())
+        return msg
+
+    def respond_prepared(self, prepared, id):
+        """ Send a ``PreparedResponse`` with the given id """
+        SCSCPPeer.send(self, prepared.encode(self.encoding, id))
+        return prepared.message(id)
@@ -1,51 +1,445 @@
 import os
+import stat
+import time
+import socket
+import ctypes
+import inspect
 import logging
+import uuid
+import threading
 
 from six.moves import socketserver
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
 
-from .server import SCSCPServer
-from .scscp import SCSCPQuit, SCSCPProtocolError, SCSCPUnknownHead, SCSCPProcedureMessage
+from .server import SCSCPServer, PreparedResponse
+from .client import TimeoutError
+from .framing import set_keepalive
+from . import scscp
+from .scscp import SCSCPQuit, SCSCPCancel, SCSCPTerminate, SCSCPConnectionError, SCSCPProtocolError, SCSCPUnknownHead, SCSCPUnknownReference, SCSCPProcedureMessage
 
-from openmath import openmath as om
+from . import worker, store, cache
+from .metrics import Metrics
+from .admission import Admission
+from .processing_instruction import ProcessingInstruction as PI
+
+from openmath import openmath as om, encoder, convert
 
 # built-in messages
-CD_SCSCP2 = ['get_service_description', 'get_allowed_heads', 'is_allowed_head']
+CD_SCSCP2 = ['get_service_description', 'get_allowed_heads', 'is_allowed_head', 'get_signature',
+             'store_session', 'store_persistent', 'retrieve', 'unbind']
+
+# built-in messages whose response only depends on the request handler
+# class (and the arguments, for get_signature), prepared once
+_PREPARED_SCSCP2 = ('get_service_description', 'get_allowed_heads', 'get_signature')
+
+
+def _async_raise(thread_id, exc_type):
+    """
+    Raise ``exc_type`` in a thread, as soon as it runs Python code, or
+    cancel a pending exception if ``exc_type`` is None.
+    """
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), None if exc_type is None else ctypes.py_object(exc_type))
+
+# whether running threads can be interrupted
+_CAN_INTERRUPT = hasattr(ctypes, 'pythonapi')
+
+
+def address_name(address, port=True):
+    """ A printable name of a client address """
+    if isinstance(address, tuple):
+        return '%s:%s' % address[:2] if port else str(address[0])
+    # clients of Unix domain sockets are usually unnamed
+    return address or 'local'
+
+
+class Procedure(object):
+    """
+    A head of an SCSCP server: a callable, with its signature.
+
+    The callable receives the OpenMath arguments of the call (their
+    Python equivalents if ``convert``, see ``openmath.convert``), and
+    returns an OpenMath object (or a Python object, if ``convert``) or
+    an ``SCSCPProcedureMessage``. If ``method``, it also receives the
+    request handler as first argument.
+
+    Unless given, the minimal and maximal numbers of arguments are
+    taken from the parameters of the callable. ``pure`` procedures
+    may be cached by the server (see ``SCSCPSocketServer``).
+    """
+
+    def __init__(self, fun, cd, name, min=None, max=None, symbol_sets=None,
+                 pure=False, convert=False, method=False):
+        self.fun = fun
+        self.cd = cd
+        self.name = name
+        self.symbol_sets = symbol_sets
+        self.pure = pure
+        self.convert = convert
+        self.method = method
+
+        try:
+            params = list(inspect.signature(fun).parameters.values())[int(method):]
+        except (TypeError, ValueError):
+            params = None
+        if params is None:
+            nmin, nmax = 0, None
+        else:
+            positional = [p for p in params
+                          if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)]
+            nmin = len([p for p in positional if p.default is p.empty])
+            nmax = (None if any(p.kind == p.VAR_POSITIONAL for p in params)
+                    else len(positional))
+        self.min = nmin if min is None else min
+        self.max = nmax if max is None else max
+
+    def __repr__(self):
+        return "Procedure %s.%s" % (self.cd, self.name)
+
+    def __call__(self, handler, args):
+        if len(args) < self.min or (self.max is not None and len(args) > self.max):
+            raise TypeError("%s.%s takes from %s to %s arguments, %d given." %
+                            (self.cd, self.name, self.min, self.max, len(args)))
+        if self.convert:
+            args = [convert.to_python(a) for a in args]
+        res = self.fun(handler, *args) if self.method else self.fun(*args)
+        if self.convert and not isinstance(res, (om.OMAny, SCSCPProcedureMessage)):
+            res = convert.to_openmath(res)
+        return res
+
+    def signature(self):
+        """ The ``scscp2.signature`` of this procedure """
+        return scscp.signature(self.name, self.cd, self.symbol_sets, self.min, self.max)
+
+
+def procedure(cd, name=None, **kwds):
+    """
+    Decorator registering a method of a request handler as a head.
+
+    The head is ``cd.name`` (``name`` defaults to the name of the
+    method), the other arguments are as for ``Procedure``.
+    """
+    def wrap(fun):
+        fun._scscp_procedure = Procedure(fun, cd, name or fun.__name__, method=True, **kwds)
+        return fun
+    return wrap
 
 
 class SCSCPServerRequestHandler(socketserver.BaseRequestHandler):
-    """ A request handler for an SCSCP Server """
+    """
+    A request handler for an SCSCP Server
+
+    Heads are either registered, with the ``procedure`` decorator or
+    the ``register`` class method, or handled by overriding
+    ``handle_call``. Registered heads are advertised by the built-in
+    ``scscp2`` discovery messages.
+
+    The connection is read while calls are computed, so that clients
+    may terminate them. Calls computed in the thread of the connection
+    are interrupted by raising ``scscp.worker.CallTerminated`` in it
+    (Python code only: a long call into a C library runs to its end).
+    Calls computed by the ``workers`` of the server are cancelled, or
+    their process is killed if the executor supports it (see
+    ``scscp.worker.IsolatedProcessExecutor``).
+    """
+
+    # Heads, as (cd, name) pairs, whose results only depend on their
+    # arguments, and may be taken from the result cache of the server
+    pure_heads = frozenset()
+
+    # Registered procedures, by (cd, name)
+    _procedures = {}
+
+    def __init_subclass__(cls, **kwds):
+        super(SCSCPServerRequestHandler, cls).__init_subclass__(**kwds)
+        cls._procedures = dict(cls._procedures)
+        for attr in list(vars(cls).values()):
+            proc = getattr(attr, '_scscp_procedure', None)
+            if isinstance(proc, Procedure):
+                cls._procedures[proc.cd, proc.name] = proc
+
+    @classmethod
+    def register(cls, cd, name, fun, **kwds):
+        """
+        Register a function as the head ``cd.name`` of this class
+
+        The other arguments are as for ``Procedure``. Subclasses
+        defined before the call do not see the new head.
+        """
+        cls._procedures[cd, name] = Procedure(fun, cd, name, **kwds)
+
+    @classmethod
+    def detached(cls, server, scscp=None, client_address=None, log=None):
+        """ Instantiate a request handler, without running it on a connection """
+        handler = cls.__new__(cls)
+        handler.request = None
+        handler.client_address = client_address
+        handler.server = server
+        handler.log = log or server.log
+        handler.scscp = scscp
+        handler.session_store = store.SessionStore(getattr(server, 'session_store_size', 1 << 26))
+        handler._init_calls()
+        return handler
+
+    def _init_calls(self):
+        self._calls_lock = threading.Lock()
+        # ids of the calls received and not answered yet
+        self._calls = set()
+        # ids of the calls among them terminated by the client
+        self._terminated = set()
+        # (id, interrupt function) of the call being computed
+        self._computing = None
+        # times of the start of the session, and of its last message
+        self._opened_at = self._last_active = time.monotonic()
 
     def setup(self):
         """ Setups of this request handler """
-        self.server.log.info("New connection from %s:%d" % self.client_address)
-        self.log = self.server.log.getChild(self.client_address[0])
-        self.scscp = SCSCPServer(self.request, self.server.name,
-                                 self.server.version, logger=self.log)
+        self.server.log.info("New connection from %s" % address_name(self.client_address))
+        self.log = self.server.log.getChild(address_name(self.client_address, port=False))
+        self.scscp = SCSCPServer(self.request, self.server.name, self.server.version,
+                                 getattr(self.server, 'service_id', None), logger=self.log)
+        self.scscp.metrics = getattr(self.server, 'metrics', None)
+        set_keepalive(self.request, getattr(self.server, 'keepalive', None))
+        self.session_store = store.SessionStore(self.server.session_store_size)
+        self._init_calls()
+        # reason of the quit message, once closed by the server
+        self._quit_reason = None
+        self.server._opened(self)
+
+    def finish(self):
+        self.server._closed(self)
+
+    @property
+    def idle(self):
+        """ Whether no call of this connection is waiting or being computed """
+        with self._calls_lock:
+            return not self._calls
+
+    def close(self, reason=None):
+        """
+        Close the connection with a ``quit`` message, from any thread.
+
+        The calls of the connection are terminated.
+        """
+        with self._calls_lock:
+            if self._quit_reason is not None:
+                return
+            self._quit_reason = reason or b''
+        try:
+            # wake the reading thread, which sends the quit message
+            self.request.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
 
     def handle(self):
         """ Handles a single new connection """
-        self.scscp.accept()
+        try:
+            self.scscp.accept(timeout=-1)
+        except (TimeoutError, ConnectionError, SCSCPConnectionError) as e:
+            self.log.info('Handshake failed: %s' % e)
+            return
+        # calls are run in order by another thread, while this one
+        # reads the terminate messages
+        calls = futures.ThreadPoolExecutor(1)
+        try:
+            while True:
+                try:
+                    reason = self._wait_for_message()
+                    if reason is not None:
+                        self._quit(reason)
+                        break
+                    call = self.scscp.wait()
+                    admitted = self._received(call)
+                except TimeoutError:
+                    # the message started, but did not arrive in time
+                    self._quit(b'Message took too long to arrive.')
+                    break
+                except SCSCPCancel as e:
+                    # the partial message is dropped
+                    self.log.info(e)
+                    continue
+                except SCSCPTerminate as e:
+                    self.log.info(e)
+                    self.terminate(e.call_id)
+                    continue
+                except SCSCPQuit as e:
+                    self.log.info(e)
+                    break
+                except ConnectionResetError:
+                    if self._quit_reason is None:
+                        self.log.info('Client closed unexpectedly.')
+                    else:
+                        self._quit(self._quit_reason or None)
+                    break
+                except SCSCPProtocolError as e:
+                    self.log.info('SCSCP protocol error: %s.' % str(e))
+                    self.log.info('Closing connection.')
+                    self.scscp.quit()
+                    break
+                if admitted:
+                    calls.submit(self._run_call, call)
+                else:
+                    self._reject(call)
+        finally:
+            # nobody is waiting for the results anymore
+            self._terminate_all()
+            calls.shutdown(wait=True)
+
+    def _quit(self, reason):
+        self.log.info('Closing connection: %s' % (reason or b'').decode('utf-8', 'replace'))
+        self.scscp.quit(reason)
+
+    def _wait_for_message(self):
+        """
+        Wait for the next message of the client. Returns the reason to
+        close the session instead, if it expired (see ``_expiry``).
+        """
         while True:
-            try:
-                call = self.scscp.wait()
-            except TimeoutError:
-                continue
-            except SCSCPQuit as e:
-                self.log.info(e)
-                break
-            except ConnectionResetError:
-                self.log.info('Client closed unexpectedly.')
-                break
-            except SCSCPProtocolError as e:
-                self.log.info('SCSCP protocol error: %s.' % str(e))
-                self.log.info('Closing connection.')
-                self.scscp.quit()
-                break
-            self.__handle_call(call)
+            reason, timeout = self._expiry()
+            if reason is not None:
+                return reason
+            if self.scscp.stream.wait_data(timeout):
+                return None
 
-    def __handle_call(self, call):
-        """ Safely handles a call """
+    def _expiry(self):
+        """
+        Returns a pair ``(reason, None)`` if the session was idle for
+        longer than the ``idle_timeout`` of the server, or open for
+        longer than its ``session_lifetime``. Otherwise returns
+        ``(None, timeout)``, where ``timeout`` is how long the session
+        may wait for a message (None for ever).
+        """
+        now = time.monotonic()
+        timeouts = []
+        lifetime = getattr(self.server, 'session_lifetime', None)
+        if lifetime is not None:
+            left = self._opened_at + lifetime - now
+            if left <= 0:
+                return b'Session lifetime exceeded.', None
+            timeouts.append(left)
+        idle_timeout = getattr(self.server, 'idle_timeout', None)
+        if idle_timeout is not None:
+            # sessions waiting for the result of a call are not idle
+            if self.idle:
+                left = self._last_active + idle_timeout - now
+                if left <= 0:
+                    return b'Session idle for too long.', None
+            else:
+                left = idle_timeout
+            timeouts.append(left)
+        return None, min(timeouts) if timeouts else None
+
+    def _run_call(self, call):
+        try:
+            self._handle_call(call)
+        except Exception as e:
+            self.log.info('Cannot handle call %s: %s' % (call.id, e))
+
+    ### Termination of calls
+
+    def _received(self, call):
+        """
+        Record a call, which may be terminated until it is answered.
+        Returns False if the server is overloaded.
+        """
+        self._last_active = time.monotonic()
+        if call.type != 'procedure_call':
+            raise SCSCPProtocolError('Bad message from client: %s.' % call.type, om=call.om())
+        admission = getattr(self.server, 'admission', None)
+        if admission is not None and not admission.enter():
+            return False
+        with self._calls_lock:
+            self._calls.add(call.id)
+        return True
+
+    def _reject(self, call):
+        """ Answer a call the server is too busy to compute """
+        self.log.info('Server overloaded, rejecting call %s.' % call.id)
+        self.scscp.terminated(call.id, 'system_specific', 'Server overloaded, try again later.')
+
+    def _answered(self, call):
+        self._last_active = time.monotonic()
+        with self._calls_lock:
+            received = call.id in self._calls
+            self._calls.discard(call.id)
+            self._terminated.discard(call.id)
+        admission = getattr(self.server, 'admission', None)
+        if received and admission is not None:
+            admission.leave()
+
+    def terminate(self, call_id):
+        """
+        Terminate a call of this connection, waiting or being computed.
+
+        The call is answered by a ``procedure_terminated`` message.
+        Returns False if there is no such call.
+        """
+        with self._calls_lock:
+            if call_id not in self._calls or call_id in self._terminated:
+                return False
+            self._terminated.add(call_id)
+            if self._computing is not None and self._computing[0] == call_id:
+                self._computing[1]()
+        # the call may be waiting for a slot to be computed
+        admission = getattr(self.server, 'admission', None)
+        if admission is not None:
+            admission.wake()
+        return True
 
+    def _terminate_all(self):
+        with self._calls_lock:
+            ids = list(self._calls)
+        for call_id in ids:
+            self.terminate(call_id)
+
+    def _interruptible(self, call, fun, interrupt=None):
+        """
+        Run ``fun()``, stopped by ``interrupt()`` if the call is
+        terminated. By default, ``scscp.worker.CallTerminated`` is
+        raised in the current thread.
+        """
+        thread_id = threading.get_ident()
+        own = interrupt is None
+        if own:
+            if not _CAN_INTERRUPT:
+                return fun()
+            interrupt = lambda: _async_raise(thread_id, worker.CallTerminated)
+        with self._calls_lock:
+            if call.id in self._terminated:
+                if not own:
+                    interrupt()
+                raise worker.CallTerminated
+            self._computing = (call.id, interrupt)
+        try:
+            return fun()
+        finally:
+            with self._calls_lock:
+                self._computing = None
+                terminated = call.id in self._terminated
+                if terminated and own:
+                    # the exception may not have been raised yet
+                    _async_raise(thread_id, None)
+            if terminated:
+                raise worker.CallTerminated
+
+    def _handle_call(self, call):
+        """ Safely handles a call, and records it in the metrics of the server """
+        metrics = getattr(self.server, 'metrics', None)
+        try:
+            if metrics is None:
+                return self.__handle_call(call)
+            start = time.perf_counter()
+            res = self.__handle_call(call)
+            elem = getattr(call.data, 'elem', None)
+            metrics.record_call(getattr(elem, 'cd', ''), getattr(elem, 'name', ''),
+                                time.perf_counter() - start,
+                                getattr(res, 'type', None) == 'procedure_terminated')
+            return res
+        finally:
+            self._answered(call)
+
+    def __handle_call(self, call):
         if (call.type != 'procedure_call'):
             raise SCSCPProtocolError(
                 'Bad message from client: %s.' % call.type, om=call.om())
@@ -54,19 +448,33 @@ class SCSCPServerRequestHandler(socketserver.BaseRequestHandler):
             head = call.data.elem.name
             self.log.debug('Requested head: %s...' % head)
 
+            # info_runtime and info_memory of the response
+            infos = {}
+
             # for the methods in scscp2, use the class methods
             if call.data.elem.cd == 'scscp2':
                 if not head in CD_SCSCP2:
                     raise SCSCPUnknownHead
+                prepared = self._prepared_response(call, head)
+                if prepared is not None:
+                    return self.scscp.respond_prepared(prepared, call.id)
                 res = getattr(self, head)(call.data)
 
-            # else, handle the call internally
             else:
-                res = self.handle_call(call, head)
+                call.data = self.resolve(call.data)
+                start = time.perf_counter()
+                res = self._cached_call(call, head, infos)
+                infos.setdefault('runtime', int(round((time.perf_counter() - start) * 1000)))
+
+            # keep the result on the server if asked to
+            if (call.option('return_cookie') is not None
+                    and not isinstance(res, SCSCPProcedureMessage)):
+                res = self._store(self.session_store, store.SESSION, res)
 
-            strlog = str(res)
-            self.log.debug('...sending result: %s' %
-                           (strlog[:20] + ('...' if len(strlog) > 20 else '')))
+            if self.log.isEnabledFor(logging.DEBUG):
+                strlog = str(res)
+                self.log.debug('...sending result: %s' %
+                               (strlog[:20] + ('...' if len(strlog) > 20 else '')))
 
             # if we already constructed a procedure message
             # else just return it as is
@@ -74,7 +482,17 @@ class SCSCPServerRequestHandler(socketserver.BaseRequestHandler):
                 return res
             # else,
             else:
-                return self.scscp.completed(call.id, res)
+                return self.scscp.completed(call.id, res, **infos)
+
+        # the client terminated the call
+        except worker.CallTerminated:
+            self.log.debug('...terminated by client.')
+            return self.scscp.terminated(call.id, 'system_specific', 'Call terminated by client.')
+
+        # the call exceeded option_runtime or option_max_memory
+        except worker.LimitExceeded as e:
+            self.log.debug('...%s' % e)
+            return self.scscp.terminated(call.id, e.kind, str(e))
 
         # User-thrown execption: I don't know this head
         except SCSCPUnknownHead:
@@ -82,6 +500,12 @@ class SCSCPServerRequestHandler(socketserver.BaseRequestHandler):
             return self.scscp.terminated(call.id, om.OMError(
                 om.OMSymbol('unhandled_symbol', cd='error'), [call.data.elem]))
 
+        # The client referenced an object we do not have
+        except SCSCPUnknownReference as e:
+            self.log.debug('...unknown reference.')
+            return self.scscp.terminated(call.id, 'system_specific',
+                                         'Unknown object reference %s.' % str(e))
+
         # we tried to look up something, but it wasn't given by the client
         except (AttributeError, IndexError, TypeError):
             self.log.debug('...client protocol error.')
@@ -94,43 +518,438 @@ class SCSCPServerRequestHandler(socketserver.BaseRequestHandler):
             return self.scscp.terminated(call.id, 'system_specific',
                                          'Unhandled exception %s.' % str(e))
 
+    def _prepared_response(self, call, head):
+        """
+        The prepared response to a discovery message, or None.
+
+        Responses are prepared once per request handler class, if the
+        class does not override the built-in discovery methods.
+        """
+        responses = getattr(self.server, 'prepared_responses', None)
+        if (responses is None or head not in _PREPARED_SCSCP2
+                or call.option('return_cookie') is not None
+                or getattr(type(self), head) is not getattr(SCSCPServerRequestHandler, head)):
+            return None
+        key = (type(self), head)
+        if head == 'get_signature':
+            args = call.data.arguments
+            if len(args) != 1 or not isinstance(args[0], om.OMSymbol):
+                return None
+            key += (args[0].cd, args[0].name)
+        prepared = responses.get(key)
+        if prepared is None:
+            res = getattr(self, head)(call.data)
+            prepared = responses[key] = PreparedResponse(
+                SCSCPProcedureMessage.completed(None, res))
+        return prepared
+
+    def _cached_call(self, call, head, infos):
+        """ Runs handle_call, unless the result of a pure call is cached """
+        results = getattr(self.server, 'result_cache', None)
+        key = (call.data.elem.cd, head)
+        if results is None or not (key in self.pure_heads
+                                   or getattr(self._procedures.get(key), 'pure', False)):
+            return self._compute(call, head, infos)
+        key = results.key(call.data)
+        res = results.get(key)
+        if res is None:
+            res = self._compute(call, head, infos)
+            if not isinstance(res, SCSCPProcedureMessage):
+                results.put(key, res)
+        return res
+
+    @staticmethod
+    def _limits(call):
+        """ The (runtime, max_memory) limits of a call, or None """
+        runtime, memory = call.option('runtime'), call.option('max_memory')
+        if runtime is None and memory is None:
+            return None
+        return (getattr(runtime, 'integer', None), getattr(memory, 'integer', None))
+
+    def _compute(self, call, head, infos):
+        admission = getattr(self.server, 'admission', None)
+        if admission is None:
+            return self.__compute(call, head, infos)
+        if not admission.start(lambda: call.id in self._terminated):
+            raise worker.CallTerminated
+        try:
+            return self.__compute(call, head, infos)
+        finally:
+            admission.stop()
+
+    def __compute(self, call, head, infos):
+        limits = self._limits(call)
+        # run limited calls in a process of their own
+        isolated = limits is not None and getattr(self.server, 'isolated_workers', None)
+        if isolated:
+            return self._handle_call_in_worker(call, head, infos, isolated, limits)
+        # handle the call internally
+        if getattr(self.server, 'workers', None) is None:
+            return self._interruptible(call, lambda: self.handle_call(call, head))
+        # or in a worker process
+        return self._handle_call_in_worker(call, head, infos)
+
+    def _handle_call_in_worker(self, call, head, infos, workers=None, limits=None):
+        """
+        Runs handle_call in the worker pool of the server, or in
+        ``workers``, under the given limits
+        """
+        workers = workers or self.server.workers
+        args = (type(self), worker.WorkerServer.of(self.server),
+                encoder.encode_bytes(call.om()), head)
+        if limits is None:
+            fut = workers.submit(worker.handle_call, *args)
+        else:
+            fut = workers.submit_limited(worker.handle_call, args, *limits)
+        woken = futures.Future()
+
+        def interrupt():
+            # kill the worker if possible, stop waiting for it anyway
+            getattr(fut, 'kill', fut.cancel)()
+            woken.set_result(None)
+
+        self._interruptible(call, lambda: futures.wait([fut, woken],
+                                                       return_when=futures.FIRST_COMPLETED),
+                            interrupt)
+        res = worker.decode_result(*fut.result())
+        infos.update((k, v) for k, v in (getattr(fut, 'usage', None) or {}).items()
+                     if v is not None)
+        if isinstance(res, SCSCPProcedureMessage):
+            self.scscp.respond(res)
+        return res
+
     def handle_call(self, call, head):
-        """ Handles a call and may throw exceptions """
+        """
+        Handles a call and may throw exceptions
+
+        By default, calls the registered procedure of the head.
 
-        raise SCSCPUnknownHead
+        If the server has a pool of ``workers``, this method runs in a
+        worker process, where ``self.scscp`` is not available: the
+        result must be returned, not sent.
+        """
+        proc = self._procedures.get((call.data.elem.cd, head))
+        if proc is None:
+            raise SCSCPUnknownHead
+        return proc(self, call.data.arguments)
 
     def get_allowed_heads(self, data):
-        raise NotImplementedError
+        return scscp.symbol_set([om.OMSymbol(head, cd='scscp2') for head in CD_SCSCP2]
+                                + [om.OMSymbol(name, cd) for cd, name in self._procedures],
+                                cdnames=['scscp1'])
 
     def is_allowed_head(self, data):
-        raise NotImplementedError
+        head = data.arguments[0]
+        return convert.to_openmath((head.cd, head.name) in self._procedures
+                                   or (head.cd == 'scscp2' and head.name in CD_SCSCP2)
+                                   or head.cd == 'scscp1')
+
+    def get_signature(self, data):
+        head = data.arguments[0]
+        proc = self._procedures.get((head.cd, head.name))
+        if proc is None:
+            raise SCSCPUnknownHead
+        return proc.signature()
 
     def get_service_description(self, data):
-        raise NotImplementedError
+        return scscp.service_description(self.server.name.decode(),
+                                         self.server.version.decode(),
+                                         self.server.description)
+
+    ### Object stores
+
+    def _store(self, objects, kind, obj):
+        return om.OMReference(store.make_url(getattr(self.server, 'server_address', None),
+                                             kind, objects.store(obj)))
+
+    def _lookup(self, ref):
+        """ The store and key of a reference to a stored object """
+        parsed = store.parse_url(ref.href) if isinstance(ref, om.OMReference) else None
+        if parsed is None:
+            raise SCSCPUnknownReference(getattr(ref, 'href', ref))
+        kind, key = parsed
+        return (self.session_store if kind == store.SESSION else self.server.persistent_store), key
+
+    def _retrieve(self, ref):
+        objects, key = self._lookup(ref)
+        try:
+            return objects.get(key)
+        except KeyError:
+            raise SCSCPUnknownReference(ref.href)
+
+    def resolve(self, obj):
+        """ Replace references to stored objects by the objects """
+        if isinstance(obj, om.OMReference):
+            if store.parse_url(obj.href) is not None:
+                return self._retrieve(obj)
+        elif isinstance(obj, om.OMApplication):
+            elem = self.resolve(obj.elem)
+            args = [self.resolve(a) for a in obj.arguments]
+            if elem is not obj.elem or any(a is not b for a, b in zip(args, obj.arguments)):
+                return om.OMApplication(elem, args, id=obj.id, cdbase=obj.cdbase)
+        elif isinstance(obj, om.OMAttribution):
+            inner = self.resolve(obj.obj)
+            if inner is not obj.obj:
+                return om.OMAttribution(obj.pairs, inner, id=obj.id, cdbase=obj.cdbase)
+        elif isinstance(obj, om.OMBinding):
+            inner = self.resolve(obj.obj)
+            if inner is not obj.obj:
+                return om.OMBinding(obj.binder, obj.vars, inner, id=obj.id, cdbase=obj.cdbase)
+        return obj
+
+    def store_session(self, data):
+        return self._store(self.session_store, store.SESSION, self.resolve(data.arguments[0]))
+
+    def store_persistent(self, data):
+        return self._store(self.server.persistent_store, store.PERSISTENT, self.resolve(data.arguments[0]))
+
+    def retrieve(self, data):
+        return self._retrieve(data.arguments[0])
+
+    def unbind(self, data):
+        objects, key = self._lookup(data.arguments[0])
+        try:
+            objects.delete(key)
+        except KeyError:
+            raise SCSCPUnknownReference(data.arguments[0].href)
+        return convert.to_openmath(True)
+
+
+class SCSCPServerMixin(object):
+    """ Settings and resources shared by the SCSCP servers """
+
+    def _setup(self, logger, name, version, description, workers=None,
+               session_store_size=1 << 26, persistent_store=None, result_cache=None,
+               metrics=None, admission=None, idle_timeout=None, session_lifetime=None,
+               keepalive=True):
+        self.log = logger or logging.getLogger(__name__)
+        self.name = name
+        self.version = version
+        self.description = description
+        # identifies this instance of the service, for all connections
+        self.service_id = str(uuid.uuid1()).encode()
+
+        # pool of worker processes running handle_call
+        self._own_workers = isinstance(workers, int)
+        self.workers = ProcessPoolExecutor(workers) if self._own_workers else workers
+
+        # processes of the calls with option_runtime or option_max_memory,
+        # created on the first such call
+        self._own_isolated = not isinstance(workers, worker.IsolatedProcessExecutor)
+        self._isolated_workers = None if self._own_isolated else workers
+        self._isolated_lock = threading.Lock()
+
+        # stores for scscp2 store_session/store_persistent
+        self.session_store_size = session_store_size
+        if not isinstance(persistent_store, store.PersistentStore):
+            persistent_store = store.PersistentStore(persistent_store)
+        self.persistent_store = persistent_store
+
+        # results of the pure heads of the request handler
+        if isinstance(result_cache, int):
+            result_cache = cache.ResultCache(result_cache)
+        self.result_cache = result_cache
+
+        # responses to discovery messages, by request handler class
+        self.prepared_responses = {}
+
+        # instrumentation of the calls and of the connections
+        if metrics is True:
+            metrics = Metrics()
+        self.metrics = metrics
+
+        # bounds of the connections and calls
+        self.admission = admission or Admission()
+        if metrics is not None:
+            metrics.add_gauges('admission', self.admission.stats)
 
+        # policy of the sessions, see SCSCPServerRequestHandler._expiry
+        self.idle_timeout = idle_timeout
+        self.session_lifetime = session_lifetime
+        self.keepalive = keepalive
 
-class SCSCPSocketServer(socketserver.ThreadingMixIn, socketserver.TCPServer, object):
-    """ An SCSCP Server based on sockets """
+        # request handlers of the open connections
+        self._handlers = set()
+        self._handlers_lock = threading.Lock()
+
+    def _opened(self, handler):
+        with self._handlers_lock:
+            self._handlers.add(handler)
+
+    def _closed(self, handler):
+        with self._handlers_lock:
+            self._handlers.discard(handler)
+
+    def drain(self, timeout=None, reason=b'Server shutting down.', poll_interval=0.05):
+        """
+        Close all connections with a ``quit`` message carrying ``reason``.
+
+        Connections are closed once they have no call in flight; after
+        ``timeout`` seconds, the remaining ones are closed too, and
+        their calls terminated. Returns once all connections are
+        closed. Call it after ``shutdown()``, so that no new connection
+        is accepted meanwhile.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._handlers_lock:
+                handlers = list(self._handlers)
+            if not handlers:
+                return
+            force = deadline is not None and time.monotonic() >= deadline
+            for handler in handlers:
+                if force or handler.idle:
+                    handler.close(reason)
+            time.sleep(poll_interval)
+
+    @property
+    def isolated_workers(self):
+        """ The executor of the calls with limits """
+        with self._isolated_lock:
+            if self._isolated_workers is None:
+                self._isolated_workers = worker.IsolatedProcessExecutor()
+            return self._isolated_workers
+
+    def _reject_connection(self, send):
+        """ Send a quit message to a connection the server is too busy to serve """
+        self.log.info('Server overloaded, rejecting connection.')
+        try:
+            send(bytes(PI('quit', reason=b'Server overloaded, try again later.')) + b'\n')
+        except OSError:
+            pass
+
+    def _close(self):
+        if self._own_workers:
+            self.workers.shutdown()
+        if self._own_isolated and self._isolated_workers is not None:
+            self._isolated_workers.shutdown()
+        self.persistent_store.close()
+
+
+class SCSCPSocketServer(socketserver.ThreadingMixIn, socketserver.TCPServer, SCSCPServerMixin):
+    """
+    An SCSCP Server based on sockets
+
+    The server listens on ``host:port``, or, if ``path`` is given, on
+    this Unix domain socket, whose file is removed by ``server_close()``.
+
+    By default, each call is computed in the thread of its connection.
+    If ``workers`` is given, ``handle_call`` is run instead in a pool of
+    worker processes: either an executor with a ``submit`` method (e.g.,
+    a ``concurrent.futures.ProcessPoolExecutor``), or the number of
+    processes of a new pool.
+
+    Objects stored by clients with ``store_session`` or
+    ``option_return_cookie`` are kept in memory, up to
+    ``session_store_size`` bytes per session; objects stored with
+    ``store_persistent`` are kept on disk, in the directory
+    ``persistent_store`` (a temporary one if ``None``).
+
+    Calls with ``option_runtime`` (in milliseconds) or
+    ``option_max_memory`` (in bytes) are run in a process of their own
+    (see ``scscp.worker.IsolatedProcessExecutor``), and terminated with
+    ``error_runtime`` or ``error_memory`` if they exceed their limits.
+    Completed calls are sent with their ``info_runtime`` (and their
+    ``info_memory``, if run in a process of their own).
+
+    If ``result_cache`` is given, the results of the ``pure_heads`` of
+    the request handler are cached, and shared by all connections:
+    either a ``scscp.cache.ResultCache``, or its size in bytes.
+
+    The server accepts at most ``max_connections`` connections, and
+    computes at most ``max_calls`` calls at once, with at most
+    ``max_pending`` more calls waiting (None for no bound). Beyond
+    these bounds, connections are closed with a ``quit`` message, and
+    calls answered with ``procedure_terminated``, at once.
+    ``server.admission.stats()`` reports the current numbers of
+    connections, running and pending calls, and the rejections.
+
+    Sessions are closed with a ``quit`` message once they have been
+    idle (no message received, and no call in flight) for
+    ``idle_timeout`` seconds, or open for ``session_lifetime`` seconds,
+    terminating their calls (None for no limit). TCP keepalive probes
+    detect dead clients: ``keepalive`` is True for the timings of the
+    system, a triple ``(idle, interval, count)`` (see
+    ``scscp.framing.set_keepalive``), or False.
+
+    Once ``shutdown()`` has returned, ``drain()`` closes the connections
+    with a ``quit`` message, letting their calls complete first.
+
+    If ``metrics`` is given (a ``scscp.metrics.Metrics``, or True for a
+    new one), the calls are recorded by head, with the messages and the
+    encoding and decoding times of all connections.
+    """
 
     allow_reuse_address = True
 
     def __init__(self, host=None, port=None,
                  logger=None, name=b'SCSCPSocketServer', version=b'none',
-                 description='SCSCP socket server', RequestHandlerClass=SCSCPServerRequestHandler):
+                 description='SCSCP socket server', RequestHandlerClass=SCSCPServerRequestHandler,
+                 workers=None, session_store_size=1 << 26, persistent_store=None,
+                 result_cache=None, metrics=None,
+                 max_connections=None, max_calls=None, max_pending=None,
+                 bind_and_activate=True, path=None,
+                 idle_timeout=None, session_lifetime=None, keepalive=True):
 
-        # if host is not given, try the HOST environment variable
-        if host is None:
-            host = os.getenv('HOST', 'localhost')
+        if path is not None:
+            self.address_family = socket.AF_UNIX
+            address = path
+        else:
+            # if host is not given, try the HOST environment variable
+            if host is None:
+                host = os.getenv('HOST', 'localhost')
 
-        # if port is not given, try the PORT environment variable
-        if port is None:
-            port = os.getenv('PORT', '26133')
-        port = int(port)
+            # if port is not given, try the PORT environment variable
+            if port is None:
+                port = os.getenv('PORT', '26133')
+            address = (host, int(port))
+        # the process owning the Unix domain socket file
+        self._bound_by = None
 
         # super call
         super(SCSCPSocketServer, self).__init__(
-            (host, port), RequestHandlerClass)
-        self.log = logger or logging.getLogger(__name__)
-        self.name = name
-        self.version = version
-        self.description = description
+            address, RequestHandlerClass, bind_and_activate)
+        self._setup(logger, name, version, description, workers,
+                    session_store_size, persistent_store, result_cache, metrics,
+                    Admission(max_connections, max_calls, max_pending),
+                    idle_timeout, session_lifetime, keepalive)
+
+    def process_request(self, request, client_address):
+        if not self.admission.open_connection():
+            self._reject_connection(request.sendall)
+            self.shutdown_request(request)
+            return
+        try:
+            super(SCSCPSocketServer, self).process_request(request, client_address)
+        except:
+            self.admission.close_connection()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super(SCSCPSocketServer, self).process_request_thread(request, client_address)
+        finally:
+            self.admission.close_connection()
+
+    def server_bind(self):
+        if self.address_family == socket.AF_UNIX:
+            _remove_stale_socket(self.server_address)
+            self._bound_by = os.getpid()
+        super(SCSCPSocketServer, self).server_bind()
+
+    def server_close(self):
+        super(SCSCPSocketServer, self).server_close()
+        # not in the forked processes sharing the socket
+        if self._bound_by == os.getpid():
+            _remove_stale_socket(self.server_address)
+            self._bound_by = None
+        self._close()
+
+
+def _remove_stale_socket(path):
+    """ Remove the file of a Unix domain socket, if any """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,173 @@
+"""
+Server-side stores of OpenMath objects (scscp2 ``store_session``,
+``store_persistent``, ``retrieve`` and ``unbind``).
+
+Stored objects are identified by keys, exposed to clients as
+``OMReference`` URLs of the form ``scscp://host:port/<kind>/<key>``.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+from openmath import openmath as om, encoder
+
+from .lazy import decode_xml
+
+SESSION = 'session'
+PERSISTENT = 'persistent'
+
+_url_regex = re.compile(r'^scscp://[^/]*/(session|persistent)/([0-9a-f]{32})$')
+
+
+def make_url(address, kind, key):
+    """
+    The URL of an object stored on the server at ``address``, if it is
+    a ``(host, port)`` pair; on ``localhost`` otherwise (e.g., for the
+    path of a Unix domain socket)
+    """
+    if isinstance(address, tuple) and len(address) >= 2:
+        address = '%s:%d' % address[:2]
+    else:
+        address = 'localhost'
+    return 'scscp://%s/%s/%s' % (address, kind, key)
+
+
+def parse_url(url):
+    """ Returns the pair ``(kind, key)`` of a URL, or None """
+    match = _url_regex.match(url)
+    return match.groups() if match else None
+
+
+def sizeof(obj):
+    """ A rough estimate of the memory used by an OpenMath object """
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        size += 64
+        if isinstance(obj, om.OMInteger):
+            size += obj.integer.bit_length() // 8
+        elif isinstance(obj, om.OMString):
+            size += len(obj.string or '')
+        elif isinstance(obj, om.OMBytes):
+            size += len(obj.bytes)
+        elif isinstance(obj, om.OMForeign):
+            size += len(str(obj.obj))
+        elif isinstance(obj, om.OMApplication):
+            stack.append(obj.elem)
+            stack.extend(obj.arguments)
+        elif isinstance(obj, (om.OMAttribution, om.OMAttVar)):
+            stack.append(obj.pairs)
+            stack.append(obj.obj)
+        elif isinstance(obj, om.OMAttributionPairs):
+            for k, v in obj.pairs:
+                stack.append(k)
+                stack.append(v)
+        elif isinstance(obj, om.OMBinding):
+            stack.extend((obj.binder, obj.vars, obj.obj))
+        elif isinstance(obj, om.OMBindVariables):
+            stack.extend(obj.vars)
+        elif isinstance(obj, om.OMError):
+            stack.append(obj.name)
+            stack.extend(obj.params)
+        elif isinstance(obj, om.OMObject):
+            stack.append(obj.omel)
+    return size
+
+
+class SessionStore(object):
+    """
+    An in-memory LRU store, bounded in (estimated) memory size.
+
+    When full, the least recently used objects are dropped.
+    """
+
+    def __init__(self, max_size=1 << 26):
+        self.max_size = max_size
+        self.size = 0
+        self._objects = OrderedDict()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def store(self, obj):
+        """ Store an object, return its key """
+        key = uuid.uuid4().hex
+        size = sizeof(obj)
+        self._objects[key] = (obj, size)
+        self.size += size
+        while self.size > self.max_size and len(self._objects) > 1:
+            _, (_, s) = self._objects.popitem(last=False)
+            self.size -= s
+        return key
+
+    def get(self, key):
+        """ Retrieve an object, raise KeyError if unknown """
+        obj, _ = self._objects[key]
+        self._objects.move_to_end(key)
+        return obj
+
+    def delete(self, key):
+        """ Delete an object, raise KeyError if unknown """
+        _, size = self._objects.pop(key)
+        self.size -= size
+
+    def clear(self):
+        self._objects.clear()
+        self.size = 0
+
+
+class PersistentStore(object):
+    """
+    A store keeping encoded objects on disk, in ``directory``.
+
+    If no directory is given, a temporary one is created, and removed
+    by ``close()``.
+    """
+
+    def __init__(self, directory=None):
+        self._temporary = directory is None
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        if self.directory is None:
+            with self._lock:
+                if self.directory is None:
+                    self.directory = tempfile.mkdtemp(prefix='scscp-')
+        return os.path.join(self.directory, key + '.om')
+
+    def store(self, obj):
+        """ Store an object, return its key """
+        key = uuid.uuid4().hex
+        path = self._path(key)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(encoder.encode_bytes(om.OMObject(obj)))
+        os.rename(path + '.tmp', path)
+        return key
+
+    def get(self, key):
+        """ Retrieve an object, raise KeyError if unknown """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return decode_xml(f.read()).omel
+        except (IOError, OSError):
+            raise KeyError(key)
+
+    def delete(self, key):
+        """ Delete an object, raise KeyError if unknown """
+        try:
+            os.remove(self._path(key))
+        except (IOError, OSError):
+            raise KeyError(key)
+
+    def close(self):
+        """ Remove the directory, if temporary """
+        if self._temporary and self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
@@ -0,0 +1,129 @@
+"""
+Incremental decoding of XML OpenMath objects.
+
+``StreamingDecoder`` is fed the payload of an SCSCP message chunk by
+chunk, as it arrives from the network. Each XML element is converted
+to an OpenMath object as soon as it is complete, and then dropped
+from the XML tree, so that the whole message is never held in memory
+as bytes or as a tree.
+"""
+
+import base64
+from lxml import etree
+from openmath import openmath as om, xml
+
+
+class StreamingDecoder(object):
+    """
+    Incremental equivalent of ``openmath.decoder.decode_bytes``.
+
+    Call ``feed()`` with successive chunks, then ``close()`` to get
+    the decoded object. Errors raised while feeding are deferred to
+    ``close()``, so that the caller can keep consuming the message.
+    """
+
+    def __init__(self):
+        self._parser = etree.XMLPullParser(events=('start', 'end'))
+        self._stack = [[]]
+        self._error = None
+
+    def feed(self, data):
+        if self._error is not None:
+            return
+        try:
+            self._parser.feed(bytes(data))
+            self._process()
+        except Exception as e:
+            self._error = e
+
+    def close(self):
+        """ Finish decoding, return the OpenMath object """
+        if self._error is None:
+            try:
+                self._parser.close()
+                self._process()
+            except Exception as e:
+                self._error = e
+        if self._error is not None:
+            raise self._error
+        root, = self._stack[0]
+        if not isinstance(root, om.OMObject) or root.version != "2.0":
+            raise ValueError("Only OpenMath 2.0 is supported")
+        return root
+
+    def _process(self):
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                self._stack.append([])
+                continue
+            children = self._stack.pop()
+            parent = elem.getparent()
+            in_bind = (parent is not None
+                       and xml.tag_to_object(parent.tag) is om.OMBindVariables)
+            self._stack[-1].append(self._build(elem, children, in_bind))
+            # free the memory used by the finished subtree
+            elem.clear()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+    @staticmethod
+    def _build(elem, children, in_bind):
+        """ Same as ``openmath.decoder.decode_xml``, given the decoded children """
+        obj = xml.tag_to_object(elem.tag)
+        attrs = {}
+
+        def a2d(*props):
+            for p in props:
+                attrs[p] = elem.get(p)
+
+        if issubclass(obj, om.CommonAttributes):
+            a2d("id")
+        if issubclass(obj, om.CDBaseAttribute):
+            a2d("cdbase")
+
+        if issubclass(obj, om.OMObject):
+            a2d("version")
+            attrs["omel"] = children[0]
+        elif issubclass(obj, om.OMReference):
+            a2d("href")
+        elif issubclass(obj, om.OMInteger):
+            attrs["integer"] = int(elem.text)
+        elif issubclass(obj, om.OMFloat):
+            attrs["double"] = float(elem.get('dec'))
+        elif issubclass(obj, om.OMString):
+            attrs["string"] = elem.text
+        elif issubclass(obj, om.OMBytes):
+            attrs["bytes"] = base64.b64decode(elem.text or '')
+        elif issubclass(obj, om.OMSymbol):
+            a2d("name", "cd")
+        elif issubclass(obj, om.OMVariable):
+            a2d("name")
+        elif issubclass(obj, om.OMForeign):
+            attrs["obj"] = elem.text
+            a2d("encoding")
+        elif issubclass(obj, om.OMApplication):
+            attrs["elem"] = children[0]
+            attrs["arguments"] = children[1:]
+        elif issubclass(obj, om.OMAttribution):
+            attrs["pairs"] = children[0]
+            attrs["obj"] = children[1]
+        elif issubclass(obj, om.OMAttributionPairs):
+            if not in_bind:
+                attrs["pairs"] = list(zip(children[::2], children[1::2]))
+            else:
+                obj = om.OMAttVar
+                attrs.pop("cdbase", None)
+                attrs["pairs"] = children[0]
+                attrs["obj"] = children[1]
+        elif issubclass(obj, om.OMBinding):
+            attrs["binder"], attrs["vars"], attrs["obj"] = children
+        elif issubclass(obj, om.OMBindVariables):
+            attrs["vars"] = children
+        elif issubclass(obj, om.OMError):
+            attrs["name"] = children[0]
+            attrs["params"] = children[1:]
+        else:
+            raise TypeError("Expected OMAny, found %s." % obj.__name__)
+
+        return obj(**attrs)
@@ -0,0 +1,320 @@
+"""
+Execution of procedure calls in worker processes.
+
+The functions in this module run inside the worker processes of a
+``concurrent.futures.ProcessPoolExecutor`` (or any executor with the
+same interface). Calls and results cross the process boundary as
+encoded OpenMath bytes, which are cheap to pickle.
+
+``IsolatedProcessExecutor`` runs each call in a process of its own,
+which is killed if the call is terminated by the client, and may be
+limited in time and memory.
+"""
+
+import os
+import sys
+import math
+import time
+import signal
+import logging
+import threading
+import multiprocessing
+from concurrent import futures
+from openmath import openmath as om, encoder
+from .scscp import SCSCPProcedureMessage
+from .lazy import decode_xml
+
+# Signal sent when the CPU time limit is exceeded
+_SIGXCPU = getattr(signal, 'SIGXCPU', None)
+
+# Kinds of results sent back by the workers
+OBJECT = 0
+MESSAGE = 1
+
+
+class CallTerminated(BaseException):
+    """
+    Raised in a computation terminated by the client
+
+    It is not an ``Exception``, so that handlers catching all errors
+    do not catch it.
+    """
+    pass
+
+
+class WorkerDied(RuntimeError):
+    """ A worker process exited without returning a result """
+    pass
+
+
+class LimitExceeded(RuntimeError):
+    """ A call exceeded its ``runtime`` or ``memory`` limit """
+
+    def __init__(self, kind, msg):
+        super(LimitExceeded, self).__init__(msg)
+        self.kind = kind
+
+    def __reduce__(self):
+        return (LimitExceeded, (self.kind, str(self)))
+
+
+class ProcessFuture(futures.Future):
+    """ The future of a call run in its own process, which may be killed """
+
+    def __init__(self):
+        super(ProcessFuture, self).__init__()
+        # resources used by the call, see IsolatedProcessExecutor.submit_limited
+        self.usage = None
+        self._process = None
+        self._killed = False
+        self._kill_lock = threading.Lock()
+
+    def _started(self, process):
+        with self._kill_lock:
+            self._process = process
+            if self._killed:
+                process.kill()
+
+    def kill(self):
+        """ Cancel the call if it has not started, or kill its process """
+        if self.cancel():
+            return True
+        with self._kill_lock:
+            if self.done():
+                return False
+            self._killed = True
+            if self._process is not None:
+                self._process.kill()
+        return True
+
+
+def _address_space():
+    """ The size of the address space of this process, in bytes, or 0 """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _set_limits(runtime, max_memory):
+    try:
+        import resource
+    except ImportError:
+        return
+    if runtime is not None:
+        seconds = max(int(math.ceil(runtime / 1000.)), 1)
+        _set_limit(resource, resource.RLIMIT_CPU, seconds, seconds + 1)
+    if max_memory is not None:
+        # the memory of the computation, on top of the interpreter
+        size = _address_space() + max_memory
+        _set_limit(resource, resource.RLIMIT_AS, size, size)
+
+
+def _set_limit(resource, limit, soft, hard):
+    old_soft, old_hard = resource.getrlimit(limit)
+    if old_hard != resource.RLIM_INFINITY:
+        soft, hard = min(soft, old_hard), min(hard, old_hard)
+    try:
+        resource.setrlimit(limit, (soft, hard))
+    except (ValueError, OSError):
+        # not supported on this platform
+        pass
+
+
+def _peak_memory():
+    """ The peak resident memory of this process, in bytes, or None """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _run_in_process(conn, fn, args, kwds, limits=None):
+    start = time.perf_counter()
+    try:
+        if limits is not None:
+            _set_limits(*limits)
+        res = (True, fn(*args, **kwds))
+    except MemoryError:
+        res = (False, LimitExceeded('memory', "Memory limit exceeded."))
+    except Exception as e:
+        res = (False, e)
+    usage = {'runtime': int(round((time.perf_counter() - start) * 1000)),
+             'memory': _peak_memory()}
+    try:
+        conn.send(res + (usage,))
+    except Exception as e:
+        # unpicklable result or exception
+        conn.send((False, WorkerDied("Cannot send result: %r" % e), usage))
+    finally:
+        conn.close()
+
+
+def default_context():
+    """ The ``forkserver`` context if supported, else ``spawn`` """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class IsolatedProcessExecutor(object):
+    """
+    An executor running each call in a new process.
+
+    At most ``max_workers`` processes run at once (the number of CPUs
+    by default). Futures have a ``kill`` method, which kills the
+    process of a running call: ``SCSCPSocketServer`` uses it to honor
+    the ``terminate`` messages of clients. ``mp_context`` is a
+    ``multiprocessing`` context, as for ``ProcessPoolExecutor``; by
+    default, processes are started by a fork server where available,
+    since forking a multi-threaded server may deadlock the child.
+    """
+
+    def __init__(self, max_workers=None, mp_context=None):
+        self._context = mp_context or default_context()
+        self._slots = threading.BoundedSemaphore(max_workers or os.cpu_count() or 1)
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwds):
+        return self._submit(fn, args, kwds, None)
+
+    def submit_limited(self, fn, args=(), runtime=None, max_memory=None):
+        """
+        Run ``fn(*args)`` in at most ``runtime`` milliseconds, using at
+        most ``max_memory`` bytes besides the memory of the interpreter.
+
+        A limit that is exceeded raises ``LimitExceeded`` from the
+        future. Once the call is done, ``future.usage`` is a dictionary
+        of its ``runtime`` (in milliseconds) and peak ``memory`` (the
+        resident memory of the process, in bytes, if known).
+
+        The run time is enforced on the wall clock, and on the CPU time
+        of the process. The memory is limited by ``RLIMIT_AS``, where
+        the ``resource`` module supports it.
+        """
+        return self._submit(fn, args, {}, (runtime, max_memory))
+
+    def _submit(self, fn, args, kwds, limits):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit after shutdown.")
+            fut = ProcessFuture()
+            self._futures.add(fut)
+        fut.add_done_callback(self._discard)
+        thread = threading.Thread(target=self._run, args=(fut, fn, args, kwds, limits))
+        thread.daemon = True
+        thread.start()
+        return fut
+
+    def _discard(self, fut):
+        with self._lock:
+            self._futures.discard(fut)
+
+    def _run(self, fut, fn, args, kwds, limits):
+        with self._slots:
+            if not fut.set_running_or_notify_cancel():
+                return
+            try:
+                recv, send = self._context.Pipe(duplex=False)
+                process = self._context.Process(target=_run_in_process,
+                                                args=(send, fn, args, kwds, limits))
+                process.daemon = True
+                process.start()
+                send.close()
+            except BaseException as e:
+                fut.set_exception(e)
+                return
+            fut._started(process)
+            runtime = limits[0] if limits is not None else None
+            timed_out = False
+            try:
+                if runtime is not None and not recv.poll(runtime / 1000.):
+                    timed_out = True
+                    process.kill()
+                ok, res, fut.usage = recv.recv()
+            except EOFError:
+                ok, res = False, None
+            except Exception as e:
+                ok, res = False, e
+            finally:
+                recv.close()
+            process.join()
+            if ok:
+                fut.set_result(res)
+            elif res is not None:
+                fut.set_exception(res)
+            elif fut._killed:
+                fut.set_exception(CallTerminated())
+            elif timed_out or (_SIGXCPU is not None and runtime is not None
+                                and process.exitcode == -_SIGXCPU):
+                fut.set_exception(LimitExceeded('runtime', "Runtime limit of %d ms exceeded."
+                                                % runtime))
+            else:
+                fut.set_exception(WorkerDied("Worker exited with code %s." % process.exitcode))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            pending = list(self._futures)
+        if cancel_futures:
+            for fut in pending:
+                fut.cancel()
+        if wait:
+            futures.wait(pending)
+
+
+class WorkerServer(object):
+    """ Stands for the SCSCP server inside worker processes """
+
+    def __init__(self, name, version, description):
+        self.name = name
+        self.version = version
+        self.description = description
+        self.log = logging.getLogger(__name__)
+
+    @classmethod
+    def of(cls, server):
+        """ The (picklable) arguments needed to rebuild ``server`` """
+        return (server.name, server.version, server.description)
+
+
+# One handler per class and server, per worker process
+_handlers = {}
+
+def _get_handler(handler_class, server_info):
+    key = (handler_class, server_info)
+    handler = _handlers.get(key)
+    if handler is None:
+        handler = _handlers[key] = handler_class.detached(WorkerServer(*server_info))
+    return handler
+
+
+def handle_call(handler_class, server_info, msg, head):
+    """
+    Run ``handler_class.handle_call`` on an encoded procedure call.
+
+    Returns a pair ``(kind, bytes)``, where ``kind`` is ``MESSAGE`` if
+    the handler returned a ``SCSCPProcedureMessage``, ``OBJECT``
+    otherwise. Exceptions raised by the handler are propagated.
+    """
+    handler = _get_handler(handler_class, server_info)
+    call = SCSCPProcedureMessage.from_om(decode_xml(msg))
+    res = handler.handle_call(call, head)
+    if isinstance(res, SCSCPProcedureMessage):
+        return MESSAGE, encoder.encode_bytes(res.om())
+    else:
+        return OBJECT, encoder.encode_bytes(om.OMObject(res))
+
+
+def decode_result(kind, msg):
+    """ Decode the result of ``handle_call`` """
+    obj = decode_xml(msg)
+    if kind == MESSAGE:
+        return SCSCPProcedureMessage.from_om(obj)
+    else:
+        return obj.omel
@@ -10,10 +10,16 @@ setup(
     classifiers=[
         'Intended Audience :: Science/Research',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 2',
         'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
     keywords='openmath scscp',
     packages=find_packages(),
-    install_requires=['openmath>=0.3.0', 'pexpect', 'six'],
+    python_requires='>=3.7',
+    install_requires=['openmath>=0.3.0', 'six'],
 )
@@ -0,0 +1,143 @@
+import unittest
+import socket
+import time
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.client import SCSCPClient
+from scscp.scscp import SCSCPQuit
+from scscp.admission import Admission
+from scscp.socketserver import procedure
+from examples.demo_server import Server, DemoServerRequestHandler
+
+class SleepRequestHandler(DemoServerRequestHandler):
+    @procedure('test', convert=True)
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        return True
+
+def _sleep(seconds):
+    return om.OMApplication(om.OMSymbol('sleep', 'test'), [om.OMFloat(seconds)])
+
+class TestAdmission(unittest.TestCase):
+    def test_connections(self):
+        admission = Admission(max_connections=1)
+        self.assertTrue(admission.open_connection())
+        self.assertFalse(admission.open_connection())
+        admission.close_connection()
+        self.assertTrue(admission.open_connection())
+        self.assertEqual(admission.stats()['rejected_connections'], 1)
+
+    def test_calls(self):
+        admission = Admission(max_calls=1, max_pending=1)
+        self.assertTrue(admission.enter())
+        admission.start()
+        self.assertTrue(admission.enter())
+        self.assertFalse(admission.enter())
+        self.assertEqual(admission.stats()['pending'], 1)
+        started = []
+        t = Thread(target=lambda: started.append(admission.start()))
+        t.start()
+        time.sleep(0.1)
+        self.assertEqual(started, [])
+        admission.stop()
+        admission.leave()
+        t.join()
+        self.assertEqual(admission.stats()['running'], 1)
+
+    def test_cancel(self):
+        admission = Admission(max_calls=1)
+        admission.start()
+        cancelled = []
+        started = []
+        t = Thread(target=lambda: started.append(admission.start(lambda: cancelled)))
+        t.start()
+        time.sleep(0.1)
+        self.assertEqual(started, [])
+        cancelled.append(True)
+        admission.wake()
+        t.join(5)
+        self.assertEqual(started, [False])
+        self.assertEqual(admission.stats()['running'], 1)
+
+class TestServerAdmission(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0, max_connections=2, max_calls=1, max_pending=0,
+                             metrics=True)
+        self.server.RequestHandlerClass = SleepRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def _client(self):
+        client = SCSCPClient(socket.create_connection(self.server.server_address))
+        client.connect()
+        return client
+
+    def test_connections(self):
+        clients = [self._client(), self._client()]
+        with self.assertRaises(SCSCPQuit):
+            self._client()
+        self.assertEqual(self.server.admission.stats()['rejected_connections'], 1)
+        clients.pop().quit()
+        for _ in range(100):
+            if self.server.admission.stats()['connections'] < 2:
+                break
+            time.sleep(0.01)
+        clients.append(self._client())
+        for c in clients:
+            c.quit()
+
+    def test_calls(self):
+        busy, other = self._client(), self._client()
+        busy.call(_sleep(1))
+        time.sleep(0.3)
+        start = time.time()
+        other.call(_sleep(0))
+        resp = other.wait()
+        self.assertEqual(resp.type, 'procedure_terminated')
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(busy.wait().type, 'procedure_completed')
+        self.assertEqual(self.server.admission.stats()['rejected_calls'], 1)
+        self.assertIn('scscp_admission_rejected_calls 1', self.server.metrics.prometheus())
+        busy.quit()
+        other.quit()
+
+class TestQueuedTerminate(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0, max_calls=1)
+        self.server.RequestHandlerClass = SleepRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def test_terminate(self):
+        busy, other = [SCSCPClient(socket.create_connection(self.server.server_address))
+                       for i in range(2)]
+        busy.connect()
+        other.connect()
+        busy.call(_sleep(1))
+        time.sleep(0.2)
+        # waits for the slot of the busy call
+        call = other.call(_sleep(0))
+        time.sleep(0.2)
+        start = time.time()
+        other.terminate(call.id)
+        resp = other.wait()
+        self.assertEqual((resp.id, resp.type), (call.id, 'procedure_terminated'))
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(busy.wait().type, 'procedure_completed')
+        self.assertEqual(self.server.admission.stats()['running'], 0)
+        busy.quit()
+        other.quit()
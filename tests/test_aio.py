@@ -0,0 +1,105 @@
+import unittest
+import asyncio
+from threading import Thread
+
+from openmath import openmath as om, convert
+
+from scscp.aio import AsyncSCSCPClient, AsyncSCSCPSocketServer
+from scscp.cli import SCSCPCLI
+from scscp import client
+from examples.demo_server import Server, DemoServerRequestHandler
+
+def plus(a, b):
+    return om.OMApplication(om.OMSymbol('plus', 'arith1'), [om.OMInteger(a), om.OMInteger(b)])
+
+class TestAsyncClient(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0)
+        self.port = self.server.server_address[1]
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def run_async(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_handshake(self):
+        async def go():
+            c = await AsyncSCSCPClient.open('localhost', self.port)
+            self.assertEqual(c.status, client.CONNECTED)
+            self.assertEqual(c.service_info['service_name'], b'DemoServer')
+            await c.close()
+            self.assertEqual(c.status, client.CLOSED)
+        self.run_async(go())
+
+    def test_pipelined(self):
+        async def go():
+            c = await AsyncSCSCPClient.open('localhost', self.port)
+            futs = [c.submit(plus(i, i)) for i in range(100)]
+            await c.drain()
+            resps = await asyncio.gather(*futs)
+            await c.close()
+            return resps
+        resps = self.run_async(go())
+        self.assertEqual([r.type for r in resps], ['procedure_completed'] * 100)
+        self.assertEqual([convert.to_python(r.data) for r in resps], [2*i for i in range(100)])
+
+    def test_call(self):
+        async def go():
+            c = await AsyncSCSCPClient.open('localhost', self.port)
+            resp = await c.call(plus(1, 2))
+            await c.close()
+            return resp
+        self.assertEqual(self.run_async(go()).data, om.OMInteger(3))
+
+    def test_timeout(self):
+        async def go():
+            c = await AsyncSCSCPClient.open('localhost', self.port)
+            with self.assertRaises(client.TimeoutError):
+                await c.call(plus(1, 2), timeout=0)
+            self.assertEqual(c._pending, {})
+            # the late response is discarded
+            resp = await c.call(plus(3, 4))
+            await c.close()
+            return resp
+        self.assertEqual(self.run_async(go()).data, om.OMInteger(7))
+
+class TestAsyncServer(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = AsyncSCSCPSocketServer(port=0, name=b'DemoServer', description='Demo SCSCP server',
+                                             RequestHandlerClass=DemoServerRequestHandler)
+        self.loop.run_until_complete(self.server.start())
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.server.close())
+        self.loop.close()
+
+    def test_many_sessions(self):
+        async def session(i):
+            c = await AsyncSCSCPClient.open('localhost', self.port)
+            resp = await c.call(plus(i, 1))
+            await c.close()
+            return convert.to_python(resp.data)
+        async def go():
+            return await asyncio.gather(*(session(i) for i in range(200)))
+        self.assertEqual(self.loop.run_until_complete(go()), [i + 1 for i in range(200)])
+
+    def test_sync_client(self):
+        def go():
+            c = SCSCPCLI('localhost', self.port)
+            res = (c.heads.arith1.power([2, 100]), c.get_description())
+            c.quit()
+            return res
+        res = self.loop.run_until_complete(self.loop.run_in_executor(None, go))
+        self.assertEqual(res, (2**100, ["DemoServer", "none", "Demo SCSCP server"]))
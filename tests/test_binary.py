@@ -0,0 +1,68 @@
+import unittest
+import socket
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp import binary, scscp
+from scscp.client import SCSCPClient
+from scscp.server import SCSCPServer, SCSCPServerBase
+
+OBJECTS = [
+    om.OMInteger(5), om.OMInteger(-200), om.OMInteger(2**31), om.OMInteger(-3**200),
+    om.OMFloat(1.5, id='x'), om.OMBytes(b'<\x1b\x01\x00'),
+    om.OMString('<?scscp end ?>\x1b\n'), om.OMString('x' * 300),
+    om.OMVariable('x'), om.OMReference('scscp://localhost/session/ab'),
+    om.OMForeign('foo', 'text/plain'),
+    om.OMSymbol('s', 'cd', cdbase='http://example.org'),
+    om.OMError(om.OMSymbol('unhandled_symbol', 'error'), [om.OMString('foo')]),
+    om.OMBinding(om.OMSymbol('lambda', 'fns1'),
+                 om.OMBindVariables([om.OMVariable('x'), om.OMAttVar(
+                     om.OMAttributionPairs([(om.OMSymbol('type', 'sts'), om.OMSymbol('Z', 'setname1'))]),
+                     om.OMVariable('y'))]),
+                 om.OMVariable('x')),
+    scscp.SCSCPProcedureMessage.call(scscp.get_allowed_heads(), id='myid', return_object='True').om(),
+]
+
+class TestBinaryCodec(unittest.TestCase):
+    def test_roundtrip(self):
+        for obj in OBJECTS:
+            data = binary.encode_bytes(obj)
+            self.assertNotIn(b'<', data)
+            self.assertEqual(binary.decode_bytes(b'\n' + data + b'\n'), obj)
+
+    def test_errors(self):
+        data = binary.encode_bytes(OBJECTS[-1])
+        self.assertRaises(binary.BinaryDecodeError, binary.decode_bytes, data[:-1])
+        self.assertRaises(binary.BinaryDecodeError, binary.decode_bytes, data + b'\x01')
+
+class TestNegotiation(unittest.TestCase):
+    def connect(self, server_class, encoding):
+        a, b = socket.socketpair()
+        client = SCSCPClient(a, encoding=encoding)
+        server = server_class(b, name=b'Test', version=b'none')
+        t = Thread(target=server.accept)
+        t.start()
+        client.connect()
+        t.join()
+        return client, server
+
+    def test_binary(self):
+        client, server = self.connect(SCSCPServer, 'binary')
+        self.assertEqual((client.encoding, server.encoding), ('binary', 'binary'))
+        call = client.call(om.OMApplication(om.OMSymbol('plus', 'arith1'), [om.OMInteger(2**100)]))
+        msg = server.wait()
+        self.assertEqual((msg.id, msg.data), (call.id, call.data))
+        server.completed(call.id, om.OMInteger(-2**100))
+        self.assertEqual(client.wait().data, om.OMInteger(-2**100))
+        client.quit()
+
+    def test_fallback(self):
+        client, server = self.connect(SCSCPServerBase, 'binary')
+        self.assertEqual((client.encoding, server.encoding), ('xml', 'xml'))
+        client.quit()
+
+    def test_not_requested(self):
+        client, server = self.connect(SCSCPServer, None)
+        self.assertEqual((client.encoding, server.encoding), ('xml', 'xml'))
+        client.quit()
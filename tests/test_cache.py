@@ -0,0 +1,205 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.cli import SCSCPCLI
+from scscp.cache import ResultCache, HeadsCache
+from scscp.inprocess import InProcessServer
+from examples.demo_server import Server, DemoServerRequestHandler
+
+class CountingRequestHandler(DemoServerRequestHandler):
+    calls = 0
+
+    def handle_call(self, call, head):
+        CountingRequestHandler.calls += 1
+        return super(CountingRequestHandler, self).handle_call(call, head)
+
+class CountingCLI(SCSCPCLI):
+    discoveries = 0
+
+    def _get_allowed_heads(self):
+        CountingCLI.discoveries += 1
+        return super(CountingCLI, self)._get_allowed_heads()
+
+class TestResultCache(unittest.TestCase):
+    def test_lru(self):
+        cache = ResultCache(max_entries=2)
+        keys = [cache.key(om.OMInteger(i)) for i in range(3)]
+        for i, k in enumerate(keys):
+            cache.put(k, om.OMInteger(i))
+            cache.get(keys[0])
+        self.assertEqual(cache.get(keys[0]), om.OMInteger(0))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.get(keys[2]), om.OMInteger(2))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_size(self):
+        cache = ResultCache(max_size=1000)
+        for i in range(100):
+            cache.put(cache.key(om.OMInteger(i)), om.OMString('x' * 100))
+        self.assertLessEqual(cache.size, 1000)
+        cache.put(b'big', om.OMString('x' * 1000))
+        self.assertIsNone(cache.get(b'big'))
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.1)
+        cache.put(b'key', om.OMInteger(1))
+        self.assertEqual(cache.get(b'key'), om.OMInteger(1))
+        time.sleep(0.2)
+        self.assertIsNone(cache.get(b'key'))
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_version(self):
+        cache = ResultCache()
+        cache.check_version(1)
+        cache.put(b'key', om.OMInteger(1))
+        cache.check_version(1)
+        self.assertEqual(cache.get(b'key'), om.OMInteger(1))
+        cache.check_version(2)
+        self.assertIsNone(cache.get(b'key'))
+
+class TestServerCache(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0, result_cache=1 << 20)
+        self.server.RequestHandlerClass = CountingRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+        self.clients = [SCSCPCLI('localhost', self.server.server_address[1]) for _ in range(2)]
+        CountingRequestHandler.calls = 0
+
+    def tearDown(self):
+        for c in self.clients:
+            c.quit()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def test_shared(self):
+        for c in self.clients:
+            self.assertEqual(c.heads.arith1.power([2, 100]), 2**100)
+            self.assertEqual(c.heads.arith1.power([2, 100]), 2**100)
+        self.assertEqual(CountingRequestHandler.calls, 1)
+        stats = self.server.result_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+        self.assertEqual(self.clients[0].heads.arith1.power([2, 101]), 2**101)
+        self.assertEqual(CountingRequestHandler.calls, 2)
+
+    def test_cookie(self):
+        ref = self.clients[0].heads.arith1.plus([1, 2], cookie=True)
+        self.assertEqual(ref.retrieve(), 3)
+        self.assertEqual(self.clients[0].heads.arith1.plus([1, 2]), 3)
+        self.assertEqual(CountingRequestHandler.calls, 1)
+
+class TestClientCache(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0)
+        self.server.RequestHandlerClass = CountingRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+        self.cache = ResultCache(1 << 20)
+        CountingRequestHandler.calls = 0
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def client(self):
+        return SCSCPCLI('localhost', self.server.server_address[1], cache=self.cache,
+                        pure_heads=[('arith1', 'power')])
+
+    def test_pure(self):
+        c = self.client()
+        calls = CountingRequestHandler.calls
+        for i in range(3):
+            self.assertEqual(c.heads.arith1.power([2, 100]), 2**100)
+            self.assertEqual(c.heads.arith1.plus([1, 2]), 3)
+        self.assertEqual(CountingRequestHandler.calls - calls, 4)
+        # references are not cached
+        self.assertEqual(c.heads.arith1.power([2, 100], cookie=True).retrieve(), 2**100)
+        self.assertEqual(CountingRequestHandler.calls - calls, 5)
+        c.quit()
+
+    def test_service_version(self):
+        c = self.client()
+        c.heads.arith1.power([2, 100])
+        c.quit()
+        # same service, the cache is kept
+        c = self.client()
+        calls = CountingRequestHandler.calls
+        c.heads.arith1.power([2, 100])
+        self.assertEqual(CountingRequestHandler.calls, calls)
+        c.quit()
+        # the server was restarted
+        self.server.service_id = b'restarted'
+        c = self.client()
+        calls = CountingRequestHandler.calls
+        c.heads.arith1.power([2, 100])
+        self.assertEqual(CountingRequestHandler.calls, calls + 1)
+        c.quit()
+
+class TestHeadsCache(unittest.TestCase):
+    info = {'service_name': b'Test', 'service_version': b'1', 'service_id': b'42'}
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        CountingCLI.discoveries = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get_put(self):
+        cache = HeadsCache(os.path.join(self.dir, 'heads'))
+        self.assertIsNone(cache.get(self.info))
+        cache.put(self.info, [('arith1', 'plus'), ('scscp1', None)])
+        self.assertEqual(cache.get(self.info), [('arith1', 'plus'), ('scscp1', None)])
+        for k in self.info:
+            self.assertIsNone(cache.get(dict(self.info, **{k: b'other'})))
+        # without service id, nothing is cached
+        info = dict(self.info, service_id=None)
+        cache.put(info, [('arith1', 'plus')])
+        self.assertIsNone(cache.get(info))
+        cache.clear()
+        self.assertIsNone(cache.get(self.info))
+
+    def test_ttl(self):
+        cache = HeadsCache(self.dir, ttl=60)
+        cache.put(self.info, [('arith1', 'plus')])
+        self.assertEqual(cache.get(self.info), [('arith1', 'plus')])
+        path = os.path.join(self.dir, cache.key(self.info) + '.json')
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        self.assertIsNone(cache.get(self.info))
+
+    def test_corrupt(self):
+        cache = HeadsCache(self.dir)
+        with open(os.path.join(self.dir, cache.key(self.info) + '.json'), 'w') as f:
+            f.write('{"heads": [')
+        self.assertIsNone(cache.get(self.info))
+
+    def test_client(self):
+        server = InProcessServer(RequestHandlerClass=DemoServerRequestHandler)
+        try:
+            cache = HeadsCache(self.dir)
+            for i in range(3):
+                c = CountingCLI(sock=server.connect(), heads_cache=cache)
+                self.assertIn('plus', c.heads.arith1)
+                self.assertIn('scscp1', c.heads)
+                self.assertEqual(c.heads.arith1.plus([1, 2]), 3)
+                c.quit()
+            self.assertEqual(CountingCLI.discoveries, 1)
+            # the server was restarted
+            server.service_id = b'restarted'
+            c = CountingCLI(sock=server.connect(), heads_cache=cache)
+            self.assertIn('plus', c.heads.arith1)
+            c.quit()
+            self.assertEqual(CountingCLI.discoveries, 2)
+        finally:
+            server.close()
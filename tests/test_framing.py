@@ -0,0 +1,102 @@
+import unittest
+import socket
+from threading import Thread
+
+from scscp import framing
+from scscp.framing import PIFramer, SocketStream, send_frame
+
+class TestFramer(unittest.TestCase):
+    def test_split(self):
+        """ Test PIs split across chunks """
+        stream = b'<?scscp start ?>\n<OMOBJ/>\n<?scscp end ?>\n<?scscp quit ?>'
+        for size in (1, 2, 7, 8, 100):
+            framer = PIFramer()
+            frames = []
+            for i in range(0, len(stream), size):
+                framer.feed(stream[i:i+size])
+                frame = framer.next_PI()
+                while frame is not None:
+                    frames.append(frame)
+                    frame = framer.next_PI()
+            self.assertEqual(frames, [(b'', b'<?scscp start ?>'),
+                                      (b'\n<OMOBJ/>\n', b'<?scscp end ?>'),
+                                      (b'\n', b'<?scscp quit ?>')], "Chunk size %d" % size)
+
+    def test_not_a_PI(self):
+        """ Test things looking like PIs """
+        framer = PIFramer()
+        framer.feed(b'<?scscpfoo <?scscp ' + b'x' * framing.MAX_PI_LENGTH + b'<?scscp end ?>')
+        before, pi = framer.next_PI()
+        self.assertEqual(pi, b'<?scscp end ?>')
+        self.assertEqual(len(before), 19 + framing.MAX_PI_LENGTH)
+        self.assertIsNone(framer.next_PI())
+
+    def test_large(self):
+        """ Test a payload handed out without copying """
+        payload = b'x' * (1 << 20)
+        framer = PIFramer()
+        framer.feed(b'<?scscp start ?>')
+        self.assertEqual(framer.next_PI(), (b'', b'<?scscp start ?>'))
+        framer.feed(payload)
+        framer.feed(b'<?scscp end ?><?scscp')
+        before, pi = framer.next_PI()
+        self.assertEqual(before, payload)
+        framer.feed(b' quit ?>')
+        self.assertEqual(framer.next_PI(), (b'', b'<?scscp quit ?>'))
+        self.assertEqual(len(framer), 0)
+
+class ShortWriteSocket(object):
+    """ A socket sending at most 3 bytes at a time """
+    def __init__(self):
+        self.data = b''
+
+    def sendmsg(self, buffers):
+        data = b''.join(bytes(b) for b in buffers)[:3]
+        self.data += data
+        return len(data)
+
+class TestSendFrame(unittest.TestCase):
+    def test_partial(self):
+        sock = ShortWriteSocket()
+        send_frame(sock, framing.START, bytearray(b'<OMOBJ/>'), framing.END)
+        self.assertEqual(sock.data, b'<?scscp start ?>\n<OMOBJ/>\n<?scscp end ?>\n')
+
+    def test_single_call(self):
+        a, b = socket.socketpair()
+        calls = []
+        class Sock(object):
+            def sendmsg(self, buffers):
+                calls.append(buffers)
+                return a.sendmsg(buffers)
+        send_frame(Sock(), framing.START, b'x' * 1000, framing.END)
+        self.assertEqual(len(calls), 1)
+        stream = SocketStream(b, timeout=1)
+        self.assertEqual(stream.expect_PI(), b'<?scscp start ?>')
+        self.assertEqual(stream.expect_PI(), b'<?scscp end ?>')
+        self.assertEqual(stream.before, b'\n' + b'x' * 1000 + b'\n')
+        a.close()
+        b.close()
+
+class TestSocketStream(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+        self.stream = SocketStream(self.b, timeout=0.1)
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+
+    def test_expect(self):
+        t = Thread(target=self.a.sendall, args=(b'hello <?scscp end ?>',))
+        t.start()
+        self.assertEqual(self.stream.expect_PI(), b'<?scscp end ?>')
+        self.assertEqual(self.stream.before, b'hello ')
+        t.join()
+
+    def test_timeout(self):
+        self.a.sendall(b'<?scscp end')
+        self.assertRaises(framing.TIMEOUT, self.stream.expect_PI)
+
+    def test_eof(self):
+        self.a.close()
+        self.assertRaises(framing.EOF, self.stream.expect_PI, None)
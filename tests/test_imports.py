@@ -0,0 +1,14 @@
+import unittest
+import subprocess
+import sys
+
+# Modules that are slow to import, and not needed by clients
+HEAVY = ['openmath.decoder', 'pkg_resources', 'pexpect', 'xml.sax.saxutils']
+
+class TestImports(unittest.TestCase):
+    def test_lazy(self):
+        out = subprocess.check_output([sys.executable, '-c',
+                                       'import sys, scscp; print("\\n".join(sys.modules))'])
+        loaded = set(out.decode().split())
+        self.assertIn('scscp.cli', loaded)
+        self.assertEqual([m for m in HEAVY if m in loaded], [])
@@ -0,0 +1,111 @@
+import unittest
+import socket
+from threading import Thread
+
+from openmath import openmath as om, encoder
+
+from scscp import scscp, binary
+from scscp.client import SCSCPClient
+from scscp.server import SCSCPServer
+from scscp.lazy import LazyProcedureMessage
+
+plus = om.OMSymbol('plus', 'arith1')
+MESSAGES = [
+    scscp.SCSCPProcedureMessage.call(om.OMApplication(plus, [om.OMInteger(1), om.OMInteger(2**100)]),
+                                     id='a<b', max_memory=10, runtime=1000),
+    scscp.SCSCPProcedureMessage.call(om.OMApplication(plus, [om.OMReference('#x')], id='x'), id='2'),
+    scscp.SCSCPProcedureMessage.completed('3', om.OMString('<\x1b>'), runtime=5),
+    scscp.SCSCPProcedureMessage.terminated('4', 'system_specific', 'Oops'),
+    scscp.SCSCPProcedureMessage.call(scscp.get_allowed_heads(), id='5'),
+]
+CODECS = [('xml', encoder.encode_bytes), ('binary', binary.encode_bytes)]
+
+class TestLazy(unittest.TestCase):
+    def test_roundtrip(self):
+        for msg in MESSAGES:
+            for name, encode in CODECS:
+                if name == 'xml' and msg.id == '3':
+                    continue
+                lazy = LazyProcedureMessage.from_bytes(encode(msg.om()), name)
+                self.assertIsNotNone(lazy.payload, msg)
+                self.assertFalse(lazy.decoded)
+                self.assertEqual((lazy.type, lazy.id, lazy.params), (msg.type, msg.id, msg.params))
+                if msg.type == 'procedure_call':
+                    self.assertEqual(lazy.head, msg.data.elem)
+                    self.assertFalse(lazy.decoded)
+                self.assertEqual(lazy.data, msg.data)
+                self.assertEqual(lazy, msg)
+
+    def test_encode(self):
+        for msg in MESSAGES[:2]:
+            for name, encode in CODECS:
+                raw = encode(msg.om())
+                lazy = LazyProcedureMessage.from_bytes(raw, name)
+                self.assertIs(lazy.encode(name), raw)
+                new = scscp.SCSCPProcedureMessage(msg.type, msg.data, 'new<id>', msg.params)
+                self.assertEqual(lazy.encode(name, 'new<id>'), encode(new.om()))
+                self.assertFalse(lazy.decoded)
+                for other, encode_other in CODECS:
+                    self.assertEqual(lazy.encode(other, 'new<id>'), encode_other(new.om()))
+
+    def test_option(self):
+        lazy = LazyProcedureMessage.from_bytes(encoder.encode_bytes(MESSAGES[0].om()))
+        self.assertEqual(lazy.option('runtime'), om.OMInteger(1000))
+        self.assertIsNone(lazy.option('min_memory'))
+
+    def test_set_data(self):
+        lazy = LazyProcedureMessage.from_bytes(binary.encode_bytes(MESSAGES[0].om()), 'binary')
+        lazy.data = om.OMApplication(om.OMSymbol('times', 'arith1'), [])
+        self.assertEqual(lazy.head, om.OMSymbol('times', 'arith1'))
+        self.assertEqual(lazy.om(), scscp.SCSCPProcedureMessage(
+            lazy.type, lazy.data, lazy.id, lazy.params).om())
+
+    def test_fallback(self):
+        msg = b'''<?xml version="1.0"?>
+<OMOBJ xmlns="http://www.openmath.org/OpenMath" version="2.0">
+  <OMATTR id="attr">
+    <OMATP>
+      <OMS cd="scscp1" name="call_id"/> <OMSTR>x</OMSTR>
+    </OMATP>
+    <OMA>
+      <OMS cd="scscp1" name="procedure_call"/>
+      <OMA><OMS cd="arith1" name="plus"/><OMI>1</OMI></OMA>
+    </OMA>
+  </OMATTR>
+</OMOBJ>'''
+        lazy = LazyProcedureMessage.from_bytes(msg)
+        self.assertTrue(lazy.decoded)
+        self.assertEqual((lazy.type, lazy.id, lazy.head), ('procedure_call', 'x', plus))
+
+    def test_whitespace(self):
+        msg = encoder.encode_bytes(MESSAGES[0].om()).replace(b'><', b'>\n <')
+        lazy = LazyProcedureMessage.from_bytes(msg)
+        self.assertFalse(lazy.decoded)
+        self.assertEqual(lazy.head, plus)
+        self.assertEqual(lazy, MESSAGES[0])
+
+    def test_no_id(self):
+        obj = om.OMObject(om.OMAttribution(
+            om.OMAttributionPairs([(om.OMSymbol('option_runtime', 'scscp1'), om.OMInteger(1))]),
+            om.OMApplication(om.OMSymbol('procedure_call', 'scscp1'), [om.OMInteger(1)])))
+        for name, encode in CODECS:
+            with self.assertRaises(scscp.SCSCPProtocolError):
+                LazyProcedureMessage.from_bytes(encode(obj), name)
+
+class TestLazyWait(unittest.TestCase):
+    def test_wait(self):
+        a, b = socket.socketpair()
+        client = SCSCPClient(a)
+        server = SCSCPServer(b, name=b'Test', version=b'none')
+        t = Thread(target=server.accept)
+        t.start()
+        client.connect()
+        t.join()
+        client.send(MESSAGES[0].om())
+        call = server.wait(lazy=True)
+        self.assertEqual(call.head, plus)
+        self.assertEqual(call.id, MESSAGES[0].id)
+        server.respond(scscp.SCSCPProcedureMessage.completed(call.id, om.OMInteger(3)))
+        self.assertEqual(client.wait(lazy=True).data, om.OMInteger(3))
+        client.quit()
+        b.close()
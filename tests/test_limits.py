@@ -0,0 +1,104 @@
+import unittest
+import time
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.cli import SCSCPCLI
+from scscp.worker import IsolatedProcessExecutor, LimitExceeded
+from scscp.socketserver import procedure
+from examples.demo_server import Server, DemoServerRequestHandler
+
+def spin(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    return 'done'
+
+def allocate(size):
+    return len(b'x' * size)
+
+class LimitedRequestHandler(DemoServerRequestHandler):
+    @procedure('test', convert=True)
+    def spin(self, seconds):
+        return spin(seconds)
+
+    @procedure('test', convert=True)
+    def allocate(self, size):
+        return allocate(size)
+
+def _call(name, arg):
+    return om.OMApplication(om.OMSymbol(name, 'test'), [arg])
+
+def _infos(resp):
+    return dict((k.name, v.integer) for k, v in resp.params)
+
+class TestExecutorLimits(unittest.TestCase):
+    def setUp(self):
+        self.executor = IsolatedProcessExecutor(2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_usage(self):
+        fut = self.executor.submit_limited(spin, (0.1,), runtime=5000, max_memory=1 << 28)
+        self.assertEqual(fut.result(), 'done')
+        self.assertGreaterEqual(fut.usage['runtime'], 100)
+        self.assertGreater(fut.usage['memory'], 0)
+
+    def test_runtime(self):
+        start = time.time()
+        fut = self.executor.submit_limited(spin, (60,), runtime=300)
+        with self.assertRaises(LimitExceeded) as cm:
+            fut.result(10)
+        self.assertEqual(cm.exception.kind, 'runtime')
+        self.assertLess(time.time() - start, 10)
+
+    def test_memory(self):
+        fut = self.executor.submit_limited(allocate, (1 << 30,), max_memory=1 << 26)
+        with self.assertRaises(LimitExceeded) as cm:
+            fut.result(10)
+        self.assertEqual(cm.exception.kind, 'memory')
+        fut = self.executor.submit_limited(allocate, (1 << 20,), max_memory=1 << 26)
+        self.assertEqual(fut.result(10), 1 << 20)
+
+class TestServerLimits(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0)
+        self.server.RequestHandlerClass = LimitedRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+        self.client = SCSCPCLI('localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        self.client.quit()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def _call_wait(self, data, **opts):
+        self.client.call(data, **opts)
+        return self.client.wait()
+
+    def test_infos(self):
+        resp = self._call_wait(_call('spin', om.OMFloat(0.1)))
+        self.assertEqual(resp.type, 'procedure_completed')
+        self.assertGreaterEqual(_infos(resp)['info_runtime'], 100)
+        # no process is started for calls without limits
+        self.assertIsNone(self.server._isolated_workers)
+        resp = self._call_wait(_call('spin', om.OMFloat(0.1)), runtime=5000)
+        self.assertEqual(resp.type, 'procedure_completed')
+        self.assertEqual(set(_infos(resp)), {'info_runtime', 'info_memory'})
+        self.assertEqual(self.server.isolated_workers._context.get_start_method(), 'forkserver')
+
+    def test_runtime(self):
+        resp = self._call_wait(_call('spin', om.OMFloat(60)), runtime=300)
+        self.assertEqual(resp.type, 'procedure_terminated')
+        self.assertEqual(resp.data.name, om.OMSymbol('error_runtime', 'scscp1'))
+
+    def test_memory(self):
+        resp = self._call_wait(_call('allocate', om.OMInteger(1 << 30)), max_memory=1 << 26)
+        self.assertEqual(resp.type, 'procedure_terminated')
+        self.assertEqual(resp.data.name, om.OMSymbol('error_memory', 'scscp1'))
+        self.assertEqual(self.client.heads.test.allocate([1000]), 1000)
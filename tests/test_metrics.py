@@ -0,0 +1,89 @@
+import socket
+import unittest
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.cli import SCSCPCLI
+from scscp.client import SCSCPClient
+from scscp.server import SCSCPServer
+from scscp.metrics import Metrics, Histogram
+from examples.demo_server import Server
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        hist = Histogram((0.1, 1.0, float('inf')))
+        for v in (0.05, 0.1, 0.5, 2):
+            hist.observe(v)
+        self.assertEqual(list(hist.cumulative()), [(0.1, 2), (1.0, 3), (float('inf'), 4)])
+        self.assertEqual(hist.count, 4)
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.record_call('arith1', 'plus', 0.002)
+        metrics.record_call('arith1', 'plus', 0.2, error=True)
+        metrics.record_codec('encode', 'xml', 0.001, 100)
+        text = metrics.prometheus()
+        self.assertIn('scscp_calls_total{cd="arith1",head="plus"} 2', text)
+        self.assertIn('scscp_call_errors_total{cd="arith1",head="plus"} 1', text)
+        self.assertIn('scscp_call_duration_seconds_bucket{cd="arith1",head="plus",le="+Inf"} 2', text)
+        self.assertIn('scscp_call_duration_seconds_count{cd="arith1",head="plus"} 2', text)
+        self.assertIn('scscp_codec_bytes_total{encoding="xml",operation="encode"} 100', text)
+        self.assertIn('# TYPE scscp_call_duration_seconds histogram', text)
+
+class TestPeerMetrics(unittest.TestCase):
+    def test_peers(self):
+        a, b = socket.socketpair()
+        client = SCSCPClient(a)
+        server = SCSCPServer(b, name=b'Test', version=b'none')
+        client.metrics = Metrics()
+        t = Thread(target=server.accept)
+        t.start()
+        client.connect()
+        t.join()
+        for streaming in (True, False):
+            client.streaming = streaming
+            t = Thread(target=lambda: server.respond(server.wait()))
+            t.start()
+            call = client.call(om.OMString('x' * 1000))
+            self.assertEqual(client.wait().data, call.data)
+            t.join()
+        snap = client.metrics.snapshot()
+        self.assertEqual(snap['messages_sent'], 2)
+        self.assertEqual(snap['messages_received'], 2)
+        self.assertGreater(snap['bytes_received'], 2000)
+        self.assertEqual(dict(((c['operation'], c['encoding']), c['count'])
+                              for c in snap['codec']),
+                         {('encode', 'xml'): 2, ('decode', 'xml'): 2})
+        client.quit()
+        b.close()
+
+class TestServerMetrics(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0, metrics=True)
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = SCSCPCLI('localhost', port=self.server.server_address[1])
+
+    def tearDown(self):
+        self.client.quit()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_calls(self):
+        plus = self.client.heads.arith1.plus
+        self.assertEqual(plus([1, 2]), 3)
+        self.assertEqual(plus([3, 4]), 7)
+        with self.assertRaises(Exception):
+            self.client.heads.arith1.divide([1])
+        # calls are recorded after their response is sent, but before
+        # the next call of the connection is read
+        self.client.heads.arith1.times([2, 3])
+        calls = dict(((c['cd'], c['head']), c) for c in self.server.metrics.snapshot()['calls'])
+        self.assertEqual(calls['arith1', 'plus']['count'], 2)
+        self.assertEqual(calls['arith1', 'plus']['errors'], 0)
+        self.assertEqual(calls['arith1', 'plus']['latency']['count'], 2)
+        self.assertEqual(calls['arith1', 'divide']['errors'], 1)
+        self.assertIn('scscp_calls_total{cd="arith1",head="plus"} 2',
+                      self.server.metrics.prometheus())
@@ -0,0 +1,141 @@
+import unittest
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from scscp.client import TimeoutError
+from scscp.pool import SCSCPPool
+from examples.demo_server import Server
+
+def _free_port():
+    s = socket.socket()
+    s.bind(('localhost', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def _wait(condition, timeout=10):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("Timed out.")
+        time.sleep(0.05)
+
+class TestPool(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        for i in range(2):
+            server = Server(port=0)
+            thread = Thread(target=server.serve_forever)
+            thread.start()
+            self.servers.append((server, thread))
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+        for server, thread in self.servers:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def pool(self, n=1, **kwds):
+        pool = SCSCPPool([('localhost', s.server_address[1]) for s, t in self.servers[:n]], **kwds)
+        self.pools.append(pool)
+        return pool
+
+    def test_warm(self):
+        pool = self.pool(min_idle=2)
+        stats = pool.stats()
+        self.assertEqual((stats['open'], stats['idle'], stats['created']), (2, 2, 2))
+        for i in range(5):
+            with pool.session() as client:
+                self.assertEqual(client.heads.arith1.plus([i, 1]), i + 1)
+        stats = pool.stats()
+        self.assertEqual((stats['open'], stats['idle'], stats['created'], stats['checkouts']),
+                         (2, 2, 2, 5))
+
+    def test_servers(self):
+        pool = self.pool(2, min_idle=2)
+        self.assertEqual([s['open'] for s in pool.stats()['servers']], [1, 1])
+
+    def test_server_down(self):
+        pool = SCSCPPool([('localhost', _free_port()), ('localhost', self.servers[0][0].server_address[1])],
+                         min_idle=1, retry_interval=60)
+        self.pools.append(pool)
+        down, up = pool.stats()['servers']
+        self.assertEqual((down['healthy'], down['errors'], down['open']), (False, 1, 0))
+        self.assertEqual((up['healthy'], up['open']), (True, 1))
+        with pool.session() as client:
+            self.assertEqual(client.heads.arith1.plus([1, 2]), 3)
+
+    def test_max_size(self):
+        pool = self.pool(min_idle=1, max_size=1)
+        client = pool.checkout()
+        with self.assertRaises(TimeoutError):
+            pool.checkout(timeout=0.1)
+        with ThreadPoolExecutor(1) as executor:
+            fut = executor.submit(pool.checkout)
+            _wait(lambda: pool.stats()['waiting'] == 1)
+            pool.checkin(client)
+            self.assertIs(fut.result(5), client)
+        pool.checkin(client)
+        self.assertEqual(pool.stats()['waits'], 2)
+
+    def test_concurrent(self):
+        pool = self.pool(2, min_idle=1, max_size=3)
+        def plus(i):
+            with pool.session() as client:
+                return client.heads.arith1.plus([i, 1])
+        with ThreadPoolExecutor(8) as executor:
+            self.assertEqual(list(executor.map(plus, range(50))), list(range(1, 51)))
+        stats = pool.stats()
+        self.assertLessEqual(stats['created'], 3)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_broken(self):
+        pool = self.pool(min_idle=1)
+        with self.assertRaises(ConnectionError):
+            with pool.session() as client:
+                client.socket.close()
+                raise ConnectionResetError
+        self.assertEqual(pool.stats()['closed'], 1)
+        # the server closes the idle sessions
+        pool.fill()
+        self.servers[0][0].drain(1)
+        with pool.session() as other:
+            self.assertIsNot(other, client)
+            self.assertEqual(other.heads.arith1.plus([1, 2]), 3)
+        self.assertEqual(pool.stats()['closed'], 2)
+
+    def test_health_check(self):
+        healthy = [True]
+        pool = self.pool(min_idle=1, check_interval=0.1, health_check=lambda c: healthy[0])
+        client = pool.checkout()
+        pool.checkin(client)
+        time.sleep(0.2)
+        self.assertIs(pool.checkout(), client)
+        pool.checkin(client)
+        healthy[0] = False
+        # checked by the maintenance thread
+        _wait(lambda: pool.stats()['failed_checks'] > 0)
+        healthy[0] = True
+        _wait(lambda: pool.stats()['idle'] == 1)
+        with pool.session() as other:
+            self.assertIsNot(other, client)
+
+    def test_eviction(self):
+        pool = self.pool(min_idle=1, max_idle=0.1, max_lifetime=0.5, check_interval=None)
+        clients = [pool.checkout() for i in range(3)]
+        for client in clients:
+            pool.checkin(client)
+        self.assertEqual(pool.stats()['idle'], 3)
+        time.sleep(0.2)
+        pool.maintain()
+        self.assertEqual(pool.stats()['idle'], 1)
+        client = pool.checkout()
+        pool.checkin(client)
+        time.sleep(0.5)
+        with pool.session() as other:
+            self.assertIsNot(other, client)
@@ -0,0 +1,80 @@
+import unittest
+import os
+import signal
+import socket
+import time
+from threading import Thread
+
+from scscp.cli import SCSCPCLI
+from scscp.prefork import PreforkServer
+from scscp.socketserver import procedure
+from examples.demo_server import Server, DemoServerRequestHandler
+
+class PidRequestHandler(DemoServerRequestHandler):
+    @procedure('test', convert=True)
+    def pid(self):
+        return os.getpid()
+
+class PidServer(Server):
+    def __init__(self, **kwds):
+        super(PidServer, self).__init__(**kwds)
+        self.RequestHandlerClass = PidRequestHandler
+
+def _wait(condition, timeout=10):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("Timed out.")
+        time.sleep(0.05)
+
+class TestPrefork(unittest.TestCase):
+    reuse_port = False
+
+    def setUp(self):
+        self.server = PreforkServer(PidServer, processes=2, max_calls_per_process=3,
+                                    reuse_port=self.reuse_port, grace=5, port=0)
+        self.server_t = Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.1})
+        self.server_t.start()
+        _wait(lambda: len(self.server.pids()) == 2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server_t.join()
+        self.server.server_close()
+        self.assertEqual(self.server.pids(), [])
+
+    def _client(self):
+        return SCSCPCLI('localhost', self.server.server_address[1])
+
+    def test_calls(self):
+        client = self._client()
+        pid = client.heads.test.pid([])
+        self.assertIn(pid, self.server.pids())
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(client.heads.arith1.plus([1, 2]), 3)
+        client.quit()
+
+    def test_restart(self):
+        pids = self.server.pids()
+        os.kill(pids[0], signal.SIGKILL)
+        _wait(lambda: self.server.restarts == 1 and len(self.server.pids()) == 2)
+        self.assertNotIn(pids[0], self.server.pids())
+        client = self._client()
+        self.assertEqual(client.heads.arith1.plus([1, 2]), 3)
+        client.quit()
+
+    def test_recycle(self):
+        # with the discovery of the heads, 3 calls
+        client = self._client()
+        pid = client.heads.test.pid([])
+        self.assertEqual(client.heads.test.pid([]), pid)
+        # the idle connection is closed by the recycled worker
+        _wait(lambda: pid not in self.server.pids() and len(self.server.pids()) == 2)
+        self.assertEqual(self.server.restarts, 1)
+        client = self._client()
+        self.assertNotEqual(client.heads.test.pid([]), pid)
+        client.quit()
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), "No SO_REUSEPORT.")
+class TestPreforkReusePort(TestPrefork):
+    reuse_port = True
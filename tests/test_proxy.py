@@ -0,0 +1,183 @@
+import unittest
+import asyncio
+import socket
+import time
+from threading import Thread
+
+from openmath import openmath as om, convert
+
+from scscp.aio import AsyncSCSCPClient
+from scscp.proxy import SCSCPProxy, Backend
+from scscp import scscp
+from scscp.socketserver import procedure
+from examples.demo_server import Server, DemoServerRequestHandler
+
+def plus(a, b):
+    return om.OMApplication(om.OMSymbol('plus', 'arith1'), [om.OMInteger(a), om.OMInteger(b)])
+
+class SlowRequestHandler(DemoServerRequestHandler):
+    @procedure('test', convert=True)
+    def spin(self, seconds):
+        end = time.time() + seconds
+        while time.time() < end:
+            pass
+        return 'done'
+
+def spin(seconds):
+    return om.OMApplication(om.OMSymbol('spin', 'test'), [om.OMFloat(seconds)])
+
+class TestProxy(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        for name, encoding in ((b'A', 'binary'), (b'B', 'xml')):
+            server = Server(port=0, name=name)
+            t = Thread(target=server.serve_forever)
+            t.daemon = True
+            t.start()
+            self.servers.append((server, t))
+        self.loop = asyncio.new_event_loop()
+        self.proxy = SCSCPProxy([Backend('localhost', s.server_address[1], encoding)
+                                 for (s, _), encoding in zip(self.servers, ('binary', 'xml'))],
+                                port=0, health_interval=0.1)
+        self.loop.run_until_complete(self.proxy.start())
+        self.port = self.proxy.server_address[1]
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.proxy.close())
+        self.loop.close()
+        for server, t in self.servers:
+            server.shutdown()
+            server.server_close()
+            t.join()
+
+    def test_forward(self):
+        async def session(encoding):
+            c = await AsyncSCSCPClient.open('localhost', self.port, encoding=encoding)
+            # all clients use the same call ids
+            futs = [c.submit(plus(i, 1), id=str(i)) for i in range(50)]
+            await c.drain()
+            resps = await asyncio.gather(*futs)
+            await c.close()
+            return resps
+        async def go():
+            return await asyncio.gather(session('xml'), session('binary'), session('xml'))
+        for resps in self.loop.run_until_complete(go()):
+            self.assertEqual([r.id for r in resps], [str(i) for i in range(50)])
+            self.assertEqual([convert.to_python(r.data) for r in resps], [i + 1 for i in range(50)])
+        stats = self.proxy.stats()
+        self.assertEqual(sum(s['calls'] for s in stats), 150)
+        self.assertTrue(all(s['calls'] > 0 and s['errors'] == 0 for s in stats))
+        self.assertTrue(all(s['outstanding'] == 0 for s in stats))
+
+    def test_stored_objects(self):
+        async def go():
+            c = await AsyncSCSCPClient.open('localhost', self.port)
+            resps = [await c.call(plus(1, 2), cookie=True),
+                     await c.call(scscp.store(om.OMInteger(3))),
+                     await c.call(scscp.retrieve('scscp://localhost:1/session/' + '0' * 32)),
+                     await c.call(plus(1, 2))]
+            await c.close()
+            return resps
+        resps = self.loop.run_until_complete(go())
+        for resp in resps[:3]:
+            self.assertEqual(resp.type, 'procedure_terminated')
+            self.assertEqual(resp.data.name, om.OMSymbol('error_system_specific', 'scscp1'))
+        self.assertEqual(resps[3].data, om.OMInteger(3))
+        self.assertEqual(sum(s['calls'] for s in self.proxy.stats()), 1)
+
+    def test_reconnect(self):
+        async def go():
+            # lose the connection to the first backend
+            self.proxy.backends[0].client.writer.close()
+            await asyncio.sleep(0.05)
+            self.assertFalse(self.proxy.backends[0].healthy)
+            c = await AsyncSCSCPClient.open('localhost', self.port)
+            resps = [await c.call(plus(i, 1)) for i in range(10)]
+            await asyncio.sleep(0.5)
+            self.assertTrue(self.proxy.backends[0].healthy)
+            resps += [await c.call(plus(i, 1)) for i in range(10)]
+            await c.close()
+            return resps
+        resps = self.loop.run_until_complete(go())
+        self.assertEqual([convert.to_python(r.data) for r in resps], [i + 1 for i in range(10)] * 2)
+        self.assertGreater(self.proxy.backends[0].calls, 0)
+
+def unused_port():
+    s = socket.socket()
+    s.bind(('localhost', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+class TestNoBackend(unittest.TestCase):
+    def test_no_backend(self):
+        proxy = SCSCPProxy([('localhost', unused_port())], port=0)
+        async def go():
+            await proxy.start()
+            c = await AsyncSCSCPClient.open('localhost', proxy.server_address[1])
+            resp = await c.call(plus(1, 1))
+            await c.close()
+            await proxy.close()
+            return resp
+        loop = asyncio.new_event_loop()
+        try:
+            resp = loop.run_until_complete(go())
+        finally:
+            loop.close()
+        self.assertEqual(resp.type, 'procedure_terminated')
+        self.assertEqual(proxy.stats()[0]['healthy'], False)
+
+class TestProxyTerminate(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0, max_calls=4)
+        self.server.RequestHandlerClass = SlowRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def test_terminate(self):
+        async def go():
+            proxy = SCSCPProxy([('localhost', self.server.server_address[1])], port=0)
+            await proxy.start()
+            c = await AsyncSCSCPClient.open('localhost', proxy.server_address[1])
+            slow = c.submit(spin(60), id='slow')
+            fast = c.submit(spin(0.1), id='fast')
+            await c.drain()
+            await asyncio.sleep(0.5)
+            c.terminate('slow')
+            # unknown calls are ignored
+            c.terminate('unknown')
+            resps = await asyncio.wait_for(asyncio.gather(slow, fast), 10)
+            # the session goes on
+            resps.append(await c.call(plus(1, 2)))
+            await c.close()
+            await proxy.close()
+            return resps
+        slow, fast, other = asyncio.run(go())
+        self.assertEqual((slow.id, slow.type), ('slow', 'procedure_terminated'))
+        self.assertEqual((fast.id, fast.type), ('fast', 'procedure_completed'))
+        self.assertEqual(other.data, om.OMInteger(3))
+
+    def test_disconnect(self):
+        async def go():
+            proxy = SCSCPProxy([('localhost', self.server.server_address[1])], port=0)
+            await proxy.start()
+            c = await AsyncSCSCPClient.open('localhost', proxy.server_address[1])
+            c.submit(spin(60))
+            await c.drain()
+            await asyncio.sleep(0.5)
+            running = self.server.admission.stats()['running']
+            await c.close()
+            # the backend stops computing the calls of the client
+            for _ in range(50):
+                if self.server.admission.stats()['running'] == 0:
+                    break
+                await asyncio.sleep(0.1)
+            await proxy.close()
+            return running, self.server.admission.stats()['running']
+        self.assertEqual(asyncio.run(go()), (1, 0))
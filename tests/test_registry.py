@@ -0,0 +1,95 @@
+import unittest
+from threading import Thread
+
+from openmath import openmath as om, encoder
+
+from scscp.cli import SCSCPCLI
+from scscp import scscp, binary
+from scscp.server import PreparedResponse
+from scscp.socketserver import procedure
+from examples.demo_server import Server, DemoServerRequestHandler
+
+class RegistryRequestHandler(DemoServerRequestHandler):
+    discovery_calls = 0
+
+    @procedure('test')
+    def concat(self, *strings):
+        return om.OMString(''.join(s.string for s in strings))
+
+    @procedure('test', 'len', convert=True)
+    def length(self, s, sep=None):
+        return len(s.split(sep))
+
+    def get_allowed_heads(self, data):
+        RegistryRequestHandler.discovery_calls += 1
+        return super(RegistryRequestHandler, self).get_allowed_heads(data)
+
+class PreparedRequestHandler(RegistryRequestHandler):
+    # back to the built-in discovery
+    get_allowed_heads = DemoServerRequestHandler.get_allowed_heads
+
+class TestPreparedResponse(unittest.TestCase):
+    def test_encode(self):
+        msg = scscp.SCSCPProcedureMessage.completed('x', scscp.symbol_set([om.OMSymbol('a', 'b')]))
+        prepared = PreparedResponse(msg)
+        for id in ('myid', 'a<&>"b', '\xe9' * 300):
+            expected = prepared.message(id).om()
+            self.assertEqual(prepared.encode('xml', id), encoder.encode_bytes(expected))
+            self.assertEqual(prepared.encode('binary', id), binary.encode_bytes(expected))
+        id = '\x1b<'
+        self.assertEqual(prepared.encode('binary', id), binary.encode_bytes(prepared.message(id).om()))
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0)
+        self.server.RequestHandlerClass = RegistryRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+        self.client = SCSCPCLI('localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        self.client.quit()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def test_registry(self):
+        self.assertEqual(self.client.heads.test.concat(['a', 'b', 'c']), 'abc')
+        self.assertEqual(self.client.heads.test.len(['a b c']), 3)
+        self.assertEqual(self.client.heads.test.len(['a,b', ',']), 2)
+        self.assertEqual(self.client.heads.arith1.plus([1, 2]), 3)
+        with self.assertRaises(scscp.SCSCPProtocolError):
+            self.client.heads.test.len([])
+        with self.assertRaises(scscp.SCSCPProtocolError):
+            self.client.heads.arith1.plus([1, 2, 3])
+
+    def test_discovery(self):
+        self.assertTrue('concat' in self.client.heads.test)
+        self.assertTrue(self.client.is_allowed_head('len', 'test'))
+        self.assertFalse(self.client.is_allowed_head('nope', 'test'))
+        self.assertEqual(self.client.get_signature('len', 'test'),
+                         scscp.signature('len', 'test', None, 1, 2))
+        self.assertEqual(self.client.get_signature('concat', 'test'),
+                         scscp.signature('concat', 'test'))
+
+    def test_prepared(self):
+        # overridden discovery methods are called every time
+        RegistryRequestHandler.discovery_calls = 0
+        self.client.populate_heads()
+        self.client.populate_heads()
+        self.assertEqual(RegistryRequestHandler.discovery_calls, 2)
+        self.assertNotIn((RegistryRequestHandler, 'get_allowed_heads'),
+                         self.server.prepared_responses)
+        # built-in ones are prepared once per handler class
+        self.server.RequestHandlerClass = PreparedRequestHandler
+        client = SCSCPCLI('localhost', self.server.server_address[1])
+        client.populate_heads()
+        self.assertIn((PreparedRequestHandler, 'get_allowed_heads'),
+                      self.server.prepared_responses)
+        self.assertTrue('concat' in client.heads.test)
+        self.assertEqual(client.get_signature('len', 'test'),
+                         scscp.signature('len', 'test', None, 1, 2))
+        self.assertEqual(client.get_description(), ["DemoServer", "none", "Demo SCSCP server"])
+        self.assertEqual(client.get_description(), ["DemoServer", "none", "Demo SCSCP server"])
+        client.quit()
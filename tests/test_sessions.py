@@ -0,0 +1,97 @@
+import unittest
+import asyncio
+import socket
+import time
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.aio import AsyncSCSCPClient, AsyncSCSCPSocketServer
+from scscp.cli import SCSCPCLI
+from scscp.scscp import SCSCPQuit
+from scscp.framing import set_keepalive
+from scscp.socketserver import procedure
+from examples.demo_server import Server, DemoServerRequestHandler
+
+class SleepRequestHandler(DemoServerRequestHandler):
+    @procedure('test', convert=True)
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        return True
+
+class TestSessions(unittest.TestCase):
+    def start(self, **kwds):
+        self.server = Server(port=0, **kwds)
+        self.server.RequestHandlerClass = SleepRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+        return SCSCPCLI('localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def test_idle(self):
+        client = self.start(idle_timeout=0.5)
+        # a call in flight does not make the session idle
+        self.assertEqual(client.heads.test.sleep([1]), True)
+        self.assertEqual(client.heads.arith1.plus([1, 2]), 3)
+        with self.assertRaises(SCSCPQuit) as cm:
+            client.wait(timeout=5)
+        self.assertEqual(cm.exception.reason, b'Session idle for too long.')
+        end = time.time() + 5
+        while self.server._handlers and time.time() < end:
+            time.sleep(0.05)
+        self.assertEqual(len(self.server._handlers), 0)
+
+    def test_lifetime(self):
+        client = self.start(session_lifetime=1)
+        start = time.time()
+        while time.time() - start < 0.5:
+            self.assertEqual(client.heads.arith1.plus([1, 2]), 3)
+        with self.assertRaises(SCSCPQuit) as cm:
+            client.wait(timeout=5)
+        self.assertEqual(cm.exception.reason, b'Session lifetime exceeded.')
+
+    def test_partial_message(self):
+        self.start(idle_timeout=10).quit()
+        s = socket.create_connection(self.server.server_address)
+        s.recv(4096)
+        s.sendall(b'<?scscp version="1.3" ?>\n')
+        s.recv(4096)
+        handler, = [h for h in self.server._handlers if h.client_address == s.getsockname()]
+        handler.scscp.stream.timeout = 0.5
+        s.sendall(b'<?scscp start ?>\n<OMOBJ>')
+        s.settimeout(5)
+        self.assertIn(b'Message took too long', s.recv(4096))
+        s.close()
+
+class TestKeepalive(unittest.TestCase):
+    def test_keepalive(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        set_keepalive(s, (60, 10, 3))
+        self.assertEqual(s.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE), 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.assertEqual(s.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE), 60)
+        s.close()
+
+class TestAsyncSessions(unittest.TestCase):
+    def test_idle(self):
+        async def go():
+            server = AsyncSCSCPSocketServer(port=0, RequestHandlerClass=DemoServerRequestHandler,
+                                            idle_timeout=0.5)
+            await server.start()
+            client = await AsyncSCSCPClient.open('localhost', server.server_address[1])
+            resp = await client.call(om.OMApplication(om.OMSymbol('plus', 'arith1'),
+                                                      [om.OMInteger(1), om.OMInteger(2)]))
+            await asyncio.sleep(1.5)
+            status = client.status
+            await client.close()
+            await server.close()
+            return resp, status
+
+        resp, status = asyncio.run(go())
+        self.assertEqual(resp.data, om.OMInteger(3))
+        self.assertNotEqual(status, 1)
@@ -0,0 +1,101 @@
+import unittest
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.cli import SharedSCSCPCLI
+from scscp.client import SharedSCSCPClient, TimeoutError, open_socket
+from scscp.scscp import SCSCPQuit
+from scscp.socketserver import procedure
+from examples.demo_server import Server, DemoServerRequestHandler
+
+class SleepRequestHandler(DemoServerRequestHandler):
+    @procedure('test', convert=True)
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        return seconds
+
+class SleepServer(Server):
+    def __init__(self, **kwds):
+        super(SleepServer, self).__init__(**kwds)
+        self.RequestHandlerClass = SleepRequestHandler
+
+class TestShared(unittest.TestCase):
+    def setUp(self):
+        self.server = SleepServer(port=0)
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.start()
+        self.client = SharedSCSCPCLI('localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        if self.client.status == 1:
+            self.client.quit()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def test_threads(self):
+        def plus(i):
+            return [self.client.heads.arith1.plus([i, j]) for j in range(20)]
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(plus, range(16)))
+        self.assertEqual(results, [[i + j for j in range(20)] for i in range(16)])
+
+    def test_pipelined(self):
+        sleep = om.OMSymbol('sleep', 'test')
+        with ThreadPoolExecutor(5) as pool:
+            futs = list(pool.map(lambda i: self.client.submit(om.OMApplication(sleep, [om.OMFloat(0.1)])),
+                                 range(5)))
+            # all sent before the first response
+            self.assertEqual(len(self.client._pending), 5)
+        self.assertEqual([f.result(5).data for f in futs], [om.OMFloat(0.1)] * 5)
+
+    def test_submit(self):
+        plus = om.OMSymbol('plus', 'arith1')
+        futs = [self.client.submit(om.OMApplication(plus, [om.OMInteger(i), om.OMInteger(1)]))
+                for i in range(10)]
+        self.assertEqual([f.result(5).data for f in futs], [om.OMInteger(i + 1) for i in range(10)])
+        with self.assertRaises(RuntimeError):
+            self.client.wait()
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            self.client.heads.test.sleep([0.5], timeout=0.1)
+        # the late response is discarded
+        self.assertEqual(self.client.heads.arith1.plus([1, 2]), 3)
+
+    def test_quit(self):
+        fut = self.client.submit(om.OMApplication(om.OMSymbol('sleep', 'test'), [om.OMFloat(1.0)]))
+        self.client.quit()
+        with self.assertRaises(SCSCPQuit):
+            fut.result(5)
+        self.assertFalse(self.client._reader.is_alive())
+        with self.assertRaises(RuntimeError):
+            self.client.heads.arith1.plus([1, 2])
+
+    def test_server_quit(self):
+        fut = self.client.submit(om.OMApplication(om.OMSymbol('sleep', 'test'), [om.OMFloat(1.0)]))
+        self.server.drain(0.1)
+        with self.assertRaises(SCSCPQuit):
+            fut.result(5)
+        self.client._reader.join(5)
+        self.assertFalse(self.client._reader.is_alive())
+
+class TestSharedClient(unittest.TestCase):
+    def test_client(self):
+        server = Server(port=0)
+        server_t = Thread(target=server.serve_forever)
+        server_t.start()
+        try:
+            client = SharedSCSCPClient(open_socket('localhost', server.server_address[1]))
+            client.connect()
+            resp = client.call(om.OMApplication(om.OMSymbol('plus', 'arith1'),
+                                                [om.OMInteger(1), om.OMInteger(2)]))
+            self.assertEqual(resp.data, om.OMInteger(3))
+            client.quit()
+        finally:
+            server.shutdown()
+            server.server_close()
+            server_t.join()
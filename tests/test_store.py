@@ -0,0 +1,81 @@
+import unittest
+import gc
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.cli import SCSCPCLI
+from scscp import scscp, store
+from examples.demo_server import Server
+
+class TestSessionStore(unittest.TestCase):
+    def test_lru(self):
+        s = store.SessionStore(max_size=3 * store.sizeof(om.OMInteger(1)))
+        keys = [s.store(om.OMInteger(i)) for i in range(3)]
+        s.get(keys[0])
+        s.store(om.OMInteger(3))
+        self.assertEqual(len(s), 3)
+        self.assertEqual(s.get(keys[0]), om.OMInteger(0))
+        self.assertRaises(KeyError, s.get, keys[1])
+
+    def test_url(self):
+        url = store.make_url(('127.0.0.1', 26133), store.SESSION, 'a' * 32)
+        self.assertEqual(url, 'scscp://127.0.0.1:26133/session/' + 'a' * 32)
+        self.assertEqual(store.parse_url(url), (store.SESSION, 'a' * 32))
+        self.assertIsNone(store.parse_url('#foo'))
+        # Unix domain sockets
+        url = store.make_url('/tmp/scscp.sock', store.SESSION, 'a' * 32)
+        self.assertEqual(store.parse_url(url), (store.SESSION, 'a' * 32))
+
+class TestServerStore(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0)
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+        self.client = SCSCPCLI('localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        self.client.quit()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def test_cookie(self):
+        ref = self.client.heads.arith1.power([2, 100], cookie=True)
+        self.assertIsInstance(ref, SCSCPCLI.RemoteObject)
+        self.assertEqual(self.client.heads.arith1.plus([ref, 1]), 2**100 + 1)
+        self.assertEqual(ref.retrieve(), 2**100)
+        self.assertEqual(ref.unbind(), True)
+        with self.assertRaises(scscp.SCSCPProtocolError):
+            ref.retrieve()
+
+    def test_chain(self):
+        ref = self.client.heads.arith1.power([2, 10], cookie=True)
+        ref = self.client.heads.arith1.times([ref, ref], cookie=True)
+        self.assertEqual(self.client.heads.arith1.minus([ref, 1]), 2**20 - 1)
+
+    def test_gc_unbind(self):
+        ref = self.client.heads.arith1.power([2, 10], cookie=True)
+        raw = om.OMReference(ref.url)
+        self.assertEqual(self.client.heads.scscp2.retrieve([raw]), 2**10)
+        del ref
+        gc.collect()
+        with self.assertRaises(scscp.SCSCPProtocolError):
+            self.client.heads.scscp2.retrieve([raw])
+
+    def test_persistent(self):
+        ref = self.client.heads.scscp2.store_persistent([om.OMInteger(42)])
+        self.assertIn('/persistent/', ref.href)
+        other = SCSCPCLI('localhost', self.server.server_address[1])
+        self.assertEqual(other.heads.arith1.times([ref, 2]), 84)
+        other.quit()
+        self.assertEqual(self.client.heads.scscp2.unbind([ref]), True)
+
+    def test_session(self):
+        ref = self.client.heads.scscp2.store_session(['hello'])
+        other = SCSCPCLI('localhost', self.server.server_address[1])
+        with self.assertRaises(scscp.SCSCPProtocolError):
+            other.heads.scscp2.retrieve([ref])
+        other.quit()
+        self.assertEqual(self.client.heads.scscp2.retrieve([ref]), 'hello')
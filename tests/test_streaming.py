@@ -0,0 +1,83 @@
+import unittest
+import socket
+from threading import Thread
+
+from openmath import openmath as om, encoder, decoder
+
+from scscp import scscp
+from scscp.cli import SCSCPCLI
+from scscp.client import SCSCPClient
+from scscp.framing import START, CANCEL
+from scscp.server import SCSCPServer
+from scscp.streaming import StreamingDecoder
+from examples.demo_server import Server
+
+OBJECTS = [
+    om.OMObject(om.OMInteger(-2**100)),
+    om.OMObject(om.OMError(om.OMSymbol('unhandled_symbol', 'error'),
+                           [om.OMString('foo'), om.OMFloat(1.5), om.OMBytes(b'\x00\x01')])),
+    om.OMObject(om.OMBinding(om.OMSymbol('lambda', 'fns1'),
+                             om.OMBindVariables([om.OMVariable('x')]), om.OMVariable('x'))),
+    scscp.SCSCPProcedureMessage.call(om.OMApplication(om.OMSymbol('plus', 'arith1'),
+                                                      [om.OMInteger(i) for i in range(100)]),
+                                     id='myid').om(),
+]
+
+class TestStreamingDecoder(unittest.TestCase):
+    def test_chunks(self):
+        for obj in OBJECTS:
+            data = b'\n' + encoder.encode_bytes(obj) + b'\n'
+            for size in (1, 7, 100, len(data)):
+                dec = StreamingDecoder()
+                for i in range(0, len(data), size):
+                    dec.feed(data[i:i+size])
+                self.assertEqual(dec.close(), decoder.decode_bytes(data))
+
+    def test_error(self):
+        dec = StreamingDecoder()
+        dec.feed(b'<OMOBJ><OMI>1</OMS>')
+        dec.feed(b'</OMOBJ>')
+        self.assertRaises(Exception, dec.close)
+
+class TestStreamingReceive(unittest.TestCase):
+    def setUp(self):
+        a, b = socket.socketpair()
+        self.client = SCSCPClient(a)
+        self.server = SCSCPServer(b, name=b'Test', version=b'none')
+        t = Thread(target=self.server.accept)
+        t.start()
+        self.client.connect()
+        t.join()
+
+    def tearDown(self):
+        self.client.quit()
+
+    def test_cancel(self):
+        data = encoder.encode_bytes(OBJECTS[-1])
+        sock = self.server.socket
+        sock.sendall(b'<?scscp start ?>\n' + data[:len(data) // 2] + b'\n<?scscp cancel ?>\n')
+        self.server.send(OBJECTS[-1])
+        self.assertRaises(scscp.SCSCPCancel, self.client.receive)
+        self.assertEqual(self.client.wait().id, 'myid')
+
+    def test_large(self):
+        obj = om.OMObject(om.OMString('x' * 10**6))
+        t = Thread(target=self.server.send, args=(obj,))
+        t.start()
+        self.assertEqual(self.client.receive(), obj)
+        t.join()
+
+class TestServerCancel(unittest.TestCase):
+    def test_cancel(self):
+        server = Server(port=0)
+        server_t = Thread(target=server.serve_forever)
+        server_t.start()
+        try:
+            client = SCSCPCLI('localhost', server.server_address[1])
+            client.socket.sendall(START + b'<OMOBJ><OMATTR><OMATP>' + CANCEL)
+            self.assertEqual(client.heads.arith1.plus([1, 2]), 3)
+            client.quit()
+        finally:
+            server.shutdown()
+            server.server_close()
+            server_t.join()
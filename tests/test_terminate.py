@@ -0,0 +1,122 @@
+import unittest
+import asyncio
+import os
+import time
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.cli import SCSCPCLI
+from scscp.aio import AsyncSCSCPClient, AsyncSCSCPSocketServer
+from scscp.worker import IsolatedProcessExecutor, CallTerminated, WorkerDied
+from scscp.socketserver import procedure
+from examples.demo_server import Server, DemoServerRequestHandler
+
+def spin(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    return 'done'
+
+class SlowRequestHandler(DemoServerRequestHandler):
+    @procedure('test', convert=True)
+    def spin(self, seconds):
+        return spin(seconds)
+
+def _slow_call(seconds):
+    return om.OMApplication(om.OMSymbol('spin', 'test'), [om.OMFloat(seconds)])
+
+class TestExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = IsolatedProcessExecutor(2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_result(self):
+        self.assertEqual(self.executor.submit(spin, 0).result(), 'done')
+        self.assertNotEqual(self.executor.submit(os.getpid).result(), os.getpid())
+        with self.assertRaises(ZeroDivisionError):
+            self.executor.submit(divmod, 1, 0).result()
+        with self.assertRaises(WorkerDied):
+            self.executor.submit(os._exit, 3).result()
+
+    def test_kill(self):
+        fut = self.executor.submit(spin, 60)
+        time.sleep(0.5)
+        self.assertTrue(fut.running())
+        start = time.time()
+        fut.kill()
+        with self.assertRaises(CallTerminated):
+            fut.result(10)
+        self.assertLess(time.time() - start, 10)
+
+class TestTerminate(unittest.TestCase):
+    workers = None
+
+    def setUp(self):
+        self.server = Server(port=0, workers=self.workers)
+        self.server.RequestHandlerClass = SlowRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+        self.client = SCSCPCLI('localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        self.client.quit()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+        if self.workers is not None:
+            self.workers.shutdown()
+
+    def test_running(self):
+        start = time.time()
+        call = self.client.call(_slow_call(60))
+        time.sleep(0.5)
+        self.client.terminate(call.id)
+        resp = self.client.wait()
+        self.assertEqual(resp.id, call.id)
+        self.assertEqual(resp.type, 'procedure_terminated')
+        self.assertLess(time.time() - start, 10)
+        # the session goes on
+        self.assertEqual(self.client.heads.arith1.plus([1, 2]), 3)
+
+    def test_queued(self):
+        first = self.client.call(_slow_call(1))
+        second = self.client.call(_slow_call(60))
+        self.client.terminate(second.id)
+        resps = dict((r.id, r.type) for r in (self.client.wait(), self.client.wait()))
+        self.assertEqual(resps, {first.id: 'procedure_completed',
+                                 second.id: 'procedure_terminated'})
+
+    def test_unknown(self):
+        self.client.terminate('unknown')
+        self.assertEqual(self.client.heads.arith1.plus([1, 2]), 3)
+
+class TestTerminateWorker(TestTerminate):
+    def setUp(self):
+        self.workers = IsolatedProcessExecutor(2)
+        super(TestTerminateWorker, self).setUp()
+
+class TestAsyncTerminate(unittest.TestCase):
+    def test_running(self):
+        async def go():
+            server = AsyncSCSCPSocketServer(port=0, RequestHandlerClass=SlowRequestHandler)
+            await server.start()
+            client = await AsyncSCSCPClient.open('localhost', server.server_address[1])
+            fut = client.submit(_slow_call(60), id='slow')
+            await client.drain()
+            await asyncio.sleep(0.5)
+            client.terminate('slow')
+            resp = await asyncio.wait_for(fut, 10)
+            plus = await client.call(om.OMApplication(om.OMSymbol('plus', 'arith1'),
+                                                      [om.OMInteger(1), om.OMInteger(2)]))
+            await client.close()
+            await asyncio.sleep(0.1)
+            await server.close()
+            return resp, plus
+
+        resp, plus = asyncio.run(go())
+        self.assertEqual(resp.type, 'procedure_terminated')
+        self.assertEqual(plus.data, om.OMInteger(3))
@@ -0,0 +1,100 @@
+import unittest
+import asyncio
+import os
+import shutil
+import tempfile
+from threading import Thread
+
+from openmath import openmath as om
+
+from scscp.aio import AsyncSCSCPClient, AsyncSCSCPSocketServer
+from scscp.cli import SCSCPCLI
+from scscp.inprocess import InProcessServer, MemorySocket
+from scscp.admission import Admission
+from scscp.scscp import SCSCPQuit
+from examples.demo_server import Server, DemoServerRequestHandler
+
+class TestUnixSocket(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'scscp.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_sync(self):
+        server = Server(path=self.path)
+        server_t = Thread(target=server.serve_forever)
+        server_t.start()
+        try:
+            client = SCSCPCLI(path=self.path)
+            self.assertEqual(client.heads.arith1.plus([1, 2]), 3)
+            # references to stored objects
+            p = client.heads.arith1.power([2, 100], cookie=True)
+            self.assertEqual(client.heads.arith1.plus([p, 1]), 2 ** 100 + 1)
+            self.assertEqual(p.retrieve(), 2 ** 100)
+            client.quit()
+        finally:
+            server.shutdown()
+            server.server_close()
+            server_t.join()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_no_address(self):
+        with self.assertRaises(ValueError):
+            SCSCPCLI()
+
+    def test_async(self):
+        async def go():
+            server = AsyncSCSCPSocketServer(path=self.path, RequestHandlerClass=DemoServerRequestHandler)
+            await server.start()
+            self.assertEqual(server.server_address, self.path)
+            client = await AsyncSCSCPClient.open(path=self.path)
+            resp = await client.call(om.OMApplication(om.OMSymbol('plus', 'arith1'),
+                                                      [om.OMInteger(1), om.OMInteger(2)]))
+            await client.close()
+            await server.close()
+            return resp
+
+        self.assertEqual(asyncio.run(go()).data, om.OMInteger(3))
+        self.assertFalse(os.path.exists(self.path))
+
+class TestMemorySocket(unittest.TestCase):
+    def test_stream(self):
+        a, b = MemorySocket.pair()
+        a.sendall(b'hello ')
+        a.sendall(b'world')
+        self.assertFalse(a.wait_readable(0))
+        self.assertTrue(b.wait_readable(0))
+        self.assertEqual(b.recv(8), b'hello wo')
+        self.assertEqual(b.recv(8), b'rld')
+        a.close()
+        self.assertEqual(b.recv(8), b'')
+        with self.assertRaises(BrokenPipeError):
+            b.sendall(b'lost')
+
+class TestInProcess(unittest.TestCase):
+    def setUp(self):
+        self.server = InProcessServer(RequestHandlerClass=DemoServerRequestHandler,
+                                      admission=Admission(max_connections=2))
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_calls(self):
+        client = SCSCPCLI(sock=self.server.connect())
+        self.assertEqual(client.service_info['service_name'], b'InProcessServer')
+        self.assertEqual(client.heads.arith1.plus([1, 2]), 3)
+        self.assertEqual(client.heads.arith1.power([2, 100]), 2 ** 100)
+        p = client.heads.arith1.power([2, 100], cookie=True)
+        self.assertEqual(p.retrieve(), 2 ** 100)
+        client.quit()
+
+    def test_close(self):
+        clients = [SCSCPCLI(sock=self.server.connect()) for i in range(2)]
+        with self.assertRaises(SCSCPQuit):
+            SCSCPCLI(sock=self.server.connect())
+        self.server.drain()
+        for client in clients:
+            with self.assertRaises(SCSCPQuit):
+                client.wait()
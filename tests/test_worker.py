@@ -0,0 +1,51 @@
+import unittest
+import os
+from threading import Thread
+
+from openmath import openmath as om, convert as conv
+
+from scscp.cli import SCSCPCLI
+from scscp import scscp
+from examples.demo_server import Server, DemoServerRequestHandler
+
+class PidRequestHandler(DemoServerRequestHandler):
+    def handle_call(self, call, head):
+        if call.data.elem.cd == 'test' and head == 'getpid':
+            return conv.to_openmath(os.getpid())
+        if call.data.elem.cd == 'test' and head == 'message':
+            return scscp.SCSCPProcedureMessage.completed(call.id, om.OMString('message'), runtime=1)
+        if call.data.elem.cd == 'test':
+            raise scscp.SCSCPUnknownHead
+        return super(PidRequestHandler, self).handle_call(call, head)
+
+class TestWorkers(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(port=0, workers=2)
+        self.server.RequestHandlerClass = PidRequestHandler
+        self.server_t = Thread(target=self.server.serve_forever)
+        self.server_t.daemon = True
+        self.server_t.start()
+        self.client = SCSCPCLI('localhost', self.server.server_address[1])
+
+    def tearDown(self):
+        self.client.quit()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_t.join()
+
+    def test_arith(self):
+        self.assertEqual(self.client.heads.arith1.power([2, 100]), 2**100)
+        self.assertEqual(self.client.get_description(), ["DemoServer", "none", "Demo SCSCP server"])
+
+    def test_process(self):
+        self.assertNotEqual(self.client.heads.test.getpid([]), os.getpid())
+
+    def test_message(self):
+        resp = self.client._call_wait(om.OMApplication(om.OMSymbol('message', 'test'), []))
+        self.assertEqual(resp.type, 'procedure_completed')
+        self.assertEqual(resp.data, om.OMString('message'))
+        self.assertEqual(resp.params, [(om.OMSymbol('info_runtime', 'scscp1'), om.OMInteger(1))])
+
+    def test_unknown(self):
+        with self.assertRaises(scscp.SCSCPProtocolError):
+            self.client.heads.test.unknown([])